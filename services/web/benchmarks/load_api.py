@@ -0,0 +1,267 @@
+"""
+LOAD TEST : Runs concurrent clients against the api and reports requests/sec, latency percentiles and database
+queries per request for every endpoint as json. Only the standard library is used, so it can be run from any machine:
+
+    python -m benchmarks.load_api --url http://localhost --user admin --password secret --job 1 --clients 32
+
+With --local, a self-contained api with a seeded database is started (benchmarks/local_stack.py), no docker or gpu
+is needed. Options after -- are passed to the stack, e.g. the number of gunicorn workers:
+
+    python -m benchmarks.load_api --local --clients 32 -- --workers 4 --jobs 500
+
+The database queries are read from the prometheus metrics of the api (project/metrics.py) before and after every
+scenario, they are missing if /metrics cannot be reached (e.g. through nginx, use --metrics-url).
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# scenarios: method and path, {job} is replaced by a random job id of the given ones
+SCENARIOS = {
+    "feed": ("GET", "/api/v1/posts/"),
+    "tags": ("GET", "/api/v1/posts/tags"),
+    "jobs": ("GET", "/api/v1/jobs/"),
+    "status": ("GET", "/api/v1/jobs/{job}/status"),
+    "upload": ("POST", "/api/v1/jobs/"),
+    "download": ("GET", "/api/v1/results/{job}/bvh"),
+    "download_person": ("GET", "/api/v1/results/{job}/bvh/1"),
+    "tracks": ("GET", "/api/v1/results/{job}/tracks"),
+    "render_html": ("GET", "/api/v1/results/{job}/render_html"),
+}
+
+
+def percentile(values, p):
+    """
+    get a percentile of a list of values (nearest rank)
+    :param values: list of numbers
+    :param p: percentile between 0 and 100
+    :return: the percentile or None if there are no values
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(math.ceil(p / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, errors, duration):
+    """
+    summarize the measurements of one endpoint
+    :param latencies: latencies of all requests in seconds
+    :param errors: number of failed requests
+    :param duration: duration of the measurement in seconds
+    :return: dictionary with requests/sec and latency percentiles in milliseconds
+    """
+    def ms(value):
+        return None if value is None else round(value * 1000, 2)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / duration, 2) if duration > 0 else None,
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p90_ms": ms(percentile(latencies, 90)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(max(latencies)) if latencies else None,
+    }
+
+
+def http_request(url, headers, timeout=60, method="GET", data=None):
+    """
+    perform a request and read the whole body
+    :return: status code
+    """
+    req = urllib.request.Request(url, headers=headers, method=method, data=data)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def run_scenario(request, clients, duration):
+    """
+    run a request function with concurrent clients for some time
+    :param request: function without arguments returning True if the request succeeded
+    :param clients: number of concurrent clients
+    :param duration: duration in seconds
+    :return: summary of the measurement
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    end = time.perf_counter() + duration
+
+    def client():
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            try:
+                ok = request()
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors[0] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        for _ in range(clients):
+            executor.submit(client)
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+def upload_body(video):
+    """
+    multipart form of a job upload. A random suffix makes every video unique, so the content store cannot skip it.
+    :param video: video bytes
+    :return: body and content type
+    """
+    boundary = uuid.uuid4().hex
+    parts = [("--%s\r\nContent-Disposition: form-data; name=\"name\"\r\n\r\nLoad test\r\n" % boundary).encode(),
+             ("--%s\r\nContent-Disposition: form-data; name=\"video\"; filename=\"video.mp4\"\r\n"
+              "Content-Type: video/mp4\r\n\r\n" % boundary).encode(),
+             video, os.urandom(16), ("\r\n--%s--\r\n" % boundary).encode()]
+    return b"".join(parts), "multipart/form-data; boundary=%s" % boundary
+
+
+def db_query_totals(metrics_url):
+    """
+    read the database queries of the api from its prometheus metrics, requests of /metrics itself are ignored
+    :return: dictionary with the number of requests, queries and the query time, or None if not available
+    """
+    try:
+        with urllib.request.urlopen(metrics_url, timeout=10) as response:
+            text = response.read().decode()
+    except (urllib.error.URLError, OSError):
+        return None
+    totals = {"requests": 0.0, "queries": 0.0, "seconds": 0.0}
+    for line in text.splitlines():
+        if 'endpoint="/metrics"' in line:
+            continue
+        for prefix, key in [("http_request_db_queries_count", "requests"), ("http_request_db_queries_sum", "queries"),
+                            ("http_request_db_seconds_sum", "seconds")]:
+            if line.startswith(prefix + "{"):
+                totals[key] += float(line.rsplit(" ", 1)[1])
+    return totals
+
+
+def db_summary(before, after):
+    """
+    :return: database queries and query time per request between two readings of db_query_totals
+    """
+    if before is None or after is None or after["requests"] <= before["requests"]:
+        return {}
+    requests = after["requests"] - before["requests"]
+    return {"db_queries_per_request": round((after["queries"] - before["queries"]) / requests, 2),
+            "db_ms_per_request": round((after["seconds"] - before["seconds"]) / requests * 1000, 2)}
+
+
+def start_local_stack(stack_args):
+    """
+    start benchmarks/local_stack.py and wait until the api answers
+    :param stack_args: command line options of the stack
+    :return: process and the description of the stack (url, user, password, jobs)
+    """
+    process = subprocess.Popen([sys.executable, "-m", "benchmarks.local_stack"] + stack_args,
+                               stdout=subprocess.PIPE, universal_newlines=True)
+    stack = None
+    for line in process.stdout:
+        if line.startswith("{"):
+            stack = json.loads(line)
+            break
+    if stack is None:
+        sys.exit("The local stack did not start")
+    # keep reading the log of the stack, so it does not block on a full pipe
+    threading.Thread(target=process.stdout.read, daemon=True).start()
+    for _ in range(600):
+        try:
+            http_request(stack["url"] + "/api/v1/status/", {}, timeout=1)
+            return process, stack
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.1)
+    process.terminate()
+    sys.exit("The local stack does not answer")
+
+
+def auth_headers(user, password):
+    """
+    :return: http basic authentication header
+    """
+    if user is None:
+        return {}
+    token = base64.b64encode(("%s:%s" % (user, password)).encode()).decode()
+    return {"Authorization": "Basic %s" % token}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the multipose api")
+    parser.add_argument("--url", default="http://localhost")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    parser.add_argument("--job", type=int, action="append",
+                        help="id of a finished job used for status and downloads, can be given multiple times")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per scenario")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS.keys()),
+                        help="scenarios to run (default: all)")
+    parser.add_argument("--video", help="mp4 file for the upload scenario (default: 1 MB of random bytes)")
+    parser.add_argument("--metrics-url", help="prometheus metrics of the api (default: <url>/metrics)")
+    parser.add_argument("--local", action="store_true", help="start benchmarks/local_stack.py and test it")
+    parser.add_argument("stack_args", nargs="*", help="options of the local stack (after --)")
+    args = parser.parse_args()
+
+    process = None
+    if args.local:
+        process, stack = start_local_stack(args.stack_args)
+        args.url, args.user, args.password = stack["url"], stack["user"], stack["password"]
+        args.job = args.job or stack["jobs"]
+    job_ids = args.job or [1]
+    video = os.urandom(1024 * 1024)
+    if args.video:
+        with open(args.video, "rb") as file:
+            video = file.read()
+    metrics_url = args.metrics_url or args.url.rstrip("/") + "/metrics"
+    headers = auth_headers(args.user, args.password)
+
+    def request(method, path):
+        def send():
+            url = args.url.rstrip("/") + path.format(job=random.choice(job_ids))
+            if method == "POST":
+                body, content_type = upload_body(video)
+                return http_request(url, dict(headers, **{"Content-Type": content_type}), method=method,
+                                    data=body) < 400
+            return http_request(url, headers) < 400
+        return send
+
+    report = {"url": args.url, "clients": args.clients, "duration": args.duration, "endpoints": {}}
+    try:
+        for name in args.scenario or sorted(SCENARIOS.keys()):
+            before = db_query_totals(metrics_url)
+            report["endpoints"][name] = run_scenario(request(*SCENARIOS[name]), args.clients, args.duration)
+            report["endpoints"][name].update(db_summary(before, db_query_totals(metrics_url)))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+            if stack["temporary"]:
+                shutil.rmtree(stack["dir"], ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
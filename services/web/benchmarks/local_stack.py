@@ -0,0 +1,218 @@
+"""
+LOCAL STACK : Runs the api without docker and without a gpu for load tests (benchmarks/load_api.py).
+The database is sqlite (or any DATABASE_URL, e.g. a local postgres), redis is replaced by fakeredis (or a local redis)
+and xnect by a stub of its http api, which returns canned synthetic outputs. The database and the cache dir are seeded
+with users and finished public jobs with bvh files:
+
+    python -m benchmarks.local_stack --port 5001 --jobs 200 --workers 4
+
+When the stack is ready, one json line with the url, the credentials, the seeded job ids and the environment of the
+stack is printed to stdout. Uploaded videos are only queued. To convert them, run the stack with a real redis and
+start a worker with the printed environment, it sends the videos to the xnect stub:
+
+    python -m benchmarks.local_stack --redis-url redis://localhost:6379/0
+    env <printed environment> python3 manage.py run_worker --stage ingest --stage inference
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from benchmarks.synthetic import write_xnect_files
+
+PASSWORD = "loadtest"
+TAGS = ["dance", "sports", "walking", "running", "yoga", "climbing", "football", "tennis", "martial arts", "ballet"]
+# joints of the seeded bvh files, like the exported muco 3dhp skeleton
+BVH_JOINTS = 20
+
+
+def start_xnect_stub(port, outputs, delay=0.0):
+    """
+    serve the routes of the xnect api (services/xnect/src/xnect.py) with canned outputs in a background thread
+    :param port: http port
+    :param outputs: text outputs by name (raw2d, raw3d, ik3d)
+    :param delay: seconds the analysis of a posted video takes
+    :return: http server
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def reply(self, code, body, content_type="application/json"):
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(delay)
+            self.reply(200, json.dumps({"message": "success"}).encode())
+
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            if len(parts) == 1:
+                self.reply(200, json.dumps({"status": True}).encode())
+            elif len(parts) == 2 and parts[1] in outputs:
+                self.reply(200, outputs[parts[1]], "text/plain")
+            else:
+                self.reply(404, json.dumps({"message": "not found"}).encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bvh_text(frames, fps, rng):
+    """
+    :return: bvh file with a chain of joints and random motion, about the size of an exported file
+    """
+    lines = ["HIERARCHY", "ROOT Hips", "{", "OFFSET 0 0 0",
+             "CHANNELS 6 Xposition Yposition Zposition Zrotation Xrotation Yrotation"]
+    for i in range(BVH_JOINTS):
+        lines += ["JOINT Joint%d" % i, "{", "OFFSET 0 10 0", "CHANNELS 3 Zrotation Xrotation Yrotation"]
+    lines += ["End Site", "{", "OFFSET 0 10 0", "}"] + ["}"] * (BVH_JOINTS + 1)
+    lines += ["MOTION", "Frames: %d" % frames, "Frame Time: %f" % (1.0 / fps)]
+    lines += [" ".join("%.6f" % value for value in rng.uniform(-90, 90, 6 + 3 * BVH_JOINTS)) for _ in range(frames)]
+    return "\n".join(lines) + "\n"
+
+
+def write_results(job_id, people, frames, fps, rng):
+    """
+    write the result files of a finished job: one bvh file per person and the track offsets
+    """
+    from project import checkpoints
+    from project.config import Config
+    result_dir = os.path.join(Config.CACHE_DIR, str(job_id), Config.RESULT_DIR)
+    os.makedirs(result_dir, exist_ok=True)
+    for i in range(people):
+        with open(os.path.join(result_dir, Config.OUTPUT_BVH_FILE_RAW_NUMBERED % (i + 1)), "w") as file:
+            file.write(bvh_text(frames, fps, rng))
+    checkpoints.write_json(os.path.join(result_dir, Config.TRACKS_FILE), [
+        {"person": i + 1, "start_frame": 0, "end_frame": frames - 1, "start_time": 0.0, "duration": frames / fps}
+        for i in range(people)])
+
+
+def seed(num_users, num_jobs, people, frames, fps):
+    """
+    create the tables, users and finished public jobs
+    :return: ids of the seeded jobs
+    """
+    from project.model import model
+    rng = random.Random(0)
+    np_rng = np.random.RandomState(0)
+    model.db.create_all()
+    users = [model.add_user("loadtest%d" % i, PASSWORD) for i in range(num_users)]
+    job_ids = []
+    for i in range(num_jobs):
+        job = model.add_job(user_id=users[i % num_users].id, name="Load test %d" % i, tags=rng.sample(TAGS, 2))
+        job.video_uploaded = True
+        job.public = True
+        result = model.get_result_by_id(job.id)
+        result.result_code = model.ResultCode.success
+        result.max_people = people
+        model.db.session.commit()
+        write_results(job.id, people, frames, fps, np_rng)
+        job_ids.append(job.id)
+    return job_ids
+
+
+def use_fakeredis():
+    """
+    let redis.from_url return connections to one in-memory fakeredis server (before the app is imported)
+    """
+    try:
+        import fakeredis
+    except ImportError:
+        sys.exit("fakeredis is not installed (pip install fakeredis), or use --redis-url")
+    import redis
+    server = fakeredis.FakeServer()
+    redis.from_url = lambda url, **kwargs: fakeredis.FakeStrictRedis(server=server)
+
+
+def serve(app, host, port, workers, threads):
+    """
+    serve the app with the werkzeug server (one worker) or with gunicorn like in production
+    """
+    if workers <= 1:
+        from werkzeug.serving import run_simple
+        run_simple(host, port, app, threaded=True, use_reloader=False)
+        return
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in {"bind": "%s:%d" % (host, port), "workers": workers, "threads": threads,
+                               "worker_class": "gthread", "timeout": 300}.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Server().run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Api with sqlite, fakeredis and an xnect stub for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn worker processes (1: werkzeug server)")
+    parser.add_argument("--threads", type=int, default=4, help="threads per gunicorn worker")
+    parser.add_argument("--dir", help="directory of the database and the cache (default: temporary)")
+    parser.add_argument("--database-url", help="database instead of sqlite, e.g. postgresql://user:pw@localhost/db")
+    parser.add_argument("--redis-url", help="redis instead of fakeredis, e.g. redis://localhost:6379/0")
+    parser.add_argument("--xnect-port", type=int, default=8081)
+    parser.add_argument("--xnect-delay", type=float, default=1.0, help="seconds the stub needs per video")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--jobs", type=int, default=100)
+    parser.add_argument("--people", type=int, default=2)
+    parser.add_argument("--frames", type=int, default=900, help="frames of the seeded bvh files")
+    parser.add_argument("--fps", type=float, default=30.0)
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix="multipose-loadtest-")
+    env = {
+        "APP_SETTINGS": "project.config.Config",
+        "SECRET_KEY": os.getenv("SECRET_KEY", "loadtest"),
+        "DATABASE_URL": args.database_url or "sqlite:///%s" % os.path.join(directory, "loadtest.db"),
+        "CACHE_DIR": os.path.join(directory, "cache"),
+        "XNECT_URL": "http://127.0.0.1:%d" % args.xnect_port,
+        # the db queries per request are read from /metrics, also with several gunicorn workers
+        "prometheus_multiproc_dir": os.path.join(directory, "metrics"),
+    }
+    if args.redis_url:
+        env["REDIS_URL"] = args.redis_url
+    for path in [env["CACHE_DIR"], env["prometheus_multiproc_dir"]]:
+        os.makedirs(path, exist_ok=True)
+    os.environ.update(env)
+    if not args.redis_url:
+        use_fakeredis()
+
+    xnect_dir = os.path.join(directory, "xnect")
+    outputs = {}
+    for name, path in write_xnect_files(xnect_dir, args.frames, args.people).items():
+        with open(path, "rb") as file:
+            outputs[name] = file.read()
+    start_xnect_stub(args.xnect_port, outputs, args.xnect_delay)
+
+    from project.app import app
+    from project.model import model
+    with app.app_context():
+        job_ids = seed(args.users, args.jobs, args.people, args.frames, args.fps)
+        # the gunicorn workers open their own connections
+        model.db.engine.dispose()
+    print(json.dumps({"url": "http://%s:%d" % (args.host, args.port), "user": "loadtest0", "password": PASSWORD,
+                      "jobs": job_ids, "dir": directory, "temporary": args.dir is None, "env": env}), flush=True)
+    serve(app, args.host, args.port, args.workers, args.threads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+BENCHMARK : Run time, throughput and peak memory of the post-processing of the raw xnect outputs, measured with
+synthetic data (benchmarks/synthetic.py), so neither xnect nor a gpu is needed. The report is printed as json:
+
+    python -m benchmarks.pipeline --frames 3000 --people 3 --dropout 0.05 --swap-rate 0.01
+    python -m benchmarks.pipeline --output baseline.json
+    python -m benchmarks.pipeline --baseline baseline.json --tolerance 0.2
+
+- convert_txt: text outputs to archives (project/pose_store.py)
+- load_predictions, find_first_complete_keyframe, sort, outlier_map, xnect_to_bvh: person sorting of older versions
+- tracking: online tracker of the export stage (project/tracking.py)
+- bvh_export: bvh files of the tracks
+- export_end_to_end: text outputs to bvh files like the export stage, including the tracking checkpoint
+The peak memory is measured with tracemalloc in a separate run, so it does not slow down the timed runs.
+With --baseline, steps that are slower than in the baseline report by more than the tolerance are listed as
+regressions and the exit code is 1.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.synthetic import write_xnect_files
+from project import conversion_task, pose_store, tracking
+from project.config import Config
+
+
+def measure(func, setup=None, repeat=3):
+    """
+    measure a function, the setup is run before every call and is not measured
+    :param func: function to measure, called with the outputs of setup
+    :param setup: function returning the arguments of func
+    :param repeat: number of timed runs
+    :return: result of the last run, best run time in seconds and peak memory in bytes
+    """
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - start)
+    args = setup() if setup else ()
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, min(times), peak
+
+
+def new_manager():
+    """
+    :return: TrackManager with the configuration of the export stage
+    """
+    return tracking.TrackManager(Config.TRACK_MAX_DISTANCE, Config.TRACK_MAX_MISSED, Config.TRACK_MIN_LENGTH,
+                                 Config.TRACK_OUTLIER_FACTOR, Config.TRACK_MAX_OUTLIERS)
+
+
+def export_tracks(tracks, directory, fps):
+    """
+    export one bvh file per track
+    :param tracks: tracks of load_tracking
+    :param directory: output directory
+    :param fps: frame rate
+    """
+    skel = conversion_task.muco_skeleton()
+    for i, track in enumerate(tracks):
+        output_file = directory / (Config.OUTPUT_BVH_FILE_RAW_NUMBERED % (i + 1))
+        skel.poses2bvh(track["poses"] * 0.01, output_file=str(output_file), frame_rate=fps)
+
+
+def export_end_to_end(txt_paths, directory, fps):
+    """
+    text outputs to bvh files like the export stage
+    :return: number of tracks
+    """
+    paths = {}
+    for name, txt_path in txt_paths.items():
+        paths[name] = str(directory / ("%s.npz" % name))
+        pose_store.convert_txt(txt_path, paths[name])
+    conversion_task.save_tracking(directory, tracking.track_archive(pose_store.PoseArchive(paths["ik3d"]),
+                                                                    new_manager()))
+    tracks = conversion_task.load_tracking(directory)
+    export_tracks(tracks, directory, fps)
+    return len(tracks)
+
+
+def compare(report, baseline, tolerance):
+    """
+    :return: steps that are slower than in the baseline by more than the tolerance
+    """
+    regressions = {}
+    for step, result in report["steps"].items():
+        before = baseline["steps"].get(step)
+        if before and result["seconds"] > before["seconds"] * (1 + tolerance):
+            regressions[step] = {"seconds": result["seconds"], "baseline_seconds": before["seconds"],
+                                 "slowdown": round(result["seconds"] / before["seconds"], 2)}
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the post-processing of the raw xnect outputs")
+    parser.add_argument("--frames", type=int, default=3000)
+    parser.add_argument("--people", type=int, default=3)
+    parser.add_argument("--dropout", type=float, default=0.0, help="probability of a missed detection")
+    parser.add_argument("--swap-rate", type=float, default=0.0, help="probability of an identity swap per frame")
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy", action="store_true", help="skip the slow person sorting of older versions")
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--baseline", help="report of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown compared to the baseline")
+    args = parser.parse_args()
+
+    report = {"frames": args.frames, "people": args.people, "dropout": args.dropout, "swap_rate": args.swap_rate,
+              "steps": {}}
+
+    def add(step, measurement, frames=args.frames):
+        result, seconds, peak = measurement
+        report["steps"][step] = {"seconds": round(seconds, 6), "frames_per_s": round(frames / seconds, 1),
+                                 "peak_bytes": peak}
+        return result
+
+    # the steps log to stdout, the report is the only output on stdout
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(sys.stderr):
+        directory = Path(tmp)
+        txt_paths = write_xnect_files(directory / "txt", args.frames, args.people, args.seed, args.dropout,
+                                      args.swap_rate)
+        paths = {name: str(directory / ("%s.npz" % name)) for name in txt_paths}
+        add("convert_txt", measure(lambda: [pose_store.convert_txt(txt_paths[name], paths[name]) for name in paths],
+                                   repeat=args.repeat))
+        sources = (paths["raw2d"], paths["raw3d"], paths["ik3d"])
+
+        if not args.skip_legacy:
+            def load():
+                return conversion_task.load_xnect_predictions(*sources)
+            add("load_predictions", measure(load, repeat=args.repeat))
+            add("find_first_complete_keyframe", measure(conversion_task.find_first_complete_keyframe, load,
+                                                        args.repeat))
+
+            def sort(pred, num_people):
+                conversion_task.sort(1, len(pred), pred, False)
+                conversion_task.sort(len(pred) - 2, 0, pred, True)
+            add("sort", measure(sort, load, args.repeat))
+            add("outlier_map", measure(lambda pred, num_people: conversion_task.outlier_map(pred, num_people, 3),
+                                       load, args.repeat))
+            add("xnect_to_bvh", measure(lambda: conversion_task.xnect_to_bvh(*sources), repeat=args.repeat))
+
+        tracks = add("tracking", measure(lambda: tracking.track_archive(pose_store.PoseArchive(paths["ik3d"]),
+                                                                        new_manager()), repeat=args.repeat))
+        report["tracks"] = len(tracks)
+        tracking_dir = directory / "tracking"
+        os.makedirs(tracking_dir)
+        conversion_task.save_tracking(tracking_dir, tracks)
+        add("bvh_export", measure(lambda: export_tracks(conversion_task.load_tracking(tracking_dir), tracking_dir,
+                                                        args.fps), repeat=args.repeat))
+        export_dir = directory / "export"
+        os.makedirs(export_dir)
+        add("export_end_to_end", measure(lambda: export_end_to_end(txt_paths, export_dir, args.fps),
+                                         repeat=args.repeat))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            report["regressions"] = compare(report, json.load(file), args.tolerance)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+BENCHMARK : Size and load time of the raw xnect outputs as text files compared to the archives
+(project/pose_store.py), with and without zip compression. The report is printed as json:
+
+    python -m benchmarks.pose_storage --frames 9000 --people 3
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import write_xnect_files
+from project import pose_store
+
+
+def best_time(func, repeat):
+    """
+    :return: best run time of a function in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the compressed raw xnect outputs")
+    parser.add_argument("--frames", type=int, default=3000)
+    parser.add_argument("--people", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    report = {"frames": args.frames, "people": args.people, "files": {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, txt_path in write_xnect_files(directory, args.frames, args.people).items():
+            txt_time = best_time(lambda: np.loadtxt(txt_path, ndmin=2), args.repeat)
+            report["files"][name] = {"txt_bytes": os.path.getsize(txt_path), "txt_load_s": round(txt_time, 4)}
+            for compress in [False, True]:
+                npz_path = os.path.join(directory, "%s_%d.npz" % (name, compress))
+                pose_store.convert_txt(txt_path, npz_path, compress)
+                npz_time = best_time(lambda: pose_store.load_rows(npz_path), args.repeat)
+                archive = pose_store.PoseArchive(npz_path)
+                frame_time = best_time(lambda: archive.frame(archive.num_frames // 2), args.repeat)
+                error = np.abs(np.loadtxt(txt_path, ndmin=2) - pose_store.load_rows(npz_path))
+                report["files"][name]["compressed" if compress else "npz"] = {
+                    "bytes": os.path.getsize(npz_path),
+                    "size_reduction": round(os.path.getsize(txt_path) / float(os.path.getsize(npz_path)), 2),
+                    "load_s": round(npz_time, 4),
+                    "load_speedup": round(txt_time / npz_time, 2),
+                    "frame_access_us": round(frame_time * 1e6, 2),
+                    "max_abs_error": float(np.max(error)),
+                }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+BENCHMARK : Trade-off of the quality tiers (Config.QUALITY_TIERS, project/transcoding.py) between the cost of the
+pose estimation and the joint error. The report is printed as json:
+
+    python -m benchmarks.quality_tiers --width 3840 --height 2160 --fps 60
+    python -m benchmarks.quality_tiers --video 4k.mp4
+    python -m benchmarks.quality_tiers --reference full/ik3d.npz --candidate fast/ik3d.npz --step 4
+
+- pixel_rate: analysed pixels per second of video relative to the source, xnect scales roughly linearly with it
+- temporal_error_mm: mean joint error of synthetic poses, if the dropped frames are interpolated by the bvh player
+- with --video, the video is transcoded for every tier and the transcoding and decoding times are measured
+- with --reference and --candidate, the joint error between the ik3d outputs of two real jobs is measured
+"""
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import JOINTS_3D, generate
+from project import pose_store, transcoding
+from project.config import Config
+
+
+def poses(rows, frames, people):
+    """
+    :return: poses (frames x people x joints x 3) of generated rows
+    """
+    return rows[:, 2:].reshape([frames, people, JOINTS_3D, 3])
+
+
+def temporal_error(ik3d, step):
+    """
+    mean joint error if only every step-th frame is kept and the others are interpolated linearly
+    :param ik3d: poses (frames x people x joints x 3)
+    :param step: frame step
+    :return: error in the unit of the poses
+    """
+    if step == 1:
+        return 0.0
+    frames = np.arange(len(ik3d))
+    kept = frames[::step]
+    flat = ik3d.reshape([len(ik3d), -1])
+    interpolated = np.stack([np.interp(frames, kept, flat[kept, i]) for i in range(flat.shape[1])], axis=1)
+    distances = np.linalg.norm((interpolated - flat).reshape(ik3d.shape), axis=-1)
+    return float(np.mean(distances))
+
+
+def video_info(path):
+    """
+    :return: width, height and frame rate of a video
+    """
+    import skvideo.io
+    reader = skvideo.io.FFmpegReader(path)
+    reader.close()
+    return reader.inputwidth, reader.inputheight, reader.inputfps
+
+
+def decode_time(path):
+    """
+    :return: time in seconds to decode all frames of a video with ffmpeg
+    """
+    start = time.perf_counter()
+    subprocess.run(["ffmpeg", "-v", "error", "-i", path, "-f", "null", "-"], check=True)
+    return time.perf_counter() - start
+
+
+def compare_outputs(reference, candidate, step):
+    """
+    joint error between the ik3d outputs of the same video analysed at two quality tiers
+    :param reference: ik3d output (.npz) of the reference tier
+    :param candidate: ik3d output of the candidate tier
+    :param step: frame step of the candidate tier relative to the reference tier
+    :return: mean and 90th percentile of the joint error in mm and the number of compared poses
+    """
+    reference, candidate = pose_store.PoseArchive(reference), pose_store.PoseArchive(candidate)
+    distances = []
+    for idx in range(candidate.num_frames):
+        people, values = candidate.frame(idx)
+        ref_people, ref_values = reference.frame(idx * step)
+        for person, value in zip(people, values):
+            match = np.nonzero(ref_people == person)[0]
+            if len(match):
+                diff = (value - ref_values[match[0]]).reshape([JOINTS_3D, 3])
+                distances.append(np.linalg.norm(diff, axis=1))
+    if not distances:
+        return {"poses": 0}
+    distances = np.concatenate(distances)
+    return {"poses": len(distances) // JOINTS_3D, "mean_mm": round(float(np.mean(distances)), 2),
+            "p90_mm": round(float(np.percentile(distances, 90)), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the quality tiers")
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--fps", type=float, default=60)
+    parser.add_argument("--frames", type=int, default=1800, help="frames of the synthetic poses")
+    parser.add_argument("--people", type=int, default=2)
+    parser.add_argument("--video", help="video that is transcoded for every tier")
+    parser.add_argument("--reference", help="ik3d output of a job with the reference tier")
+    parser.add_argument("--candidate", help="ik3d output of the same video with another tier")
+    parser.add_argument("--step", type=int, default=1, help="frame step of the candidate relative to the reference")
+    args = parser.parse_args()
+
+    if args.reference and args.candidate:
+        print(json.dumps(compare_outputs(args.reference, args.candidate, args.step), indent=2))
+        return
+    if args.video:
+        args.width, args.height, args.fps = video_info(args.video)
+    ik3d = poses(generate(args.frames, args.people)[2], args.frames, args.people)
+    report = {"source": {"width": args.width, "height": args.height, "fps": args.fps}, "tiers": {}}
+    with tempfile.TemporaryDirectory() as directory:
+        if args.video:
+            report["source"]["decode_s"] = round(decode_time(args.video), 3)
+        for quality in Config.QUALITY_TIERS:
+            video_format = transcoding.target_format(args.width, args.height, args.fps, quality) or \
+                {"width": args.width, "height": args.height, "fps": args.fps, "step": 1}
+            pixel_rate = video_format["width"] * video_format["height"] * video_format["fps"] / \
+                float(args.width * args.height * args.fps)
+            tier = {"width": video_format["width"], "height": video_format["height"],
+                    "fps": round(video_format["fps"], 3), "pixel_rate": round(pixel_rate, 4),
+                    "temporal_error_mm": round(temporal_error(ik3d, video_format["step"]), 3)}
+            if args.video and "quality" in video_format:
+                target = os.path.join(directory, "%s.mp4" % quality)
+                start = time.perf_counter()
+                transcoding.transcode(args.video, target, video_format)
+                tier["transcode_s"] = round(time.perf_counter() - start, 3)
+                tier["decode_s"] = round(decode_time(target), 3)
+                tier["bytes"] = os.path.getsize(target)
+            report["tiers"][quality] = tier
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+BENCHMARK : End-to-end time of the inference of a long video split into segments (project/segments.py), from the
+first segment sent to xnect until the stitched outputs are saved. Xnect is simulated: it analyses up to --slots
+segments at the same time and needs --ms-per-frame per frame and segment, the outputs are synthetic
+(benchmarks/synthetic.py) and stitched with the code of the pipeline. The plan of conversion_task.plan_segments
+(one segment per slot) is compared with the whole video in one piece and with segments of SEGMENT_DURATION seconds:
+
+    python -m benchmarks.segments --duration 1200 --fps 25 --ms-per-frame 0.5 --slots 2
+
+The inference of xnect is only simulated, so the times show the overlap of the slots and the cost of the overlaps and
+the stitching, not the speed of the gpu. The report is printed as json.
+"""
+import argparse
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.synthetic import generate, write_rows
+from project import segments
+from project.config import Config
+
+
+def write_segment(directory, outputs, segment):
+    """
+    write the rows of the frames of a segment with frames counted from its start, like xnect analysing the segment
+    :return: paths of the text files by name
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for name, rows in outputs.items():
+        rows = rows[(rows[:, 0] >= segment["start"]) & (rows[:, 0] < segment["start"] + segment["frames"])].copy()
+        rows[:, 0] -= segment["start"]
+        paths[name] = os.path.join(directory, "%s.txt" % name)
+        write_rows(paths[name], rows)
+    return paths
+
+
+def run(plan, outputs, slots, seconds_per_frame, directory):
+    """
+    analyse the segments of a plan with the simulated xnect and stitch them
+    :return: timings in seconds and the number of stitched people
+    """
+    xnect = threading.Semaphore(slots)
+
+    def infer(part):
+        segment = plan[part]
+        with xnect:
+            time.sleep(segment["frames"] * seconds_per_frame)
+            paths = write_segment(os.path.join(directory, str(part)), outputs, segment)
+        return dict(segment, paths=paths)
+
+    start = time.perf_counter()
+    # every segment is an inference job of its own, the workers wait for a slot of xnect
+    with ThreadPoolExecutor(len(plan)) as pool:
+        parts = list(pool.map(infer, range(len(plan))))
+    inference = time.perf_counter() - start
+    output_paths = {name: os.path.join(directory, "stitched_%s.npz" % name) for name in outputs}
+    people = segments.stitch(parts, output_paths, Config.SEGMENT_MATCH_DISTANCE)
+    total = time.perf_counter() - start
+    return {"segments": len(plan), "analysed_frames": sum(segment["frames"] for segment in plan),
+            "inference_s": round(inference, 3), "stitching_s": round(total - inference, 3),
+            "total_s": round(total, 3), "people": people}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the inference of long videos in segments")
+    parser.add_argument("--duration", type=float, default=1200, help="length of the video in seconds")
+    parser.add_argument("--fps", type=float, default=25)
+    parser.add_argument("--ms-per-frame", type=float, default=0.5, help="simulated inference time per frame")
+    parser.add_argument("--slots", type=int, default=Config.XNECT_SLOTS, help="videos analysed by xnect at once")
+    parser.add_argument("--people", type=int, default=3)
+    args = parser.parse_args()
+
+    num_frames = int(math.ceil(args.duration * args.fps))
+    overlap = int(round(Config.SEGMENT_OVERLAP * args.fps))
+    outputs = dict(zip(["raw2d", "raw3d", "ik3d"], generate(num_frames, args.people)))
+    plans = {
+        "whole": [{"start": 0, "frames": num_frames}],
+        "per_slot": segments.plan(num_frames, max(segments.parallel_length(num_frames, args.slots, overlap),
+                                                  int(round(Config.SEGMENT_DURATION * args.fps))), overlap),
+        "fixed_duration": segments.plan(num_frames, int(round(Config.SEGMENT_DURATION * args.fps)), overlap),
+    }
+    report = {"frames": num_frames, "slots": args.slots, "ms_per_frame": args.ms_per_frame, "plans": {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, plan in plans.items():
+            report["plans"][name] = run(plan, outputs, args.slots, args.ms_per_frame / 1000,
+                                        os.path.join(directory, name))
+    whole = report["plans"]["whole"]["total_s"]
+    for result in report["plans"].values():
+        result["speedup"] = round(whole / result["total_s"], 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+BENCHMARK : Start up time and memory of a web worker, i.e. the import of the flask app, measured in fresh
+interpreters. The report also lists the heavy modules of the pipeline that were imported by the app; the web app
+enqueues the pipeline by name (scheduling.CONVERT_XNECT), so the list should be empty:
+
+    python -m benchmarks.startup --repeat 5
+
+With --importtime, the output of python -X importtime for the slowest modules is added to the report.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# modules only the rq workers need
+HEAVY_MODULES = ["cv2", "skvideo", "video2bvh", "bvh_smooth", "scipy", "numpy", "project.conversion_task"]
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import project.app
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  "modules": len(sys.modules), "heavy": [m for m in %r if m in sys.modules]}))
+""" % HEAVY_MODULES
+
+
+def probe_env():
+    """
+    :return: environment of the probe, the app only needs its settings to be importable
+    """
+    env = dict(os.environ)
+    env.setdefault("APP_SETTINGS", "project.config.Config")
+    env.setdefault("SECRET_KEY", "startup")
+    env.setdefault("DATABASE_URL", "sqlite://")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+    return env
+
+
+def probe(args=()):
+    """
+    import the app in a new interpreter
+    :param args: further options of the interpreter
+    :return: measurement of the probe and its stderr
+    """
+    process = subprocess.run([sys.executable] + list(args) + ["-c", PROBE], env=probe_env(),
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    return json.loads(process.stdout.strip().splitlines()[-1]), process.stderr
+
+
+def slowest_imports(importtime, top):
+    """
+    :param importtime: stderr of python -X importtime
+    :param top: number of modules
+    :return: modules with the longest cumulative import time in milliseconds
+    """
+    modules = []
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        modules.append((int(cumulative) / 1000.0, name))
+    return [{"module": name, "cumulative_ms": ms} for ms, name in sorted(modules, reverse=True)[:top]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Start up time and memory of the web app")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--importtime", action="store_true", help="add the slowest imports (python -X importtime)")
+    parser.add_argument("--top", type=int, default=15, help="number of listed imports")
+    args = parser.parse_args()
+
+    runs = [probe()[0] for _ in range(args.repeat)]
+    report = {"seconds": round(min(run["seconds"] for run in runs), 4),
+              "max_rss_mb": round(min(run["max_rss_kb"] for run in runs) / 1024.0, 1),
+              "modules": runs[0]["modules"], "heavy_modules": runs[0]["heavy"]}
+    if args.importtime:
+        report["slowest_imports"] = slowest_imports(probe(["-X", "importtime"])[1], args.top)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+SYNTHETIC DATA : Generates raw xnect outputs (raw2D, raw3D, IK3D text files) without xnect or a gpu.
+Every person moves smoothly around its own position, rows are written like xnect does: frame, person, values.
+Detections can be dropped (people missed by xnect) and the person indices of two people can be swapped (identity
+switches of xnect), which is what the tracking of the export has to handle.
+"""
+import os
+
+import numpy as np
+
+# joints per row of the xnect outputs
+JOINTS_2D = 14
+JOINTS_3D = 21
+
+
+def generate(frames, people, seed=0, dropout=0.0, swap_rate=0.0):
+    """
+    generate synthetic poses
+    :param frames: number of frames
+    :param people: number of people
+    :param seed: random seed
+    :param dropout: probability that a person is not detected in a frame
+    :param swap_rate: probability per frame that the indices of two people are swapped from this frame on
+    :return: rows of raw2d, raw3d and ik3d (frame, person, values...)
+    """
+    rng = np.random.RandomState(seed)
+    t = np.arange(frames)[:, None, None, None]
+    # skeleton of every person (people x joints x 3) in mm, placed next to each other
+    skeletons = rng.normal(0, 300, [1, people, JOINTS_3D, 3]) + \
+        np.array([1000.0, 0, 4000])[None, None, None, :] * np.arange(people)[None, :, None, None]
+    motion = 100 * np.sin(t * 0.05 + rng.uniform(0, np.pi, [1, people, JOINTS_3D, 3]))
+    poses3d = skeletons + motion + rng.normal(0, 5, [frames, people, JOINTS_3D, 3])
+    # simple projection of the first joints to the image
+    poses2d = 500 + poses3d[:, :, :JOINTS_2D, :2] / np.maximum(poses3d[:, :, :JOINTS_2D, 2:], 1000) * 1000
+
+    index = np.stack(np.meshgrid(np.arange(frames), np.arange(people), indexing="ij"), -1).reshape([-1, 2])
+    index[:, 1] = swapped_indices(rng, frames, people, swap_rate).reshape(-1)
+    raw2d = np.hstack([index, poses2d.reshape([frames * people, -1])])
+    raw3d = np.hstack([index, poses3d.reshape([frames * people, -1])])
+    ik3d = np.hstack([index, (poses3d + rng.normal(0, 2, poses3d.shape)).reshape([frames * people, -1])])
+    # the same detections are missing in all outputs, like in xnect
+    detected = rng.uniform(size=frames * people) >= dropout
+    return raw2d[detected], raw3d[detected], ik3d[detected]
+
+
+def swapped_indices(rng, frames, people, swap_rate):
+    """
+    :return: person index of every person and frame (frames x people), two indices are swapped at random frames
+    """
+    indices = np.zeros([frames, people], dtype=np.int64)
+    current = np.arange(people)
+    for frame in range(frames):
+        if people > 1 and swap_rate and rng.uniform() < swap_rate:
+            a, b = rng.choice(people, 2, replace=False)
+            current[[a, b]] = current[[b, a]]
+        indices[frame] = current
+    return indices
+
+
+def write_rows(path, rows):
+    """
+    write rows like xnect: indices as integers, values with 6 significant digits
+    """
+    fmt = ["%d", "%d"] + ["%g"] * (rows.shape[1] - 2)
+    np.savetxt(path, rows, fmt=fmt)
+
+
+def write_xnect_files(directory, frames, people, seed=0, dropout=0.0, swap_rate=0.0):
+    """
+    write synthetic raw xnect outputs
+    :param directory: output directory
+    :return: paths of the text files by name (raw2d, raw3d, ik3d)
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for name, rows in zip(["raw2d", "raw3d", "ik3d"], generate(frames, people, seed, dropout, swap_rate)):
+        paths[name] = os.path.join(directory, "%s.txt" % name)
+        write_rows(paths[name], rows)
+    return paths
@@ -0,0 +1,100 @@
+"""
+BENCHMARK : Latency of the in-memory tag index of the feed (project/tag_index.py) with synthetic public jobs.
+The tags of the jobs follow a zipf distribution, so a few tags are carried by a large share of the jobs. Every query
+is measured while the index is changed, a job is published between two queries like in a busy feed.
+The report is printed as json, "ok" tells if the p95 of every query is below --target-ms:
+
+    python -m benchmarks.tag_index --jobs 1000000 --tags 10000
+"""
+import argparse
+import itertools
+import json
+import random
+import time
+
+from project.tag_index import TagIndex
+
+
+def synthetic_tags(jobs, tags, tags_per_job, seed):
+    """
+    :return: list of (job id, tag text) rows in random order, like the loader without ORDER BY
+    """
+    rng = random.Random(seed)
+    names = ["tag%d" % rank for rank in range(tags)]
+    weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(tags)))
+    rows = []
+    for job_id in range(1, jobs + 1):
+        for tag in set(rng.choices(names, cum_weights=weights, k=rng.randint(1, tags_per_job))):
+            rows.append((job_id, tag))
+    rng.shuffle(rows)
+    return rows
+
+
+def percentiles(times):
+    times = sorted(times)
+    return {"p50_ms": round(times[len(times) // 2] * 1000, 3),
+            "p95_ms": round(times[int(len(times) * 0.95)] * 1000, 3),
+            "max_ms": round(times[-1] * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the tag index of the feed")
+    parser.add_argument("--jobs", type=int, default=1000000)
+    parser.add_argument("--tags", type=int, default=10000)
+    parser.add_argument("--tags-per-job", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--per-page", type=int, default=50)
+    parser.add_argument("--target-ms", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = synthetic_tags(args.jobs, args.tags, args.tags_per_job, args.seed)
+    index = TagIndex(loader=lambda: rows)
+    start = time.perf_counter()
+    index.rebuild()
+    report = {"jobs": args.jobs, "tags": args.tags, "rows": len(rows),
+              "rebuild_s": round(time.perf_counter() - start, 3), "queries": {}}
+
+    # the most used tag, a tag of the middle and a rare tag
+    popular, common, rare = "tag0", "tag%d" % (args.tags // 100), "tag%d" % (args.tags // 2)
+    deep = 200 * args.per_page
+    queries = {
+        "facets": lambda: index.facets(limit=20),
+        "facets_popular": lambda: index.facets([popular], limit=20),
+        "facets_common": lambda: index.facets([common], limit=20),
+        "facets_or": lambda: index.facets([popular, "tag1"], limit=20),
+        "facets_and": lambda: index.facets([popular, "tag1"], True, limit=20),
+        "page_popular": lambda: index.page([popular], False, 0, args.per_page),
+        "page_popular_deep": lambda: index.page([popular], False, deep, args.per_page),
+        "page_or": lambda: index.page([popular, "tag1"], False, 0, args.per_page),
+        "page_or_deep": lambda: index.page([popular, "tag1"], False, deep, args.per_page),
+        "page_and": lambda: index.page([popular, "tag1"], True, 0, args.per_page),
+        "page_and_deep": lambda: index.page([popular, common], True, 10 * args.per_page, args.per_page),
+        "page_rare_or": lambda: index.page([rare, common], False, 0, args.per_page),
+        "autocomplete": lambda: index.autocomplete("tag1", 10),
+    }
+    rng = random.Random(args.seed + 1)
+    next_job = args.jobs + 1
+    change_times = []
+    ok = True
+    for name, query in queries.items():
+        times = []
+        for _ in range(args.repeat):
+            # publish a job with popular tags, which invalidates cached results of these tags
+            start = time.perf_counter()
+            index.add(next_job, [popular, "tag%d" % rng.randrange(args.tags)])
+            change_times.append(time.perf_counter() - start)
+            next_job += 1
+            start = time.perf_counter()
+            query()
+            times.append(time.perf_counter() - start)
+        report["queries"][name] = percentiles(times)
+        ok = ok and report["queries"][name]["p95_ms"] < args.target_ms
+    report["publish"] = percentiles(change_times)
+    report["target_ms"] = args.target_ms
+    report["ok"] = ok
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+BENCHMARK : Fixed overhead per job of the rq worker in the fork and the warm mode (project/worker_pool.py).
+Trivial jobs are put into a queue of their own and run by a burst worker, the overhead is the time of the worker
+minus the run time of the job functions. A redis server is needed, the pipeline queues are not touched:
+
+    python -m benchmarks.worker_overhead --redis-url redis://localhost:6379/0 --jobs 200
+
+Tasks:
+- noop: returns immediately, only the overhead of the worker is measured
+- skeleton: builds the bvh skeleton of the export like a job does, in the warm mode it is built once per process
+"""
+import argparse
+import json
+import os
+import time
+
+QUEUE = "benchmark_worker_overhead"
+
+
+def noop():
+    return None
+
+
+def skeleton():
+    from project import conversion_task
+    conversion_task.muco_skeleton()
+
+
+def run(mode, task, jobs, processes):
+    """
+    enqueue the jobs and run a burst worker pool until they are done
+    :return: measurement of the mode
+    """
+    import redis
+    from rq import Queue
+    from project import worker_pool
+    from project.config import Config
+    queue = Queue(QUEUE, connection=redis.from_url(Config.REDIS_URL))
+    # jobs left over by an interrupted run
+    queue.connection.delete(queue.key)
+    enqueued = [queue.enqueue("benchmarks.worker_overhead.%s" % task) for _ in range(jobs)]
+    start = time.perf_counter()
+    worker_pool.run_pool([QUEUE], processes, mode, burst=True)
+    seconds = time.perf_counter() - start
+    run_seconds = 0.0
+    failed = 0
+    for job in enqueued:
+        job.refresh()
+        if job.get_status() != "finished":
+            failed += 1
+        elif job.started_at is not None and job.ended_at is not None:
+            run_seconds += (job.ended_at - job.started_at).total_seconds()
+    return {"seconds": round(seconds, 3), "jobs_per_s": round(jobs / seconds, 1), "failed": failed,
+            "overhead_ms_per_job": round((seconds * processes - run_seconds) / jobs * 1000, 2),
+            "run_ms_per_job": round(run_seconds / jobs * 1000, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overhead per job of the rq worker modes")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--task", choices=["noop", "skeleton"], default="noop")
+    args = parser.parse_args()
+    # before the config is imported
+    os.environ["REDIS_URL"] = args.redis_url
+    os.environ.setdefault("APP_SETTINGS", "project.config.Config")
+
+    # the worker imports the pipeline before it starts (manage.py run_worker)
+    import project.conversion_task
+    report = {"jobs": args.jobs, "processes": args.processes, "task": args.task, "modes": {}}
+    for mode in ["fork", "warm"]:
+        report["modes"][mode] = run(mode, args.task, args.jobs, args.processes)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+gunicorn configuration for production (docker-compose.yml). All values can be overwritten by environment variables.
+Uploads, zip builds and bvh filtering are mostly waiting on disk and network, so every worker process runs several
+threads (gthread) and one slow request does not block the others.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+# rule of thumb from the gunicorn documentation: (2 x number of cores) + 1
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+# long running requests (uploads of big videos, zip creation) are killed after this many seconds
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 300))
+# time given to running requests to finish after a restart
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 60))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+# restart workers from time to time to bound memory growth
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 100))
+accesslog = "-"
+
+
+def child_exit(server, worker):
+    # drop the live gauges of exited workers from the prometheus metrics (see project/metrics.py)
+    if os.getenv("prometheus_multiproc_dir"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,10 +1,10 @@
 # This file is used to securely run the server and build the database
+import click
 from flask.cli import FlaskGroup
-from rq import Connection, Worker
 
 from project.app import app
-import redis
-
+from project import metrics, scheduling, storage, worker_pool
+from project.config import Config
 from project.model import model
 
 cli = FlaskGroup(app)
@@ -12,12 +12,36 @@ cli = FlaskGroup(app)
 
 # expose command "run_worker" to start the worker in the background
 @cli.command("run_worker")
-def run_worker():
-    redis_url = app.config["REDIS_URL"]
-    redis_connection = redis.from_url(redis_url)
-    with Connection(redis_connection):
-        worker = Worker(app.config["QUEUES"])
-        worker.work()
+@click.option("--stage", "stages", multiple=True, type=click.Choice(Config.STAGES),
+              help="Stage handled by the workers, can be given multiple times (default: all stages)")
+@click.option("--workers", default=1, help="Number of worker processes")
+@click.option("--mode", type=click.Choice(worker_pool.MODES), default=Config.WORKER_MODE,
+              help="fork: a new process per job, warm: long-lived processes keeping imports and models loaded")
+@click.option("--max-jobs", type=int, default=Config.WORKER_MAX_JOBS,
+              help="Jobs after which a warm worker process is replaced (0: never)")
+@click.option("--burst", is_flag=True, help="Stop when the queues are empty")
+@click.option("--metrics-port", type=int, default=Config.WORKER_METRICS_PORT,
+              help="Port of the prometheus metrics of the worker (0: disabled)")
+def run_worker(stages, workers, mode, max_jobs, burst, metrics_port):
+    # the worker only needs a database connection for short writes, so do not keep a pool
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = app.config["WORKER_SQLALCHEMY_ENGINE_OPTIONS"]
+    queues = scheduling.queue_names(list(stages))
+    print("Listening to queues %s with %d %s worker(s)" % (", ".join(queues), workers, mode))
+    if metrics_port:
+        # the jobs run in forked processes, their metrics are only collected in the multiprocess mode
+        metrics.start_server(metrics_port)
+    # the web app only enqueues the pipeline by name (scheduling.CONVERT_XNECT). Import it once here, so the
+    # processes running the jobs inherit the loaded modules instead of importing them for every job.
+    import project.conversion_task
+    # a forking worker does not grow, its jobs run in processes of their own
+    worker_pool.run_pool(queues, workers, mode, max_jobs if mode == "warm" else 0, burst)
+
+
+# expose command "storage_maintenance" to apply the retention policies of the cache dir (e.g. daily via cron)
+@cli.command("storage_maintenance")
+def storage_maintenance():
+    # the source videos of queued and running jobs are still read by their stages
+    print(storage.run_maintenance(model.get_active_job_ids(), model.get_job_ids()))
 
 
 # expose command "create_db" to create initial database
@@ -4,7 +4,9 @@ This is the main application. From here the server is started and connects to th
 # import all requirements
 import enum
 import io
+import json
 import os
+import tarfile
 import pathlib
 import time
 import zipfile
@@ -16,21 +18,20 @@ from flask import Flask, Blueprint, g, jsonify, send_from_directory, url_for, ma
     send_file, request
 from flask_restplus import Api, Resource, abort, fields, ValidationError
 from werkzeug.exceptions import HTTPException, NotFound, BadRequest
-from project import parsers
-from rq import Queue, Connection
-from bvh_smooth.smooth_position import butterworth as pos_butterworth
-from bvh_smooth.smooth_rotation import butterworth as rot_butterworth
+from project import checkpoints, content_store, metrics, parsers, profiling, response_cache, scheduling, storage
+from project.bvh_filter import filter_bvh
 # authentication
 from flask_httpauth import HTTPBasicAuth
 # initialization
 from project.config import Config
-from project.conversion_task import convert_xnect
 from project.parsers import user_metadata_parser
 
 app = Flask(__name__)
 
 app_settings = os.getenv("APP_SETTINGS")
 app.config.from_object(app_settings)
+# request latency and database queries per endpoint
+metrics.init_app(app)
 
 # Define HTTPBasic Authentication to authorize users
 auth = HTTPBasicAuth()
@@ -51,23 +52,16 @@ class ResultCode(enum.IntEnum):
     pending = 0
 
 
-class Count(Raw):
-    """
-    Counts an array, used for marshalling
-    """
-    def format(self, value):
-        return len(value)
-
-
 class BookmarkedByCurrentUser(Raw):
     """
-    Get all bookmarks by the current user
+    If a job (by id) is bookmarked by the current user, the bookmarked jobs are loaded once per request
     """
     def format(self, value):
-        for v in value:
-            if g.user.id == v.user_id:
-                return True
-        return False
+        if g.get("user") is None:
+            return False
+        if "bookmarked_job_ids" not in g:
+            g.bookmarked_job_ids = model.get_bookmarked_job_ids(g.user.id)
+        return value in g.bookmarked_job_ids
 
 """
 MARSHALLING : Definition of custom Marshallers
@@ -114,11 +108,16 @@ tag_marshal = api.model('Tag', {
     'text': fields.String
 })
 
+tag_count_marshal = api.model('TagCount', {
+    'text': fields.String,
+    'count': fields.Integer
+})
+
 bookmark_marshal = api.model('Bookmarks', {
     'category': fields.String,
     'user_id': fields.String,
     'job_id': fields.String,
-    'count': Count(attribute="job.bookmarks")
+    'count': fields.Integer(attribute="job.bookmark_count")
 })
 
 delete_bookmark_marshal = api.model('Bookmarks', {
@@ -132,17 +131,39 @@ jobs_marshal = api.model('Job', {
     'user': fields.Nested(light_user_marshal),
     'name': fields.String,
     'tags': fields.Nested(tag_marshal),
-    'num_bookmarks': Count(attribute='bookmarks'),
-    'bookmarked': BookmarkedByCurrentUser(attribute='bookmarks'),
+    'num_bookmarks': fields.Integer(attribute='bookmark_count'),
+    'bookmarked': BookmarkedByCurrentUser(attribute='id'),
     'public': fields.Boolean,
     'video_uploaded': fields.Boolean,
+    'backend': fields.String,
+    'quality': fields.String,
     'date_updated': fields.DateTime(dt_format='iso8601'),
     'upload_job_url': fields.Url('api.jobs_job_upload_video'),
     'input_video_url': fields.Url('api.jobs_job_source_video'),
     'thumbnail_url': fields.Url('api.jobs_job_thumbnail'),
+    'preview_url': fields.Url('api.jobs_job_preview'),
     'result': fields.Nested(results_marshal),
 })
 
+preview_marshal = api.model('Preview', {
+    'status': fields.String(description="pending, success, failure or skipped"),
+    'people': fields.Integer,
+    'seconds': fields.Float,
+    'message': fields.String,
+    'tracks': fields.Raw(description="time offsets of the preview bvh files by person")
+})
+
+batch_marshal = api.model('Batch', {
+    'id': fields.String,
+    'total': fields.Integer,
+    'success': fields.Integer,
+    'failed': fields.Integer,
+    'pending': fields.Integer,
+    'progress': fields.Float,
+    'finished': fields.Boolean,
+    'job_ids': fields.List(fields.Integer)
+})
+
 statistics_marshal = api.model('JobStatistics', {
     'success' : fields.Integer,
     'pending' : fields.Integer,
@@ -167,6 +188,18 @@ Configuration
 """
 # establish redis connection
 conn = redis.from_url(app.config["REDIS_URL"])
+# profiling of single requests, only installed if enabled in the config
+profiling.init_app(app, conn)
+# responses that stay the same until a job changes
+cache = response_cache.ResponseCache(conn, api)
+
+
+def feed_scopes(*args, **kwargs):
+    return [response_cache.FEED]
+
+
+def job_scopes(id, *args, **kwargs):
+    return [response_cache.job_scope(id)]
 
 # import
 import project.model.model as model
@@ -180,6 +213,18 @@ def redirect_to_api():
     """
     return redirect("/api/v1")
 
+
+@app.route("/metrics")
+def get_metrics():
+    """
+    prometheus metrics of the api and, if the worker shares the metrics directory, of the conversion pipeline
+    :return: metrics in the prometheus text format
+    """
+    content_type, text = metrics.latest()
+    response = make_response(text)
+    response.headers["Content-Type"] = content_type
+    return response
+
 """
 Status
 """
@@ -229,6 +274,14 @@ def check_auth(job, autho):
         return
     raise NotAuthorized
 
+
+def check_admin():
+    """
+    check if the current user is an admin (Config.ADMIN_USERS)
+    """
+    if g.user.username not in Config.ADMIN_USERS:
+        raise model.Forbidden
+
 """
 USER MANAGEMENT
 """
@@ -340,9 +393,16 @@ class JobDoesNotExist(HTTPException):
 
 
 def get_job_status(id):
-    try:
-        job = RedisJob.fetch(str(id), connection=conn)
-    except NoSuchJobError as e:
+    # find the latest stage of the conversion pipeline that has been enqueued
+    job = None
+    pipeline = [stage for stage in Config.STAGES if stage != "filter"]
+    for stage in reversed(pipeline):
+        try:
+            job = RedisJob.fetch(scheduling.stage_job_id(id, stage), connection=conn)
+            break
+        except NoSuchJobError as e:
+            continue
+    if job is None:
         res = model.get_result_by_id(id)
         if res:
             if res.result_code == ResultCode.pending:
@@ -351,7 +411,16 @@ def get_job_status(id):
                 return {"finished" : True}
         return {"message": "job not found"}, 404
     if job.is_finished:
-        return {"finished": True}
+        # a stage returning False has failed and does not schedule the next stage
+        if stage in Config.FINAL_STAGES or job.result is False:
+            return {"finished": True}
+        # long videos are analysed in segments (see conversion_task.infer_segment)
+        progress = scheduling.parts_progress(conn, id) if stage in ["ingest", "preview"] else None
+        if progress is not None:
+            if model.get_result_by_id(id).result_code == ResultCode.failure:
+                return {"finished": True}
+            return {"stage": {"name": "xnect", "progress": progress}, "finished": False}
+        return {"stage": {"name": "pending"}, "finished": False}
     else:
         if job.is_failed:
             return {"finished": False, "problem": True}
@@ -386,19 +455,78 @@ class Jobs(Resource):
         '''Post a new Job. The job will be added to the worker queue afterwards.'''
         args = parsers.post_job_parser.parse_args()
         print(args)
-        job = model.add_job(**{"user_id": g.user.id, "name": args['name'], "tags": args['tags']})
+        job = model.add_job(**{"user_id": g.user.id, "name": args['name'], "tags": args['tags'],
+                               "backend": args['backend'], "quality": args['quality']})
         # check if video is there
         # check if the sent file is actually a video.
         if args['video'] is not None and args['video'].mimetype == 'video/mp4':
-            # enqueue the object to the worker queue
-            with Connection(conn):
-                q = Queue()
-                q.enqueue(convert_xnect, my_job_id=job.id, video=args['video'].read())
-                job.video_uploaded = True
+            # store the video in the content store and enqueue the object to the worker queue
+            job.video_hash = content_store.store_upload(args['video'])
+            scheduling.enqueue_stage(conn, "ingest", scheduling.CONVERT_XNECT, job.id, video_hash=job.video_hash,
+                                     backend=job.backend, quality=job.quality, preview=args['preview'])
+            job.video_uploaded = True
         model.db.session.commit()
         return job
 
 
+"""
+/api/v1/jobs/batch : Submit many videos at once
+"""
+@jobs_space.route("/batch")
+class JobsBatch(Resource):
+    @auth.login_required
+    @api.expect(parsers.batch_parser)
+    @jobs_space.marshal_with(batch_marshal)
+    @api.response(401, 'The user is not permitted to do this action')
+    @api.response(400, 'No videos or invalid manifest')
+    @api.response(415, 'A video is not in mp4 format or the archive is neither zip nor tar')
+    @api.response(200, 'Return the batch with the ids of the new jobs')
+    def post(self):
+        '''Submit many videos at once (as files or as zip/tar archive). All jobs are created in one transaction.'''
+        args = parsers.batch_parser.parse_args()
+        try:
+            manifest = {entry['file']: entry for entry in json.loads(args['manifest'] or "[]")}
+        except (ValueError, TypeError, KeyError):
+            abort(400, "Invalid manifest")
+        if any(video.mimetype != 'video/mp4' for video in args['videos']):
+            abort(415)
+        # store the videos in the content store
+        stored = [(video.filename, content_store.store_upload(video)) for video in args['videos']]
+        if args['archive'] is not None:
+            try:
+                stored += content_store.store_archive(args['archive'])
+            except tarfile.ReadError:
+                abort(415)
+        if not stored:
+            abort(400, "No videos")
+        entries = []
+        for file_name, video_hash in stored:
+            entry = manifest.get(file_name, {})
+            entries.append({"name": entry.get('name') or os.path.splitext(file_name)[0],
+                            "tags": entry.get('tags', args['tags']),
+                            "video_hash": video_hash,
+                            "backend": args['backend'],
+                            "quality": args['quality']})
+        batch_id, job_ids = model.add_jobs_batch(g.user.id, entries)
+        scheduling.enqueue_stages(conn, "ingest", scheduling.CONVERT_XNECT,
+                                  {id: {"video_hash": entry["video_hash"], "backend": entry["backend"],
+                                        "quality": entry["quality"], "preview": args['preview']}
+                                   for id, entry in zip(job_ids, entries)})
+        return model.get_batch_progress(batch_id, g.user.id)
+
+
+@jobs_space.route("/batch/<string:batch_id>")
+class JobsBatchProgress(Resource):
+    @auth.login_required
+    @jobs_space.marshal_with(batch_marshal)
+    @api.response(401, 'The user is not permitted to do this action')
+    @api.response(404, 'Batch not found')
+    @api.response(200, 'Return the aggregated progress of the batch')
+    def get(self, batch_id):
+        '''Get the aggregated progress of a batch'''
+        return model.get_batch_progress(batch_id, g.user.id)
+
+
 """
 /api/v1/jobs/<int:id>/upload : Upload a video for a specific job and start it
 """
@@ -424,12 +552,40 @@ class JobUploadVideo(Resource):
         # if the video has been uploaded already, it cannot be uploaded again
         elif job.video_uploaded is True:
             abort(409, "Video has been uploaded already")
-        with Connection(conn):
-            q = Queue()
-            q.enqueue(convert_xnect, my_job_id=job.id, video=args['video'].read())
-            job.video_uploaded = True
-            model.db.session.commit()
-            return job
+        job.video_hash = content_store.store_upload(args['video'])
+        scheduling.enqueue_stage(conn, "ingest", scheduling.CONVERT_XNECT, job.id, video_hash=job.video_hash,
+                                 backend=job.backend, quality=job.quality, preview=args['preview'])
+        job.video_uploaded = True
+        model.db.session.commit()
+        return job
+
+
+"""
+/api/v1/jobs/<int:id>/retry : Retry a job, it resumes after the last completed stage
+"""
+@jobs_space.route("/<int:id>/retry")
+class JobRetry(Resource):
+    @auth.login_required
+    @jobs_space.marshal_with(jobs_marshal)
+    @api.response(401, 'The user is not permitted to do this action')
+    @api.response(200, 'Return the job, it has been enqueued again')
+    @api.response(409, 'The job has no video or is still running')
+    @api.response(404, 'Job not found')
+    def post(self, id):
+        '''Retry a failed job. Stages that have been completed before are skipped.'''
+        job = model.retrieve_job(id)
+        check_auth(job, auth.get_auth())
+        if not job.video_uploaded:
+            abort(409, "No video has been uploaded")
+        status = get_job_status(id)
+        if isinstance(status, dict) and not status.get("finished") and not status.get("problem"):
+            abort(409, "Job is still running")
+        if model.get_result_by_id(id).result_code == ResultCode.success:
+            abort(409, "Job has finished successfully")
+        # the video is already stored in the cache dir
+        scheduling.enqueue_stage(conn, "ingest", scheduling.CONVERT_XNECT, job.id, video_hash=job.video_hash,
+                                 backend=job.backend, quality=job.quality)
+        return job
 
 
 """
@@ -531,6 +687,72 @@ class JobStatus(Resource):
         return get_job_status(id)
 
 
+def get_preview(id):
+    """
+    :param id: database id of the job
+    :return: preview of the job (see conversion_task.preview_xnect), or None if no preview has been requested
+    """
+    preview_dir = os.path.join(Config.CACHE_DIR, str(id), Config.PREVIEW_DIR)
+    path = os.path.join(preview_dir, Config.PREVIEW_FILE)
+    if os.path.exists(path):
+        preview = checkpoints.read_json(path)
+        if preview["status"] == "success":
+            preview["tracks"] = checkpoints.read_json(os.path.join(preview_dir, Config.TRACKS_FILE))
+        return preview
+    # the preview is requested with the ingest stage, which schedules the preview stage
+    for stage in ["preview", "ingest"]:
+        try:
+            job = RedisJob.fetch(scheduling.stage_job_id(id, stage), connection=conn)
+        except NoSuchJobError:
+            continue
+        if stage == "ingest" and not job.kwargs.get("preview"):
+            return None
+        if job.is_failed:
+            return {"status": "failure", "message": "The preview could not be analysed"}
+        return {"status": "pending"}
+    return None
+
+
+"""
+/api/v1/jobs/<int:id>/preview : Quick analysis of the first seconds of a job posted with preview=true
+"""
+@jobs_space.route("/<int:id>/preview")
+class JobPreview(Resource):
+    @auth.login_required
+    @jobs_space.marshal_with(preview_marshal)
+    @api.response(401, 'The user is not permitted to do this action')
+    @api.response(404, 'No preview has been requested for the job')
+    @api.response(200, 'Return the preview: pending, success (people and bvh files), failure or skipped')
+    def get(self, id):
+        '''Get the number of people and the bvh files of the first seconds of a job'''
+        check_auth(model.retrieve_job(id), auth.get_auth())
+        preview = get_preview(id)
+        if preview is None:
+            abort(404, "No preview has been requested for the job")
+        return preview
+
+
+@jobs_space.route("/<int:id>/preview/bvh/<int:person_id>")
+class JobPreviewBvhFile(Resource):
+    @auth.login_required
+    @api.produces(["application/octet-stream"])
+    @api.response(401, 'The user is not permitted to do this action')
+    @api.response(404, 'The preview is not finished or the person does not exist')
+    @api.response(200, 'Return bvh file')
+    def get(self, id, person_id):
+        '''Returns the preview bvh file of a person (counting from 1)'''
+        job = model.retrieve_job(id)
+        check_auth(job, auth.get_auth())
+        preview = get_preview(id)
+        if preview is None or preview["status"] != "success" or not 1 <= person_id <= preview["people"]:
+            abort(404)
+        return send_from_directory(os.path.join(Config.CACHE_DIR, str(id), Config.PREVIEW_DIR),
+                                   Config.OUTPUT_BVH_FILE_RAW_NUMBERED % person_id, as_attachment=True,
+                                   attachment_filename="%s preview (%d-%d).bvh" % (job.name, person_id,
+                                                                                    preview["people"]),
+                                   mimetype="application/octet-stream")
+
+
 @jobs_space.route("/<int:id>/source_video")
 class JobSourceVideo(Resource):
     #@auth.login_required
@@ -543,6 +765,8 @@ class JobSourceVideo(Resource):
         job = model.get_job_by_id(id)
         check_auth(job, auth.get_auth())
         directory = os.path.join(Config.CACHE_DIR, str(job.id))
+        # fetch the video from the cold storage, if it has been archived
+        storage.ensure_local(os.path.join(directory, Config.SOURCE_VIDEO_FILE))
         # check if result is succesful
         try:
             return send_from_directory(directory, Config.SOURCE_VIDEO_FILE,
@@ -643,10 +867,11 @@ class ResultOutputVideo(Resource):
 
 def serve_zip(job, result):
     path = os.path.join(Config.CACHE_DIR, str(result.id), Config.RESULT_DIR)
-    file_name = os.path.join(path, "bvhs.zip")
+    file_name = os.path.join(path, Config.OUTPUT_ZIP_FILE)
     if os.path.exists(file_name):
+        storage.touch(file_name)
         return send_from_directory(path,
-                                   "bvhs.zip",
+                                   Config.OUTPUT_ZIP_FILE,
                                    attachment_filename="%s by %s.zip" % (job.name, job.user.username),
                                    as_attachment=True,
                                    mimetype="application/zip")
@@ -654,9 +879,12 @@ def serve_zip(job, result):
         for i in range(1, result.max_people + 1):
             name = "%s by %s (%d-%d).bvh" % (job.name, job.user.username, i, result.max_people)
             zf.write(os.path.join(path, Config.OUTPUT_BVH_FILE_RAW_NUMBERED % i), arcname=name)
+        # time offsets of the bvh files
+        if os.path.exists(os.path.join(path, Config.TRACKS_FILE)):
+            zf.write(os.path.join(path, Config.TRACKS_FILE), arcname=Config.TRACKS_FILE)
     print("Zipped success...")
     return send_from_directory(path,
-                               "bvhs.zip",
+                               Config.OUTPUT_ZIP_FILE,
                                attachment_filename="%s by %s.zip" % (job.name, job.user.username),
                                as_attachment=True,
                                mimetype="application/zip")
@@ -666,6 +894,7 @@ def serve_zip(job, result):
 class ResultBvhFile(Resource):
     @api.produces(["application/octet-stream"])
     @api.response(200, 'Return bvh files')
+    @cache.cached(job_scopes, public=True, store=False)
     def get(self, id):
         '''Returns bvh-Files for a result as zip (or as .bvh, if only one person was tracked) for a job by id'''
         result = model.get_result_by_id(id)
@@ -673,6 +902,7 @@ class ResultBvhFile(Resource):
         if result is None:
             return 404
         if result.result_code is not model.ResultCode.success:
+            response_cache.skip()
             return 202
         path = os.path.join(Config.CACHE_DIR, str(result.id), Config.RESULT_DIR)
         # return 1 person
@@ -686,12 +916,32 @@ class ResultBvhFile(Resource):
 
 
 
-def filter_bvh(id, border, u0, nr):
-    path = os.path.join(Config.CACHE_DIR, str(id), Config.RESULT_DIR)
-    raw = os.path.join(path, Config.OUTPUT_BVH_FILE_RAW_NUMBERED % nr)
-    output = os.path.join(path, Config.OUTPUT_BVH_FILE_FILTERED_DYNAMIC_NUMBERED % nr)
-    rot_butterworth(raw, output, border, u0)
-    #pos_butterworth(output, output, border, u0)
+def get_tracks(result):
+    """
+    :param result: result of a job
+    :return: time offsets of the bvh files by person, every track starts at 0 for results of older versions
+    """
+    path = os.path.join(Config.CACHE_DIR, str(result.id), Config.RESULT_DIR, Config.TRACKS_FILE)
+    if os.path.exists(path):
+        return checkpoints.read_json(path)
+    return [{"person": i, "start_time": 0.0} for i in range(1, result.max_people + 1)]
+
+
+@results_space.route("/<int:id>/tracks")
+class ResultTracks(Resource):
+    @api.response(200, 'Return the first and last frame and the time offset of the bvh file of every person')
+    @api.response(202, 'The result is not finished yet')
+    @api.response(404, 'Result not found')
+    @cache.cached(job_scopes, public=True)
+    def get(self, id):
+        '''Returns the time offsets of the bvh files, people can enter the video later than others'''
+        result = model.get_result_by_id(id)
+        if result is None:
+            return 404
+        if result.result_code is not model.ResultCode.success:
+            response_cache.skip()
+            return 202
+        return get_tracks(result)
 
 
 @results_space.route("/<int:id>/bvh/<int:person_id>")
@@ -699,6 +949,7 @@ class ResultBvhFileForPerson(Resource):
     @api.produces(["application/octet-stream"])
     @api.response(200, 'Return bvh file')
     @api.expect(filter_parser)
+    @cache.cached(job_scopes, public=True, store=False)
     def get(self, id, person_id):
         '''Returns bvh-Files by person index (counting from 0) for a job by id'''
         args = filter_parser.parse_args(strict=True)
@@ -706,6 +957,7 @@ class ResultBvhFileForPerson(Resource):
         if result is None:
             return 404
         if result.result_code is not model.ResultCode.success:
+            response_cache.skip()
             return 202
         if person_id > result.max_people or person_id < 1:
             raise BadRequest("Person %d does not exist - Max index is %d." % (person_id, result.max_people))
@@ -713,8 +965,8 @@ class ResultBvhFileForPerson(Resource):
         job = model.get_job_by_id(id)
         myfile = "%s by %s (%d-%d).bvh" % (job.name, job.user.username, person_id, result.max_people)
         if args['border'] is not None and args['u0'] is not None:
-            filter_bvh(result.id, args['border'], args['u0'], person_id)
-            return send_from_directory(path, Config.OUTPUT_BVH_FILE_FILTERED_DYNAMIC_NUMBERED % person_id, as_attachment=True,
+            filtered = filter_bvh(result.id, args['border'], args['u0'], person_id)
+            return send_from_directory(path, filtered, as_attachment=True,
                                               attachment_filename=myfile,
                                               mimetype="application/octet-stream")
         return send_from_directory(path, Config.OUTPUT_BVH_FILE_RAW_NUMBERED % person_id, as_attachment=True,
@@ -725,11 +977,19 @@ class ResultBvhFileForPerson(Resource):
 @results_space.route("/<int:id>/render_html")
 class ResultRenderHTML(Resource):
     @api.expect(filter_parser)
+    @cache.cached(job_scopes, public=True)
     def get(self, id):
         '''render interactive 3d scene for result with motion capturing data for a job by id'''
         args = filter_parser.parse_args(strict=True)
         headers = {'Content-Type' : 'text/html'}
-        num_people = model.get_result_by_id(id).max_people
+        job = model.get_job_with_result(id)
+        if job is None:
+            raise model.JobDoesNotExist
+        result = job.result
+        if result.result_code is not model.ResultCode.success:
+            response_cache.skip()
+        num_people = result.max_people
+        offsets = [track["start_time"] for track in get_tracks(result)]
         urls = []
         if args['border'] is None or args['u0'] is None:
             for i in range(1, num_people + 1):
@@ -741,14 +1001,16 @@ class ResultRenderHTML(Resource):
                                     border=args['border'], u0=args['u0']))
                 print(urls)
         return make_response(render_template('bvh_import/index.html',
-                                             title=model.get_job_by_id(id).name,
-                                             url_array=urls), 200, headers)
+                                             title=job.name,
+                                             url_array=urls,
+                                             offset_array=offsets), 200, headers)
         #return redirect(url_for("api.results_result_render_html_for_person", id=id, person_id=1), 303)
 
 
 @results_space.route("/<int:id>/render_html/<int:person_id>")
 class ResultRenderHTMLForPerson(Resource):
     @api.expect(filter_parser)
+    @cache.cached(job_scopes, public=True)
     def get(self, id, person_id):
         '''render interactive 3d scene for specific person for result with motion capturing data for a job by id'''
         headers = {'Content-Type' : 'text/html'}
@@ -805,13 +1067,41 @@ class Posts(Resource):
     @api.response(200, 'Return the public posts')
     @api.expect(parsers.posts_parser)
     @auth.login_required
+    @cache.cached(feed_scopes, per_user=True)
     @jobs_space.marshal_list_with(jobs_marshal)
     def get(self):
-        '''Returns all public job-posts'''
+        '''Returns a page of the public job-posts, newest first'''
         args = parsers.posts_parser.parse_args(strict=True)
         if args['tags[]'] is None:
-            return model.get_all_public_posts()
-        return model.get_public_posts_filtered_by_tags(args['tags[]'])
+            return model.get_all_public_posts(args['page'], args['per_page'])
+        return model.get_public_posts_filtered_by_tags(args['tags[]'], args['match'] == 'all', args['page'],
+                                                       args['per_page'])
+
+
+@posts_space.route("/tags")
+class PostTags(Resource):
+    @api.response(200, 'Return the tags of the public posts with their counts')
+    @api.expect(parsers.tag_facets_parser)
+    @auth.login_required
+    @cache.cached(feed_scopes)
+    @posts_space.marshal_list_with(tag_count_marshal)
+    def get(self):
+        '''Returns the tags of all public job-posts and how often they are used (optionally filtered by tags)'''
+        args = parsers.tag_facets_parser.parse_args(strict=True)
+        return model.get_public_tag_counts(args['tags[]'], args['match'] == 'all', args['limit'])
+
+
+@posts_space.route("/tags/autocomplete")
+class PostTagsAutocomplete(Resource):
+    @api.response(200, 'Return the tags of the public posts starting with the prefix')
+    @api.expect(parsers.tag_autocomplete_parser)
+    @auth.login_required
+    @cache.cached(feed_scopes)
+    @posts_space.marshal_list_with(tag_count_marshal)
+    def get(self):
+        '''Returns tags of public job-posts starting with a given prefix'''
+        args = parsers.tag_autocomplete_parser.parse_args(strict=True)
+        return model.autocomplete_public_tags(args['prefix'], args['limit'])
 
 
 @posts_space.route("/<int:id>")
@@ -830,5 +1120,37 @@ class SinglePost(Resource):
         check_auth(model.get_job_by_id(id), auth.get_auth())
         return model.set_job_private(id, g.user.id)
 
+"""
+Profiles space
+"""
+
+profiles_space = api.namespace('profiles', description='Profiles of single requests (admins only)')
+
+
+@profiles_space.route("/")
+class Profiles(Resource):
+    @auth.login_required
+    @api.response(403, 'The user is not an admin')
+    @api.response(200, 'Return the stored profiles, newest first')
+    def get(self):
+        '''Get the stored request profiles without their details'''
+        check_admin()
+        return profiling.get_profiles(conn)
+
+
+@profiles_space.route("/<string:id>")
+class Profile(Resource):
+    @auth.login_required
+    @api.response(403, 'The user is not an admin')
+    @api.response(404, 'The profile does not exist (anymore)')
+    @api.response(200, 'Return the profile with the cProfile statistics and the sql statements')
+    def get(self, id):
+        '''Get a request profile by its id (response header X-Profile-Id of the profiled request)'''
+        check_admin()
+        profile = profiling.get_profile(conn, id)
+        if profile is None:
+            abort(404)
+        return profile
+
 # initialize database
 model.db.init_app(app)
\ No newline at end of file
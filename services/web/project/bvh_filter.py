@@ -0,0 +1,36 @@
+"""
+BVH FILTER : Smoothing of the exported bvh files with a butterworth filter (BVHsmooth).
+The filtered files are cached in the result dir for every filter configuration.
+"""
+import os
+import threading
+
+from project import storage
+from project.config import Config
+
+
+def filter_bvh(id, border, u0, nr):
+    """
+    filter the raw bvh of a person, if it has not been filtered with the same configuration yet
+    :param id: job id
+    :param border: border of the butterworth filter
+    :param u0: u0 of the butterworth filter
+    :param nr: person number (counting from 1)
+    :return: file name of the filtered bvh in the result dir
+    """
+    path = os.path.join(Config.CACHE_DIR, str(id), Config.RESULT_DIR)
+    name = Config.OUTPUT_BVH_FILE_FILTERED_DYNAMIC_NUMBERED % (nr, border, u0)
+    output = os.path.join(path, name)
+    if os.path.exists(output):
+        # used for the least recently used eviction
+        storage.touch(output)
+    else:
+        raw = os.path.join(path, Config.OUTPUT_BVH_FILE_RAW_NUMBERED % nr)
+        # write to a temporary file first, so concurrent requests never serve a half written file
+        tmp = "%s.%d.%d.tmp" % (output, os.getpid(), threading.get_ident())
+        # bvh_smooth pulls in scipy, it is imported by the first filter request instead of at the start of the web app
+        from bvh_smooth.smooth_rotation import butterworth as rot_butterworth
+        rot_butterworth(raw, tmp, border, u0)
+        #pos_butterworth(tmp, tmp, border, u0)
+        os.replace(tmp, output)
+    return name
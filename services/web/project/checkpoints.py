@@ -0,0 +1,60 @@
+"""
+CHECKPOINTS : Every stage of the conversion writes its outputs into the cache dir of the job. A stage is skipped,
+if its outputs exist and are newer than its inputs, so a retried job resumes after the last completed stage.
+"""
+import json
+import os
+from contextlib import contextmanager
+
+
+def is_fresh(outputs, inputs=()):
+    """
+    check if the outputs of a stage exist and are up to date
+    :param outputs: paths of the outputs
+    :param inputs: paths of the inputs the outputs are calculated from
+    :return: True, if all outputs exist, are not empty and are not older than any input
+    """
+    outputs = [str(path) for path in outputs]
+    if not outputs or not all(os.path.isfile(path) and os.path.getsize(path) > 0 for path in outputs):
+        return False
+    oldest_output = min(os.path.getmtime(path) for path in outputs)
+    input_times = [os.path.getmtime(str(path)) for path in inputs if os.path.exists(str(path))]
+    return not input_times or oldest_output >= max(input_times)
+
+
+@contextmanager
+def atomic_output(path):
+    """
+    write an output via a temporary file, which replaces the output only if writing succeeded.
+    Hence a worker dying while writing never leaves an output that looks complete.
+    :param path: path of the output
+    :return: temporary path to write to (with the same extension)
+    """
+    root, ext = os.path.splitext(str(path))
+    tmp = "%s.%d.tmp%s" % (root, os.getpid(), ext)
+    try:
+        yield tmp
+        os.replace(tmp, str(path))
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def write_json(path, data):
+    """
+    write a small json checkpoint
+    :param path: path of the checkpoint
+    :param data: json serializable data
+    """
+    with atomic_output(path) as tmp:
+        with open(tmp, 'w') as file:
+            json.dump(data, file)
+
+
+def read_json(path):
+    """
+    :param path: path of the checkpoint
+    :return: data of a json checkpoint
+    """
+    with open(str(path)) as file:
+        return json.load(file)
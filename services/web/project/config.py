@@ -1,27 +1,145 @@
 import os
 
+from sqlalchemy.pool import NullPool
+
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
 class Config(object):
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite://")
-    SQLALCHEMY_COMMIT_ON_TEARDOWN = True
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # connection pool of each web worker process (not supported by the in-memory sqlite fallback)
+    SQLALCHEMY_ENGINE_OPTIONS = {} if SQLALCHEMY_DATABASE_URI.startswith("sqlite") else {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "1") == "1",
+    }
+    # the worker opens a connection only for its short writes and closes it again, so idle workers hold none
+    WORKER_SQLALCHEMY_ENGINE_OPTIONS = {"poolclass": NullPool}
+    # port of the prometheus metrics of the worker, 0 disables them (see project/metrics.py)
+    WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", 9100))
+    # "fork": a new process per job (rq default), "warm": jobs run in a pool of long-lived processes
+    WORKER_MODE = os.getenv("WORKER_MODE", "fork")
+    # a worker process is replaced after this many jobs to bound its memory growth, 0: never
+    WORKER_MAX_JOBS = int(os.getenv("WORKER_MAX_JOBS", 100))
     DEBUG = True
     SECRET_KEY = os.getenv("SECRET_KEY")
+    # usernames of the admins, comma separated
+    ADMIN_USERS = [name for name in os.getenv("ADMIN_USERS", "").split(",") if name]
+    # opt-in profiling of api requests (see project/profiling.py), nothing is installed if both are unset
+    PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+    PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+    # redis cache of the feed, finished results and render_html pages (see project/response_cache.py)
+    RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "1") == "1"
+    RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 24 * 3600))
+    # seconds a shared cache (nginx, cdn) may serve a public response without revalidating it
+    RESPONSE_CACHE_MAX_AGE = int(os.getenv("RESPONSE_CACHE_MAX_AGE", 60))
+    # public posts per page of the feed
+    POSTS_PER_PAGE = int(os.getenv("POSTS_PER_PAGE", 50))
+    POSTS_MAX_PER_PAGE = 500
+    # number of stored profiles and functions per profile
+    PROFILING_KEEP = int(os.getenv("PROFILING_KEEP", 50))
+    PROFILING_TOP_FUNCTIONS = 60
     VIDEO_DIR = "./data/jobs"
-    CACHE_DIR = "/usr/data"
+    CACHE_DIR = os.getenv("CACHE_DIR", "/usr/data")
+    # content addressed store of uploaded videos inside the cache dir (see project/content_store.py)
+    OBJECTS_DIR = "objects"
+    # storage management of the cache dir (see project/storage.py)
+    # cold backend for archived files: local / s3
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+    STORAGE_COLD_DIR = os.getenv("STORAGE_COLD_DIR", "/usr/cold")
+    STORAGE_S3_ENDPOINT = os.getenv("STORAGE_S3_ENDPOINT")
+    STORAGE_S3_BUCKET = os.getenv("STORAGE_S3_BUCKET", "multipose")
+    STORAGE_S3_ACCESS_KEY = os.getenv("STORAGE_S3_ACCESS_KEY")
+    STORAGE_S3_SECRET_KEY = os.getenv("STORAGE_S3_SECRET_KEY")
+    # drop the raw xnect text outputs of a job after the bvh export (they are kept compressed)
+    STORAGE_DROP_XNECT_RAW = True
+    # archive source videos and unreferenced objects after this many days without access (None: never)
+    STORAGE_ARCHIVE_AFTER_DAYS = 30
+    # evict regenerable files (filtered bvhs, zips) if less space is free
+    STORAGE_MIN_FREE_BYTES = int(os.getenv("STORAGE_MIN_FREE_BYTES", 10 * 1024 ** 3))
     RESULT_DIR = "results"
     MODELS_3D_DIR = "./3d_models"
     OPENPOSE_MODELS_PATH = "/openpose/models"
-    REDIS_URL = "redis://redis:6379/0"
-    QUEUES = ["default"]
+    REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+    # http api of the xnect container (services/xnect/src/xnect.py)
+    XNECT_URL = os.getenv("XNECT_URL", "http://xnect:8081")
+    # videos analysed by xnect at the same time (XNECT_SLOTS of the xnect container)
+    XNECT_SLOTS = int(os.getenv("XNECT_SLOTS", 2))
+    # stages of the conversion pipeline, every stage has its own queues (see project/scheduling.py)
+    STAGES = ["ingest", "preview", "inference", "export", "lifting", "filter"]
+    # stages finishing the conversion of a job (the filter stage is optional)
+    FINAL_STAGES = ["export", "lifting"]
+    # queue priorities, workers always take jobs from the first non-empty queue
+    PRIORITIES = ["high", "default", "low"]
+    DEFAULT_PRIORITY = "default"
+    # (maximum video length in seconds, priority), longer videos get the last priority
+    PRIORITY_DURATIONS = [(60, "high"), (600, "default")]
+    # maximum run time of a stage in seconds
+    STAGE_TIMEOUTS = {"ingest": 600, "preview": 600, "inference": 6 * 3600, "export": 3600, "lifting": 6 * 3600,
+                      "filter": 1800}
+    # jobs posted with preview=true: the first PREVIEW_SECONDS seconds are analysed by xnect in the preview stage with
+    # PREVIEW_PRIORITY, the whole video is only analysed if people are found (see conversion_task.preview_xnect)
+    PREVIEW_SECONDS = float(os.getenv("PREVIEW_SECONDS", 5))
+    PREVIEW_PRIORITY = "high"
+    # videos longer than SEGMENT_MIN_DURATION seconds (None: never) are split into one segment per slot of xnect
+    # (XNECT_SLOTS), which overlap by SEGMENT_OVERLAP seconds and are analysed in parallel (see project/segments.py).
+    # More segments than slots would only wait for a slot. A segment is at least SEGMENT_DURATION seconds long.
+    SEGMENT_MIN_DURATION = 600
+    SEGMENT_DURATION = 120
+    SEGMENT_OVERLAP = 2
+    # maximum mean joint distance (mm) of the same person in the overlap of two segments
+    SEGMENT_MATCH_DISTANCE = 300
+    # seconds the number of finished parts of a stage is kept in redis
+    PARTS_TTL = 7 * 86400
+    # online tracking of the people (see project/tracking.py): maximum mean joint distance (mm) of a person between
+    # two frames, frames without detection until a track ends, minimum frames of a track, outlier distance as factor
+    # of the mean distance and consecutive outliers until a pose is accepted as new position
+    TRACK_MAX_DISTANCE = 300
+    TRACK_MAX_MISSED = 15
+    TRACK_MIN_LENGTH = 15
+    TRACK_OUTLIER_FACTOR = 3
+    TRACK_MAX_OUTLIERS = 5
+    # number of automatic retries of a stage that raised an exception
+    STAGE_RETRIES = 2
+    # quality tiers of the analysis: the source video is scaled down to max_height (shorter side) and max_fps
+    # before the pose estimation (see project/transcoding.py), None keeps the source value
+    QUALITY_TIERS = {
+        "full": {"max_height": None, "max_fps": None},
+        "high": {"max_height": 1080, "max_fps": 30},
+        "standard": {"max_height": 720, "max_fps": 30},
+        "fast": {"max_height": 480, "max_fps": 15},
+    }
+    DEFAULT_QUALITY = os.getenv("DEFAULT_QUALITY", "standard")
+    # h264 settings of the transcoded videos
+    TRANSCODE_PRESET = "veryfast"
+    TRANSCODE_CRF = 18
+    # pose estimation backends: xnect (gpu container) or lifting (OpenPose and 3d lifting on the worker's cpu)
+    BACKENDS = ["xnect", "lifting"]
+    DEFAULT_BACKEND = os.getenv("DEFAULT_BACKEND", "xnect")
+    # jobs with the backend "auto" use the lifting backend, if this many jobs are waiting for xnect
+    AUTO_BACKEND_BACKLOG = int(os.getenv("AUTO_BACKEND_BACKLOG", 4))
+    # lifting backend (see project/lifting.py): frames passed to OpenPose at once, maximum number of tracked
+    # people, minimum length of a track as fraction of the video and maximum movement of a person between two
+    # frames as fraction of the image diagonal
+    LIFTING_BATCH_FRAMES = 64
+    LIFTING_MAX_PEOPLE = 4
+    LIFTING_MIN_TRACK_LENGTH = 0.1
+    LIFTING_MAX_TRACK_DISTANCE = 0.1
+    # camera parameters of the h36m dataset, used to transform the lifted poses to world coordinates
+    CAMERA_PARAMS_FILE = "./cameras.h5"
+    # butterworth filter configurations (border, u0) that are calculated in the filter stage after the export
+    FILTER_PRESETS = []
     # Configure, if results are stored in files or not
     CACHE_RESULTS = True
     # POSSIBILITIES: CMU / H36M
     EXPORT_FORMAT = "CMU"
     SOURCE_VIDEO_FILE = "source_video.mp4"
+    # downscaled source video for the analysis, only exists if the quality tier limits the source video
+    ANALYSED_VIDEO_FILE = "analysed_video.mp4"
     THUMBNAIL_FILE = "thumbnail.jpg"
     OUTPUT_VIDEO_FILE = "output_video.mp4"
     OUTPUT_BVH_FILE = "output_bvh.bvh"
@@ -29,10 +147,27 @@ class Config(object):
     OUTPUT_BVH_FILE_RAW_NUMBERED = "output_raw_%d.bvh"
     OUTPUT_BVH_FILE_FILTERED = "output_filtered_%i.bvh"
     OUTPUT_BVH_FILE_FILTERED_DYNAMIC = "output_filtered.bvh"
-    OUTPUT_BVH_FILE_FILTERED_DYNAMIC_NUMBERED = "output_filtered_%d.bvh"
+    # filtered bvh file by person, border and u0
+    OUTPUT_BVH_FILE_FILTERED_DYNAMIC_NUMBERED = "output_filtered_%d_%d_%d.bvh"
     OUTPUT_FILTER_FACTORS = [10, 100, 1000]
+    OUTPUT_ZIP_FILE = "bvhs.zip"
+    # checkpoint of the lifting backend: 2d tracks (people x frames x 25 x 3)
     DATA_2D_FILE = "data_2d.npy"
     CONFIG_2D_FILE = "config_2d.npy"
+    # compressed raw xnect outputs by name (raw2d, raw3d, ik3d), see project/pose_store.py
+    XNECT_OUTPUT_FILE = "%s.npz"
+    # checkpoint of the tracking: ik3d poses of all tracks (frames x 21 x 3, concatenated) and the tracking state
     DATA_3D_FILE = "data_3d.npy"
+    TRACKING_FILE = "tracking.npz"
+    # first and last frame and time offset of the bvh file of every track
+    TRACKS_FILE = "tracks.json"
+    # segments of the analysed video and their raw xnect outputs, removed after stitching
+    SEGMENTS_DIR = "segments"
+    SEGMENTS_FILE = "segments.json"
+    # video, raw xnect outputs, tracks and bvh files of the preview, and its outcome (people, status)
+    PREVIEW_DIR = "preview"
+    PREVIEW_FILE = "preview.json"
+    # checkpoint of the ingest: fps, length and size of the source video and the format of the analysed video
+    VIDEO_INFO_FILE = "video_info.json"
 
 
@@ -0,0 +1,157 @@
+"""
+CONTENT STORE : Uploaded videos are stored by the sha256 hash of their content in Config.CACHE_DIR/objects/<hash>/.
+Jobs link to the stored video instead of keeping their own copy. The raw xnect outputs of a video are stored next to
+it, so a job for an already analysed video skips the inference and links the existing outputs.
+"""
+import hashlib
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+from project import storage
+from project.config import Config
+
+# size of the chunks read while hashing an upload
+CHUNK_SIZE = 1024 * 1024
+
+
+def object_dir(video_hash):
+    """
+    :param video_hash: sha256 hash of the video
+    :return: directory of the stored video
+    """
+    return os.path.join(Config.CACHE_DIR, Config.OBJECTS_DIR, video_hash)
+
+
+def link(source, target):
+    """
+    link a file (hard link, the store is on the same volume as the jobs), copy it if linking is not possible
+    :param source: existing file
+    :param target: path of the link, an existing file is replaced
+    """
+    tmp = "%s.%d.link" % (target, os.getpid())
+    try:
+        os.link(source, tmp)
+    except OSError:
+        shutil.copyfile(source, tmp)
+    os.replace(tmp, target)
+
+
+def store_upload(file):
+    """
+    store an uploaded video while hashing it. If the same video has been uploaded before, the copy is dropped.
+    :param file: uploaded file (werkzeug FileStorage)
+    :return: sha256 hash of the video
+    """
+    return store_stream(file.stream)
+
+
+def store_archive(file):
+    """
+    store all mp4 videos of an uploaded zip or tar archive
+    :param file: uploaded archive (werkzeug FileStorage), werkzeug spools big uploads to disk
+    :return: list of (file name, sha256 hash) of the videos
+    :raise tarfile.ReadError: if the file is neither a zip nor a tar archive
+    """
+    stream = file.stream
+    stored = []
+    if zipfile.is_zipfile(stream):
+        stream.seek(0)
+        with zipfile.ZipFile(stream) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(".mp4"):
+                    with archive.open(info) as member:
+                        stored.append((os.path.basename(info.filename), store_stream(member)))
+        return stored
+    stream.seek(0)
+    with tarfile.open(fileobj=stream, mode="r:*") as archive:
+        for member in archive:
+            if member.isfile() and member.name.lower().endswith(".mp4"):
+                stored.append((os.path.basename(member.name), store_stream(archive.extractfile(member))))
+    return stored
+
+
+def store_stream(stream):
+    """
+    store a video from a binary stream while hashing it
+    :param stream: readable binary stream
+    :return: sha256 hash of the video
+    """
+    objects_dir = os.path.join(Config.CACHE_DIR, Config.OBJECTS_DIR)
+    os.makedirs(objects_dir, exist_ok=True)
+    sha = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=objects_dir, suffix=".upload")
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+                out.write(chunk)
+        video_hash = sha.hexdigest()
+        directory = object_dir(video_hash)
+        os.makedirs(directory, exist_ok=True)
+        target = os.path.join(directory, Config.SOURCE_VIDEO_FILE)
+        if not os.path.exists(target):
+            os.replace(tmp, target)
+        return video_hash
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def link_video(video_hash, target):
+    """
+    link the stored video to the cache dir of a job
+    :param video_hash: sha256 hash of the video
+    :param target: path of the source video of the job
+    :return: False, if the video is not in the store
+    """
+    source = os.path.join(object_dir(video_hash), Config.SOURCE_VIDEO_FILE)
+    if not storage.ensure_local(source):
+        return False
+    link(source, target)
+    return True
+
+
+def output_path(video_hash, path, variant=None):
+    """
+    :param video_hash: sha256 hash of the video
+    :param path: path of a raw xnect output of a job
+    :param variant: quality tier of the analysed video, None for the source video
+    :return: path of the stored output
+    """
+    name = os.path.basename(path)
+    if variant is not None:
+        name = "%s_%s" % (variant, name)
+    return os.path.join(object_dir(video_hash), name)
+
+
+def publish_outputs(video_hash, paths, variant=None):
+    """
+    store the raw xnect outputs of a video, so other jobs with the same video can reuse them
+    :param video_hash: sha256 hash of the video
+    :param paths: paths of the raw xnect outputs by name
+    :param variant: quality tier of the analysed video, None for the source video
+    """
+    directory = object_dir(video_hash)
+    if not os.path.isdir(directory):
+        return
+    for name, path in paths.items():
+        link(path, output_path(video_hash, path, variant))
+
+
+def link_outputs(video_hash, paths, variant=None):
+    """
+    link the stored raw xnect outputs of a video to a job
+    :param video_hash: sha256 hash of the video
+    :param paths: paths of the raw xnect outputs of the job by name
+    :param variant: quality tier of the analysed video, None for the source video
+    :return: True, if all outputs existed and have been linked
+    """
+    sources = {name: output_path(video_hash, path, variant) for name, path in paths.items()}
+    if not all(storage.ensure_local(source) and os.path.getsize(source) > 1 for source in sources.values()):
+        return False
+    for name, path in paths.items():
+        link(sources[name], path)
+    return True
@@ -1,136 +1,276 @@
+import io
 import math
 import os
+import shutil
 import time
+from contextlib import contextmanager, ExitStack
 from pathlib import Path
 
 import requests
-from bvh_smooth.smooth_position import butterworth as pos_butterworth
-from bvh_smooth.smooth_rotation import butterworth as rot_butterworth
-from bvh_smooth.smooth_position import average as pos_avrg
-from bvh_smooth.smooth_rotation import average as rot_avrg
-
-import cv2
+from urllib3 import encode_multipart_formdata
 import skvideo.io
-from flask import request
 from rq.job import get_current_job
-from video2bvh.bvh_skeleton import h36m_skeleton, cmu_skeleton, openpose_skeleton
-from video2bvh.pose_estimator_3d import estimator_3d
-from video2bvh.utils import smooth, vis, camera
 
+from project import checkpoints, content_store, lifting, metrics, pose_store, response_cache, scheduling, segments, \
+    storage, tracking, transcoding
+from project.bvh_filter import filter_bvh
 from project.config import Config
 import numpy as np
 from video2bvh.bvh_skeleton import muco_3dhp_skeleton
 
+# built once per worker process (see project/worker_pool.py), a skeleton only holds the joint hierarchy
+_muco_skeleton = None
+
 
-def prepare(my_job_id, video):
+def muco_skeleton():
     """
-    prepare a job and return several parameters
-    :param my_job_id: database id of the job
-    :param video: video file as bytes array
+    :return: the bvh skeleton of the xnect outputs (muco 3dhp)
+    """
+    global _muco_skeleton
+    if _muco_skeleton is None:
+        _muco_skeleton = muco_3dhp_skeleton.Muco3DHPSkeleton()
+    return _muco_skeleton
+
+
+@contextmanager
+def db_session():
+    """
+    open a short-lived database session inside the worker. The session is committed and removed afterwards, so
+    the connection is given back (and closed, see Config.WORKER_SQLALCHEMY_ENGINE_OPTIONS) and is not held
+    during the long running parts of a job.
+    :return: model module with an active session
     """
     from project.model import model
-    # get the current job
+    with model.app.app_context():
+        try:
+            yield model
+            model.db.session.commit()
+        except:
+            model.db.session.rollback()
+            raise
+        finally:
+            model.db.session.remove()
+
+
+def update_result(my_job_id, **values):
+    """
+    update the result of a job with a single statement
+    :param my_job_id: database id of the job
+    :param values: columns of the result to update
+    """
+    with db_session() as model:
+        model.db.session.query(model.Results).filter_by(id=my_job_id).update(values, synchronize_session=False)
+    # cached responses of the job (and the feed, if it is public) are outdated
     job = get_current_job()
+    if job is not None:
+        response_cache.bump(job.connection, response_cache.FEED, response_cache.job_scope(my_job_id))
 
-    job.meta['stage'] = {'name': 'preparing', 'progress': None}
 
-    # get the redis id for the job
-    job_id = str(get_current_job().get_id())
-    # add to database
+def job_dirs(my_job_id):
+    """
+    get the cache dirs of a job
+    :param my_job_id: database id of the job
+    :return: cache dir of the job and the result dir inside of it
+    """
     job_cache_dir = Path(os.path.join(Config.CACHE_DIR, str(my_job_id)))
+    return job_cache_dir, job_cache_dir / Config.RESULT_DIR
+
+
+def xnect_output_paths(result_cache_dir):
+    """
+    :param result_cache_dir: result dir of the job
+    :return: paths of the compressed raw xnect outputs by name
+    """
+    return {url: os.path.join(result_cache_dir, Config.XNECT_OUTPUT_FILE % url) for url in ["raw2d", "raw3d", "ik3d"]}
 
-    # The cache dir will look like that : cache/aabb-ccc-dddd-fff-ggg/ (UUID)
+
+def compress_xnect_output(txt_path, path):
+    """
+    convert a raw xnect text output to its compressed form and remove the text file
+    :param txt_path: path of the text output
+    :param path: path of the compressed output
+    """
+    with metrics.measure("xnect_convert", bytes=os.path.getsize(txt_path)), checkpoints.atomic_output(path) as tmp:
+        pose_store.convert_txt(txt_path, tmp)
+    os.remove(txt_path)
+
+
+def set_stage(name, progress=None):
+    """
+    store the current stage in the meta data of the redis job, so it can be shown in the job status
+    :param name: name of the stage
+    :param progress: progress between 0 and 1 or None, if indeterminate
+    """
+    job = get_current_job()
+    if job is not None:
+        job.meta['stage'] = {'name': name, 'progress': progress}
+        job.save_meta()
+
+
+def analysed_video(job_cache_dir):
+    """
+    :param job_cache_dir: cache dir of the job
+    :return: path of the video used for the pose estimation, the downscaled video if there is one
+    """
+    path = job_cache_dir / Config.ANALYSED_VIDEO_FILE
+    if path.exists():
+        return str(path)
+    source = os.path.join(job_cache_dir, Config.SOURCE_VIDEO_FILE)
+    # the source video may have been archived since the job has been prepared (e.g. a retried job)
+    storage.ensure_local(source)
+    return source
+
+
+def prepare(my_job_id, video, video_hash=None, quality=None):
+    """
+    prepare a job: store the video and a thumbnail in the cache dir and downscale the video for the analysis
+    :param my_job_id: database id of the job
+    :param video: video file as bytes array, or None to use the already stored video (retry)
+    :param video_hash: hash of the video in the content store, it is linked instead of storing a copy
+    :param quality: quality tier of the analysis (see Config.QUALITY_TIERS)
+    :return: fps of the analysed video and length in seconds of the video
+    """
+    from project.model import model
+    set_stage('preparing')
+    job_cache_dir, result_cache_dir = job_dirs(my_job_id)
+
+    # The cache dir will look like that : cache/<job id>/
     # Create a directory where the cache is stored.
-    if not job_cache_dir.exists():
-        os.makedirs(job_cache_dir)
+    if not result_cache_dir.exists():
+        os.makedirs(result_cache_dir)
 
     # save the source video in the cache folder
     filename = os.path.join(job_cache_dir, Config.SOURCE_VIDEO_FILE)
-    print("Saving video at %s" % filename)
-    with(open(filename, 'wb')) as file:
-        file.write(video)
-    file.close()
-
-    # save thumbnail
-    videogen = skvideo.io.FFmpegReader(filename)
-    for frame in videogen.nextFrame():
-        thumbnail_path = job_cache_dir / Config.THUMBNAIL_FILE
-        skvideo.io.vwrite(str(thumbnail_path), frame)
+    # fetch the video from the cold storage, if it has been archived
+    storage.ensure_local(filename)
+    if video_hash is not None and not os.path.exists(filename):
+        print("Linking video %s at %s" % (video_hash, filename))
+        content_store.link_video(video_hash, filename)
+    elif video is not None:
+        print("Saving video at %s" % filename)
+        with checkpoints.atomic_output(filename) as tmp:
+            with open(tmp, 'wb') as file:
+                file.write(video)
+
+    # save thumbnail and retrieve the fps and the length from the video
+    set_stage('thumbnail')
+    thumbnail_path = job_cache_dir / Config.THUMBNAIL_FILE
+    info_path = job_cache_dir / Config.VIDEO_INFO_FILE
+    if not checkpoints.is_fresh([thumbnail_path, info_path], [filename]) or \
+            "frames" not in checkpoints.read_json(info_path):
+        videogen = skvideo.io.FFmpegReader(filename)
+        for frame in videogen.nextFrame():
+            with checkpoints.atomic_output(thumbnail_path) as tmp:
+                skvideo.io.vwrite(tmp, frame)
+            break
         videogen.close()
-        break
-
-    # retrieve the fps from the video
-    fps = videogen.inputfps
+        fps = videogen.inputfps
+        checkpoints.write_json(info_path, {
+            "fps": fps,
+            "duration": videogen.inputframenum / float(fps) if fps else None,
+            "frames": videogen.inputframenum,
+            "width": videogen.inputwidth,
+            "height": videogen.inputheight
+        })
+    info = checkpoints.read_json(info_path)
+
+    # downscale the video and reduce the frame rate for the analysis, the bvh files are exported with this frame rate
+    analysed_path = job_cache_dir / Config.ANALYSED_VIDEO_FILE
+    video_format = transcoding.target_format(info["width"], info["height"], info["fps"], quality)
+    if video_format is None:
+        if analysed_path.exists():
+            os.remove(analysed_path)
+    elif info.get("analysed") != video_format or not checkpoints.is_fresh([analysed_path], [filename]):
+        set_stage('transcoding')
+        print("Transcoding video to %dx%d at %.2f fps" % (video_format["width"], video_format["height"],
+                                                        video_format["fps"]))
+        with metrics.measure("transcode", job=my_job_id, frames=info["frames"], bytes=os.path.getsize(filename)), \
+                checkpoints.atomic_output(analysed_path) as tmp:
+            transcoding.transcode(filename, tmp, video_format)
+        info["analysed"] = video_format
+        checkpoints.write_json(info_path, info)
 
     # result
-    result = model.get_result_by_id(my_job_id)
-    result.result_code = model.ResultCode.pending
-    model.db.session.commit()
+    update_result(my_job_id, result_code=model.ResultCode.pending)
+    return video_format["fps"] if video_format else info["fps"], info["duration"]
 
-    result_cache_dir = Path(os.path.join(job_cache_dir, Config.RESULT_DIR))
 
-    if not result_cache_dir.exists():
-        os.makedirs(result_cache_dir)
+class UploadBody(io.BytesIO):
+    """
+    request body, which records when it has been read completely by the http client
+    """
+    sent_at = None
 
-    # get specific file locations
-    pose2d_file = result_cache_dir / Config.DATA_2D_FILE
-    pose3d_file = result_cache_dir / Config.DATA_3D_FILE
-    # create a thumbnail
-    job.meta['stage'] = {'name': 'thumbnail'}
-    job.save_meta()
+    def read(self, *args):
+        data = super().read(*args)
+        if not data and self.sent_at is None:
+            self.sent_at = time.perf_counter()
+        return data
 
-    pose3d_world = None
-    points_list = None
-    job.meta['stage'] = {'name': '2d', 'progress': 0}
-    job.save_meta()
 
-    return job, job_id, model, job_cache_dir, pose2d_file, pose3d_file, thumbnail_path, filename, result, \
-           result_cache_dir, fps
+def wait_for_xnect(job_id):
+    """
+    wait until xnect has finished the analysis of a video
+    :param job_id: id of the video at xnect
+    :return: True if the outputs are complete, False if the analysis failed
+    """
+    while True:
+        r = requests.get("%s/%s" % (Config.XNECT_URL, job_id))
+        # xnect forgets a video when its analysis fails
+        if r.status_code != 200:
+            return False
+        if r.json().get("status"):
+            return True
+        print("Not yet finished...")
+        time.sleep(1)
 
 
-def analyse_xnect(video, job_id, result_cache_dir, result, model):
+def analyse_xnect(video, job_id, result_cache_dir, frames=None):
     """
     analyse a video file in xnect container
     :param video: video as byte data
     :param job_id: redis job id
     :param result_cache_dir: cache dir of the current job
-    :param result: current result from model
-    :param model: model reference to database
+    :param frames: analyse only the first frames, None analyses the whole video
     :return: paths to raw xnect data, or false, if failed
     """
     try:
         # send the video to xnect via http post request
-        files = {"video": ("video.mp4", video, "video/mp4")}
-        r = requests.post("http://xnect:8081/%s" % str(job_id), files=files, timeout=999999)
-        if r.status_code != 200:
-            result.result_code = model.ResultCode.failure
-            model.db.session.commit()
+        fields = {"video": ("video.mp4", video, "video/mp4")}
+        if frames:
+            fields["frames"] = str(frames)
+        body, content_type = encode_multipart_formdata(fields)
+        body = UploadBody(body)
+        start = time.perf_counter()
+        r = requests.post("%s/%s" % (Config.XNECT_URL, job_id), data=body, headers={"Content-Type": content_type},
+                          timeout=999999)
+        end = time.perf_counter()
+        # the response is sent after the analysis, the upload ends when the body has been read completely
+        sent = body.sent_at or end
+        metrics.observe("xnect_upload", sent - start, job=job_id, bytes=len(video))
+        metrics.observe("xnect_analysis", end - sent, job=job_id)
+        if r.status_code not in (200, 409):
+            return False
+        # the post request returns when xnect has finished. On a conflict, the video has been analysed by an earlier
+        # attempt or is still being analysed, the status of this video is polled until its outputs are complete
+        if (r.status_code == 409 or r.json().get("message") != "success") and not wait_for_xnect(job_id):
             return False
-        finished = False
-        # check via get request, if the job has finished yet
-        while not finished:
-            r = requests.get("http://xnect:8081/finished")
-            finished = r.json()['finished']
-            print("Not yet finished...")
-            time.sleep(1)
         # get the data for following urls:
-        urls = ["raw2d", "raw3d", "ik3d"]
-        paths = {}
-        for url in urls:
-            # save data for the urls
-            r = requests.get("http://xnect:8081/%s/%s" % (str(job_id), url))
-            path = os.path.join(result_cache_dir, "%s.txt" % url)
-            open(path, 'wb').write(r.content)
-            if os.path.getsize(path) <= 1:
-                result.result_code = model.ResultCode.failure
-                model.db.session.commit()
+        paths = xnect_output_paths(result_cache_dir)
+        for url, path in paths.items():
+            # save data for the urls and store it compressed
+            with metrics.measure("xnect_fetch", job=job_id) as measurement:
+                r = requests.get("%s/%s/%s" % (Config.XNECT_URL, job_id, url))
+                measurement["bytes"] = len(r.content)
+            if r.status_code != 200 or len(r.content) <= 1:
                 return False
-            paths[url] = path
+            txt_path = os.path.join(result_cache_dir, "%s.txt" % url)
+            with open(txt_path, 'wb') as file:
+                file.write(r.content)
+            compress_xnect_output(txt_path, path)
         return paths
     except:
-        # set failure, if an error occurs
-        result.result_code = model.ResultCode.failure
-        model.db.session.commit()
+        # failure, if an error occurs
         return False
 
 
@@ -147,53 +287,493 @@ def interpolate_poses(pred, start, end):
     print("Found one", start_data)
 
 
-def convert_xnect(my_job_id, video):
+def convert_xnect(my_job_id, video=None, video_hash=None, priority=None, backend=None, quality=None, preview=False):
     """
-    Sends a video with a given redis id to xnect
-    :param my_job_id: redis id
-    :param video: video as bytecode
-    :return:
+    Ingest stage and entry point of the conversion: stores the video and schedules the inference in xnect or the
+    lifting on the cpu. The priority of the following stages is estimated by the length of the video.
+    :param my_job_id: database id of the job
+    :param video: video as bytecode, or None to resume a job with an already stored video
+    :param video_hash: hash of the video in the content store
+    :param priority: priority of this stage
+    :param backend: pose estimation backend (see Config.BACKENDS) or "auto" (default: Config.DEFAULT_BACKEND)
+    :param quality: quality tier of the analysis (default: Config.DEFAULT_QUALITY)
+    :param preview: analyse the start of the video in the preview stage first (see preview_xnect)
+    :return: if the following stage was scheduled
+    """
+    fps, duration = prepare(my_job_id, video, video_hash, quality)
+    connection = get_current_job().connection
+    backend = scheduling.select_backend(connection, backend)
+    if preview:
+        preview_dir = job_dirs(my_job_id)[0] / Config.PREVIEW_DIR
+        if backend != "xnect":
+            write_preview(preview_dir, "skipped", message="Previews are analysed by xnect only")
+        elif not fps or not duration or duration <= Config.PREVIEW_SECONDS:
+            write_preview(preview_dir, "skipped", message="The video is not longer than the preview")
+        elif reuse_xnect_outputs(my_job_id, video_hash, quality):
+            write_preview(preview_dir, "skipped", message="The video has been analysed before")
+        else:
+            scheduling.enqueue_stage(connection, "preview", preview_xnect, my_job_id, Config.PREVIEW_PRIORITY,
+                                     fps=fps, duration=duration, video_hash=video_hash, quality=quality)
+            return True
+    return schedule_analysis(connection, my_job_id, fps, duration, backend, video_hash, quality)
+
+
+def schedule_analysis(connection, my_job_id, fps, duration, backend, video_hash=None, quality=None):
+    """
+    schedule the analysis of the whole video: the inference in xnect (split into segments for long videos) or the
+    lifting on the cpu
+    :param connection: redis connection
+    :param my_job_id: database id of the job
+    :param fps: frame rate of the analysed video
+    :param duration: length of the video in seconds
+    :param backend: pose estimation backend, xnect or lifting
+    :param video_hash: hash of the video in the content store
+    :param quality: quality tier of the job
+    :return: if the following stage was scheduled
+    """
+    priority = scheduling.priority_for_duration(duration)
+    if backend == "lifting":
+        scheduling.enqueue_stage(connection, "lifting", lift_poses, my_job_id, priority, fps=fps)
+        return True
+    segment_plan = plan_segments(my_job_id, fps, duration, video_hash, quality)
+    if segment_plan is None:
+        scheduling.enqueue_stage(connection, "inference", infer_xnect, my_job_id, priority, fps=fps,
+                                 video_hash=video_hash, quality=quality)
+        return True
+    # analyse the segments in parallel, the last finished segment schedules the export
+    scheduling.start_parts(connection, my_job_id, len(segment_plan))
+    for part in range(len(segment_plan)):
+        scheduling.enqueue_stage(connection, "inference", infer_segment, my_job_id, priority, part=part, fps=fps,
+                                 video_hash=video_hash, quality=quality)
+    return True
+
+
+def preview_xnect(my_job_id, fps, duration, video_hash=None, priority=None, quality=None):
+    """
+    Preview stage: analyses the first Config.PREVIEW_SECONDS of the video with xnect and exports preview bvh files
+    into Config.PREVIEW_DIR, so the user knows within seconds if the video is usable. The full analysis is scheduled
+    if people are found; otherwise the job fails without analysing the whole video.
+    :param my_job_id: database id of the job
+    :param fps: frame rate of the analysed video
+    :param duration: length of the video in seconds
+    :param video_hash: hash of the video in the content store
+    :param priority: priority of this stage
+    :param quality: quality tier of the job
+    :return: if the full analysis was scheduled
+    """
+    from project.model import model
+    set_stage('preview')
+    job_cache_dir, _ = job_dirs(my_job_id)
+    preview_dir = job_cache_dir / Config.PREVIEW_DIR
+    os.makedirs(preview_dir, exist_ok=True)
+    source = analysed_video(job_cache_dir)
+    frames = max(1, int(round(Config.PREVIEW_SECONDS * fps)))
+    clip = preview_dir / Config.SOURCE_VIDEO_FILE
+    if not checkpoints.is_fresh([clip], [source]):
+        with metrics.measure("preview_cut", job=my_job_id, frames=frames), checkpoints.atomic_output(clip) as tmp:
+            transcoding.extract_frames(source, tmp, 0, fps, frames)
+    paths = xnect_output_paths(preview_dir)
+    if not checkpoints.is_fresh(paths.values(), [clip]):
+        with open(clip, 'rb') as file:
+            video = file.read()
+        # xnect stops after the frames of the preview, even if the cut is a little longer
+        if analyse_xnect(video, "%s-preview" % my_job_id, preview_dir, frames) is False:
+            # xnect returns no outputs if nobody is detected
+            write_preview(preview_dir, "failure", message="Nobody was detected or the preview could not be analysed")
+            update_result(my_job_id, result_code=model.ResultCode.failure)
+            return False
+    tracks = track_outputs(my_job_id, preview_dir)
+    if not tracks:
+        # the whole video is not analysed, if nobody is found at its start
+        write_preview(preview_dir, "failure", people=0, seconds=frames / float(fps),
+                      message="Nobody was detected in the first %g seconds" % Config.PREVIEW_SECONDS)
+        update_result(my_job_id, result_code=model.ResultCode.failure)
+        return False
+    export_tracks(my_job_id, preview_dir, tracks, fps)
+    write_preview(preview_dir, "success", people=len(tracks), seconds=frames / float(fps))
+    return schedule_analysis(get_current_job().connection, my_job_id, fps, duration, "xnect", video_hash, quality)
+
+
+def write_preview(preview_dir, status, **values):
+    """
+    store the outcome of the preview, it is served by the api (/api/v1/jobs/<id>/preview)
+    :param preview_dir: preview dir of the job
+    :param status: success, failure or skipped
+    :param values: people, seconds and message
+    """
+    os.makedirs(preview_dir, exist_ok=True)
+    checkpoints.write_json(preview_dir / Config.PREVIEW_FILE, dict(values, status=status))
+
+
+def output_variant(source, quality):
+    """
+    :param source: path of the analysed video
+    :param quality: quality tier of the job
+    :return: variant of the stored xnect outputs in the content store, outputs of the source video have none
+    """
+    if source.endswith(Config.ANALYSED_VIDEO_FILE):
+        return quality or Config.DEFAULT_QUALITY
+    return None
+
+
+def reuse_xnect_outputs(my_job_id, video_hash=None, quality=None):
+    """
+    check if the raw xnect outputs (or the tracked poses) of a job exist already or can be linked from another job
+    with the same video
+    :param my_job_id: database id of the job
+    :param video_hash: hash of the video in the content store
+    :param quality: quality tier of the job
+    :return: True, if the analysis can be skipped
+    """
+    job_cache_dir, result_cache_dir = job_dirs(my_job_id)
+    source = analysed_video(job_cache_dir)
+    paths = xnect_output_paths(result_cache_dir)
+    tracking_files = [result_cache_dir / Config.DATA_3D_FILE, result_cache_dir / Config.TRACKING_FILE]
+    if checkpoints.is_fresh(paths.values(), [source]):
+        print("Skipping xnect, outputs exist")
+    elif checkpoints.is_fresh(tracking_files, [source]):
+        # the raw outputs have been dropped after the export, the tracked poses are still there
+        print("Skipping xnect, tracked poses exist")
+    elif video_hash is not None and content_store.link_outputs(video_hash, paths, output_variant(source, quality)):
+        print("Skipping xnect, video %s has been analysed before" % video_hash)
+    else:
+        return False
+    return True
+
+
+def segment_dir(job_cache_dir, segment):
+    """
+    :return: directory of the video and the raw xnect outputs of a segment
+    """
+    return job_cache_dir / Config.SEGMENTS_DIR / ("%d_%d" % (segment["start"], segment["frames"]))
+
+
+def plan_segments(my_job_id, fps, duration, video_hash=None, quality=None):
+    """
+    split a long video into overlapping segments, one per slot of xnect (see Config.SEGMENT_MIN_DURATION)
+    :param my_job_id: database id of the job
+    :param fps: frame rate of the analysed video
+    :param duration: length of the video in seconds
+    :param video_hash: hash of the video in the content store
+    :param quality: quality tier of the job
+    :return: list of segments, or None if the video is not split
+    """
+    if Config.SEGMENT_MIN_DURATION is None or not duration or not fps or duration <= Config.SEGMENT_MIN_DURATION:
+        return None
+    # xnect analyses one segment per slot at a time, a single slot gains nothing from splitting
+    if Config.XNECT_SLOTS < 2 or reuse_xnect_outputs(my_job_id, video_hash, quality):
+        return None
+    job_cache_dir, result_cache_dir = job_dirs(my_job_id)
+    num_frames, overlap = int(math.ceil(duration * fps)), int(round(Config.SEGMENT_OVERLAP * fps))
+    length = segments.parallel_length(num_frames, Config.XNECT_SLOTS, overlap)
+    segment_plan = segments.plan(num_frames, max(length, int(round(Config.SEGMENT_DURATION * fps))), overlap)
+    os.makedirs(job_cache_dir / Config.SEGMENTS_DIR, exist_ok=True)
+    checkpoints.write_json(job_cache_dir / Config.SEGMENTS_DIR / Config.SEGMENTS_FILE, segment_plan)
+    print("Splitting video into %d segments" % len(segment_plan))
+    return segment_plan
+
+
+def infer_segment(my_job_id, part, fps, video_hash=None, priority=None, quality=None):
+    """
+    Inference stage of one segment of a long video: cuts the segment and sends it to xnect. The last finished
+    segment stitches the outputs of all segments and schedules the export.
+    :param my_job_id: database id of the job
+    :param part: index of the segment
+    :param fps: frame rate of the analysed video
+    :param video_hash: hash of the video in the content store
+    :param priority: priority of the job
+    :param quality: quality tier of the job
+    :return: if the segment was analysed successfully
+    """
+    from project.model import model
+    set_stage('xnect')
+    job_cache_dir, result_cache_dir = job_dirs(my_job_id)
+    source = analysed_video(job_cache_dir)
+    segment_plan = checkpoints.read_json(job_cache_dir / Config.SEGMENTS_DIR / Config.SEGMENTS_FILE)
+    segment = segment_plan[part]
+    directory = segment_dir(job_cache_dir, segment)
+    os.makedirs(directory, exist_ok=True)
+    segment_video = directory / Config.SOURCE_VIDEO_FILE
+    if not checkpoints.is_fresh([segment_video], [source]):
+        # the last segment is cut until the end, the number of frames of the plan is estimated by the length
+        count = segment["frames"] if part + 1 < len(segment_plan) else None
+        with metrics.measure("segment_cut", job=my_job_id, frames=segment["frames"]), \
+                checkpoints.atomic_output(segment_video) as tmp:
+            transcoding.extract_frames(source, tmp, segment["start"], fps, count)
+    paths = xnect_output_paths(directory)
+    if not checkpoints.is_fresh(paths.values(), [segment_video]):
+        with open(segment_video, 'rb') as file:
+            video = file.read()
+        if analyse_xnect(video, "%s-%s" % (my_job_id, directory.name), directory) is False:
+            update_result(my_job_id, result_code=model.ResultCode.failure)
+            return False
+
+    connection = get_current_job().connection
+    if not scheduling.finish_part(connection, my_job_id, part):
+        return True
+    set_stage('stitching')
+    paths = xnect_output_paths(result_cache_dir)
+    parts = [dict(segment, paths=xnect_output_paths(segment_dir(job_cache_dir, segment))) for segment in segment_plan]
+    num_frames = segment_plan[-1]["start"] + segment_plan[-1]["frames"]
+    with ExitStack() as stack:
+        tmp_paths = {name: stack.enter_context(checkpoints.atomic_output(path)) for name, path in paths.items()}
+        with metrics.measure("stitching", job=my_job_id, frames=num_frames) as measurement:
+            num_people = segments.stitch(parts, tmp_paths, Config.SEGMENT_MATCH_DISTANCE)
+            measurement["people"] = num_people
+    print("Stitched %d segments with %d people" % (len(parts), num_people))
+    if video_hash is not None:
+        content_store.publish_outputs(video_hash, paths, output_variant(source, quality))
+    shutil.rmtree(job_cache_dir / Config.SEGMENTS_DIR)
+    scheduling.enqueue_stage(connection, "export", export_bvh, my_job_id, priority, fps=fps)
+    return True
+
+
+def infer_xnect(my_job_id, fps, video_hash=None, priority=None, quality=None):
     """
-    # prepare the video
-    job, job_id, model, job_cache_dir, pose2d_file, pose3d_file, thumbnail_path, filename, result, result_cache_dir, \
-    fps = prepare(my_job_id, video)
+    Inference stage: sends the video of a job to xnect and stores the raw xnect outputs.
+    If the same video has been analysed before, the stored outputs are linked instead.
+    :param my_job_id: database id of the job
+    :param fps: frame rate of the video
+    :param video_hash: hash of the video in the content store
+    :param priority: priority of the job
+    :param quality: quality tier of the analysis, the stored outputs of a video are kept per quality tier
+    :return: if the following stage was scheduled
+    """
+    from project.model import model
     # set the progress to indeterminate
-    job.meta['stage'] = {'name': 'xnect', 'progress': None}
-    # analyse the actual video
-    paths = analyse_xnect(video, str(my_job_id), result_cache_dir, result, model)
-    if paths is False:
-        # there is no data, so return
-        result.result_code = model.ResultCode.failure
+    set_stage('xnect')
+    job_cache_dir, result_cache_dir = job_dirs(my_job_id)
+    source = analysed_video(job_cache_dir)
+    if not reuse_xnect_outputs(my_job_id, video_hash, quality):
+        with open(source, 'rb') as file:
+            video = file.read()
+        # analyse the actual video, no database connection is held while waiting for xnect
+        paths = analyse_xnect(video, str(my_job_id), result_cache_dir)
+        if paths is False:
+            # there is no data, so return
+            update_result(my_job_id, result_code=model.ResultCode.failure)
+            return False
+        if video_hash is not None:
+            content_store.publish_outputs(video_hash, paths, output_variant(source, quality))
+    scheduling.enqueue_stage(get_current_job().connection, "export", export_bvh, my_job_id, priority, fps=fps)
+    return True
+
+
+def export_bvh(my_job_id, fps, priority=None):
+    """
+    Export stage: tracks the people in the raw xnect outputs and exports one bvh file per track. Every track has its
+    own start frame, the time offsets of the bvh files are stored in Config.TRACKS_FILE.
+    :param my_job_id: database id of the job
+    :param fps: frame rate of the video
+    :param priority: priority of the job
+    :return: if the export was successful
+    """
+    from project.model import model
+    job_cache_dir, result_cache_dir = job_dirs(my_job_id)
+    paths = xnect_output_paths(result_cache_dir)
+    # jobs from older versions only have the text outputs
+    for url, path in paths.items():
+        txt_path = os.path.join(result_cache_dir, "%s.txt" % url)
+        if not os.path.exists(path) and os.path.exists(txt_path):
+            compress_xnect_output(txt_path, path)
+
+    # convert the data, the tracked poses are stored as a checkpoint
+    set_stage('tracking')
+    tracks = track_outputs(my_job_id, result_cache_dir)
+    num_people = len(tracks)
+    if num_people == 0:
+        # there is no person in the video
+        update_result(my_job_id, result_code=model.ResultCode.failure)
+        return False
+
+    set_stage('bvh')
+    export_tracks(my_job_id, result_cache_dir, tracks, fps)
+
+    if Config.STORAGE_DROP_XNECT_RAW:
+        storage.drop_xnect_raw(result_cache_dir)
+    update_result(my_job_id, result_code=model.ResultCode.success, max_people=num_people)
+    if Config.FILTER_PRESETS:
+        scheduling.enqueue_stage(get_current_job().connection, "filter", filter_presets, my_job_id, priority,
+                                 num_people=num_people)
+    return True
+
+
+def track_outputs(my_job_id, result_dir):
+    """
+    track the people in the compressed raw xnect outputs of a result dir, the tracked poses are stored as a checkpoint
+    :param my_job_id: database id of the job
+    :param result_dir: result dir (or preview dir) of the job
+    :return: tracks of the checkpoint (see load_tracking)
+    """
+    paths = xnect_output_paths(result_dir)
+    tracking_files = [result_dir / Config.DATA_3D_FILE, result_dir / Config.TRACKING_FILE]
+    if not checkpoints.is_fresh(tracking_files, paths.values()):
+        manager = tracking.TrackManager(Config.TRACK_MAX_DISTANCE, Config.TRACK_MAX_MISSED, Config.TRACK_MIN_LENGTH,
+                                        Config.TRACK_OUTLIER_FACTOR, Config.TRACK_MAX_OUTLIERS)
+        with metrics.measure("tracking", job=my_job_id) as measurement:
+            archive = pose_store.PoseArchive(paths["ik3d"])
+            tracks = tracking.track_archive(archive, manager)
+            measurement.update(frames=archive.num_frames, people=len(tracks))
+        save_tracking(result_dir, tracks)
+    return load_tracking(result_dir)
+
+
+def export_tracks(my_job_id, result_dir, tracks, fps):
+    """
+    export one bvh file per track and the time offsets of the bvh files into a result dir
+    :param my_job_id: database id of the job
+    :param result_dir: result dir (or preview dir) of the job
+    :param tracks: tracks of the checkpoint
+    :param fps: frame rate of the video
+    """
+    tracking_files = [result_dir / Config.DATA_3D_FILE, result_dir / Config.TRACKING_FILE]
+    bvh_files = [result_dir / (Config.OUTPUT_BVH_FILE_RAW_NUMBERED % (i + 1)) for i in range(len(tracks))]
+    if checkpoints.is_fresh(bvh_files + [result_dir / Config.TRACKS_FILE], tracking_files):
+        return
+    skel = muco_skeleton()
+    for i, track in enumerate(tracks):
+        print("Saving bvh nr.", i)
+        # raw file, the poses are converted to meters
+        with metrics.measure("bvh_export", job=my_job_id, frames=len(track["poses"])), \
+                checkpoints.atomic_output(bvh_files[i]) as tmp:
+            skel.poses2bvh(track["poses"] * 0.01, output_file=tmp, frame_rate=fps)
+    checkpoints.write_json(result_dir / Config.TRACKS_FILE, tracks_info(tracks, fps))
+
+
+def lift_poses(my_job_id, fps, priority=None):
+    """
+    Lifting stage: cpu alternative to the inference and export stages. Estimates the 2d poses with OpenPose,
+    lifts them to 3d (see project/lifting.py) and exports one bvh file per person.
+    :param my_job_id: database id of the job
+    :param fps: frame rate of the video
+    :param priority: priority of the job
+    :return: if the export was successful
+    """
+    from project.model import model
+    job_cache_dir, result_cache_dir = job_dirs(my_job_id)
+    source = analysed_video(job_cache_dir)
+    tracks_path = result_cache_dir / Config.DATA_2D_FILE
+    width, height = lifting.video_size(source)
+
+    # the 2d tracks are stored as a checkpoint
+    set_stage('pose_2d')
+    if not checkpoints.is_fresh([tracks_path], [source]):
+        with metrics.measure("pose_2d", job=my_job_id) as measurement:
+            tracks = lifting.track_people(lifting.estimate_2d(source), width, height)
+            measurement.update(frames=tracks.shape[1] if len(tracks) else 0, people=len(tracks))
+        with checkpoints.atomic_output(tracks_path) as tmp:
+            np.save(tmp, tracks)
+    tracks = np.load(str(tracks_path))
+    num_people = len(tracks)
+    if num_people == 0:
+        update_result(my_job_id, result_code=model.ResultCode.failure)
         return False
 
-    # convert the data
-    raw2d, raw3d, ik3d = paths["raw2d"], paths["raw3d"], paths["ik3d"]
-    pred, first_complete, num_people = xnect_to_bvh(raw2d, raw3d, ik3d, result, model)
+    set_stage('bvh')
+    bvh_files = [result_cache_dir / (Config.OUTPUT_BVH_FILE_RAW_NUMBERED % (i + 1)) for i in range(num_people)]
+    if not checkpoints.is_fresh(bvh_files, [tracks_path]):
+        skel = lifting.skeleton()
+        with metrics.measure("lifting", job=my_job_id, frames=tracks.shape[1], people=num_people):
+            poses_3d = lifting.lift(tracks, width, height)
+        for i, poses in enumerate(poses_3d):
+            print("Saving bvh nr.", i)
+            with metrics.measure("bvh_export", job=my_job_id, frames=len(poses)), \
+                    checkpoints.atomic_output(bvh_files[i]) as tmp:
+                skel.poses2bvh(poses, output_file=tmp, frame_rate=fps)
+
+    update_result(my_job_id, result_code=model.ResultCode.success, max_people=num_people)
+    if Config.FILTER_PRESETS:
+        scheduling.enqueue_stage(get_current_job().connection, "filter", filter_presets, my_job_id, priority,
+                                 num_people=num_people)
+    return True
+
+
+def save_tracking(result_cache_dir, tracks):
+    """
+    store the tracks as checkpoint: the poses of all tracks are concatenated
+    :param result_cache_dir: result dir of the job
+    :param tracks: tracks of the TrackManager
+    """
+    with checkpoints.atomic_output(result_cache_dir / Config.DATA_3D_FILE) as tmp:
+        np.save(tmp, np.concatenate([track.poses for track in tracks]).astype(np.float32) if tracks else
+                np.zeros([0, 21, 3], dtype=np.float32))
+    with checkpoints.atomic_output(result_cache_dir / Config.TRACKING_FILE) as tmp:
+        np.savez(tmp,
+                 starts=np.array([track.start for track in tracks], dtype=np.int64),
+                 lengths=np.array([len(track.poses) for track in tracks], dtype=np.int64),
+                 valid=np.concatenate([track.valid for track in tracks] or [[]]).astype(bool),
+                 is_outlier=np.concatenate([track.is_outlier for track in tracks] or [[]]).astype(bool))
+
+
+def load_tracking(result_cache_dir):
+    """
+    load the tracks checkpoint
+    :param result_cache_dir: result dir of the job
+    :return: list of tracks {"start", "poses" (frames x 21 x 3), "valid", "is_outlier"} ordered by start frame
+    """
+    poses = np.load(str(result_cache_dir / Config.DATA_3D_FILE))
+    with np.load(str(result_cache_dir / Config.TRACKING_FILE)) as checkpoint:
+        if "first_complete" in checkpoint.files:
+            # checkpoint of older versions: all people from the first complete keyframe on
+            keypoints = tracked_keypoints(poses, checkpoint["valid_ik"], checkpoint["is_outlier"],
+                                          int(checkpoint["first_complete"]))
+            start = int(checkpoint["first_complete"])
+            return [{"start": start, "poses": np.array(k) / 0.01, "valid": np.ones(len(k), dtype=bool),
+                     "is_outlier": np.zeros(len(k), dtype=bool)} for k in keypoints if len(k)]
+        offsets = np.concatenate([[0], np.cumsum(checkpoint["lengths"])])
+        return [{"start": int(start), "poses": poses[offsets[i]:offsets[i + 1]],
+                 "valid": checkpoint["valid"][offsets[i]:offsets[i + 1]],
+                 "is_outlier": checkpoint["is_outlier"][offsets[i]:offsets[i + 1]]}
+                for i, start in enumerate(checkpoint["starts"])]
+
+
+def tracks_info(tracks, fps):
+    """
+    :param tracks: tracks of the checkpoint
+    :param fps: frame rate of the bvh files
+    :return: time offsets of the bvh files by person
+    """
+    return [{"person": i + 1,
+             "start_frame": track["start"],
+             "end_frame": track["start"] + len(track["poses"]) - 1,
+             "start_time": track["start"] / float(fps) if fps else 0.0,
+             "duration": len(track["poses"]) / float(fps) if fps else None}
+            for i, track in enumerate(tracks)]
+
 
+def tracked_keypoints(ik3d, valid_ik, is_outlier, first_complete):
+    """
+    get the keypoints of every person from the first complete keyframe on (checkpoints of older versions).
+    Invalid frames and outliers are replaced by the last valid keyframe.
+    :return: list of keypoints (in meters) by person
+    """
     keypoints = []
     last_cached_index = -1
-    for pidx in range(num_people):
+    for pidx in range(ik3d.shape[1]):
         person_keypoints = []
-        for idx in range(first_complete, len(pred)):
-            if pred[idx]['valid_ik'][pidx] and not pred[idx]['is_outlier'][pidx]:
-                person_keypoints.append(pred[idx]["ik3d"][pidx] * 0.01)
+        for idx in range(first_complete, len(ik3d)):
+            if valid_ik[idx][pidx] and not is_outlier[idx][pidx]:
+                person_keypoints.append(ik3d[idx][pidx] * 0.01)
                 last_cached_index = idx
             else:
                 if last_cached_index > -1:
-                    person_keypoints.append(pred[last_cached_index]["ik3d"][pidx] * 0.01)
+                    person_keypoints.append(ik3d[last_cached_index][pidx] * 0.01)
         keypoints.append(person_keypoints)
+    return keypoints
 
-    # interpolation via scipy
-    for i in range(len(keypoints)):
-        print("Saving bvh nr.", i)
-        skel = muco_3dhp_skeleton.Muco3DHPSkeleton()
-        raw = result_cache_dir / (Config.OUTPUT_BVH_FILE_RAW_NUMBERED % (i + 1))
-        # raw file
-        channels, header = skel.poses2bvh(np.array(keypoints[i]), output_file=raw, frame_rate=fps)
-
-    result.result_code = model.ResultCode.success
-    result.max_people = num_people
-    model.db.session.commit()
+
+def filter_presets(my_job_id, num_people, priority=None):
+    """
+    Filter stage: calculates the filtered bvh files of all people for the configured filter presets
+    :param my_job_id: database id of the job
+    :param num_people: number of exported people
+    :param priority: priority of the job
+    """
+    set_stage('filter')
+    for border, u0 in Config.FILTER_PRESETS:
+        with metrics.measure("filter", job=my_job_id, people=num_people):
+            for nr in range(1, num_people + 1):
+                filter_bvh(my_job_id, border, u0, nr)
     return True
 
 
@@ -314,24 +894,37 @@ def readjust_person_index_ik3d(pred, max_people):
     return first_complete
 
 
-def xnect_to_bvh(raw2d_file, raw3d_file, ik3d_file, result, model):
+def xnect_to_bvh(raw2d_file, raw3d_file, ik3d_file):
     """
     converts the xnect data to a bvh file
-    :param raw2d_file: raw 2d data from xnect
-    :param raw3d_file: raw 3d data from xnect
-    :param ik3d_file: raw 3d data (ik) from xnect
-    :param result: result object from model
-    :param model: model to the database
-    :return: sorted array, first complete keyframe and number of people
+    :param raw2d_file: raw 2d data from xnect (.npz or .txt)
+    :param raw3d_file: raw 3d data from xnect (.npz or .txt)
+    :param ik3d_file: raw 3d data (ik) from xnect (.npz or .txt)
+    :return: sorted array, first complete keyframe and number of people, or False if there is no data
+    """
+    predictions = load_xnect_predictions(raw2d_file, raw3d_file, ik3d_file)
+    if predictions is False:
+        return False
+    pred, num_people = predictions
+    print("Readjusting person index ik3d")
+    first_complete = readjust_person_index_ik3d(pred, num_people)
+    return pred, first_complete, num_people
+
+
+def load_xnect_predictions(raw2d_file, raw3d_file, ik3d_file):
+    """
+    load the xnect data into a prediction array with one dictionary per frame, the person indices are not sorted yet
+    :param raw2d_file: raw 2d data from xnect (.npz or .txt)
+    :param raw3d_file: raw 3d data from xnect (.npz or .txt)
+    :param ik3d_file: raw 3d data (ik) from xnect (.npz or .txt)
+    :return: prediction array and number of people, or False if there is no data
     """
     # load the files as a numpy array
-    p2d = np.loadtxt(raw2d_file)
-    p3d = np.loadtxt(raw3d_file)
-    i3d = np.loadtxt(ik3d_file)
+    p2d = pose_store.load_rows(raw2d_file)
+    p3d = pose_store.load_rows(raw3d_file)
+    i3d = pose_store.load_rows(ik3d_file)
     # if there is no data, abort the execution and set the result to failed
     if len(i3d) == 0:
-        result.result_code = model.ResultCode.failure
-        model.db.session.commit()
         return False
     num_people = int(np.max(p2d.T[1]) + 1)
     print(num_people)
@@ -379,6 +972,4 @@ def xnect_to_bvh(raw2d_file, raw3d_file, ik3d_file, result, model):
             origin = tmp[13] - direction_vector * .5
         pred[idx]["ik3d"][pidx] = tmp - origin
         pred[idx]["valid_ik"][pidx] = True
-    print("Readjusting person index ik3d")
-    first_complete = readjust_person_index_ik3d(pred, num_people)
-    return pred, first_complete, num_people
+    return pred, num_people
@@ -0,0 +1,187 @@
+"""
+LIFTING : CPU backend for the pose estimation, used instead of xnect if the gpu container is busy.
+The 2d poses are estimated with OpenPose, tracked over the video and lifted to 3d per person with the temporal
+video2bvh model, which processes the whole keypoint array of a person in one batch.
+"""
+import os
+
+import numpy as np
+import skvideo.io
+from video2bvh.bvh_skeleton import h36m_skeleton, cmu_skeleton, openpose_skeleton
+from video2bvh.utils import camera
+
+from project.config import Config
+
+# the models are loaded once per worker process
+_estimator_2d = None
+_estimator_3d = None
+_skeletons = {}
+
+
+def get_estimator_2d():
+    """
+    :return: the OpenPose estimator
+    """
+    global _estimator_2d
+    if _estimator_2d is None:
+        # optional dependency, pyopenpose is only needed on workers handling the lifting stage
+        from video2bvh.pose_estimator_2d import openpose_estimator
+        _estimator_2d = openpose_estimator.OpenPoseEstimator(model_folder=Config.OPENPOSE_MODELS_PATH)
+    return _estimator_2d
+
+
+def get_estimator_3d():
+    """
+    :return: the 3d lifting model
+    """
+    global _estimator_3d
+    if _estimator_3d is None:
+        # the model framework is only imported by workers handling the lifting stage
+        from video2bvh.pose_estimator_3d import estimator_3d
+        _estimator_3d = estimator_3d.Estimator3D(
+            config_file=os.path.join(Config.MODELS_3D_DIR, "video_pose.yaml"),
+            checkpoint_file=os.path.join(Config.MODELS_3D_DIR, "best_58.58.pth"))
+    return _estimator_3d
+
+
+def video_size(path):
+    """
+    :param path: path of the video
+    :return: width and height of the video
+    """
+    reader = skvideo.io.FFmpegReader(str(path))
+    reader.close()
+    return reader.inputwidth, reader.inputheight
+
+
+def estimate_2d(path):
+    """
+    estimate the 2d poses of all people in every frame of a video. The frames are decoded and passed to OpenPose
+    in batches of Config.LIFTING_BATCH_FRAMES, so the memory does not grow with the length of the video.
+    :param path: path of the video
+    :return: list with an array (people x 25 x 3) of OpenPose keypoints (x, y, confidence) per frame
+    """
+    estimator = get_estimator_2d()
+    keypoints_list = []
+    batch = []
+    reader = skvideo.io.FFmpegReader(str(path))
+    for frame in reader.nextFrame():
+        # OpenPose expects bgr images
+        batch.append(np.ascontiguousarray(frame[:, :, ::-1]))
+        if len(batch) == Config.LIFTING_BATCH_FRAMES:
+            keypoints_list += estimator.estimate(batch)
+            batch = []
+    reader.close()
+    if batch:
+        keypoints_list += estimator.estimate(batch)
+    num_joints = openpose_skeleton.OpenPoseSkeleton().keypoint_num
+    people = []
+    for keypoints in keypoints_list:
+        # frames without detections are returned as None or as an empty array
+        keypoints = np.zeros([0, num_joints, 3]) if keypoints is None else np.asarray(keypoints, dtype=np.float32)
+        people.append(keypoints.reshape([-1, num_joints, 3]))
+    return people
+
+
+def pose_distance(a, b):
+    """
+    mean distance of the joints detected in both poses
+    :param a: keypoints (joints x 3)
+    :param b: keypoints (joints x 3)
+    :return: distance in pixels, or inf if no joint was detected in both poses
+    """
+    both = (a[:, 2] > 0) & (b[:, 2] > 0)
+    if not both.any():
+        return float('inf')
+    return float(np.mean(np.linalg.norm(a[both, :2] - b[both, :2], axis=1)))
+
+
+def track_people(keypoints_list, width, height):
+    """
+    assign the detections of every frame to tracks by greedily matching them to the last pose of each track
+    :param keypoints_list: output of estimate_2d
+    :param width: width of the video
+    :param height: height of the video
+    :return: array (people x frames x joints x 3) of the longest tracks, missing frames are zero
+    """
+    max_distance = Config.LIFTING_MAX_TRACK_DISTANCE * np.hypot(width, height)
+    last_poses = []
+    frames_by_track = []
+    for idx, detections in enumerate(keypoints_list):
+        pairs = sorted((pose_distance(pose, last), didx, tidx)
+                       for didx, pose in enumerate(detections) for tidx, last in enumerate(last_poses))
+        matched_detections, matched_tracks = set(), set()
+        for distance, didx, tidx in pairs:
+            if distance > max_distance:
+                break
+            if didx in matched_detections or tidx in matched_tracks:
+                continue
+            matched_detections.add(didx)
+            matched_tracks.add(tidx)
+            last_poses[tidx] = detections[didx]
+            frames_by_track[tidx][idx] = detections[didx]
+        for didx, pose in enumerate(detections):
+            if didx not in matched_detections:
+                last_poses.append(pose)
+                frames_by_track.append({idx: pose})
+    # short tracks are usually false detections
+    min_frames = Config.LIFTING_MIN_TRACK_LENGTH * len(keypoints_list)
+    tracks = sorted([frames for frames in frames_by_track if len(frames) >= min_frames], key=len, reverse=True)
+    tracks = tracks[:Config.LIFTING_MAX_PEOPLE]
+    num_joints = keypoints_list[0].shape[1] if keypoints_list else 0
+    result = np.zeros([len(tracks), len(keypoints_list), num_joints, 3], dtype=np.float32)
+    for pidx, frames in enumerate(tracks):
+        for idx, pose in frames.items():
+            result[pidx, idx] = pose
+    return result
+
+
+def fill_missing(track):
+    """
+    interpolate the joints of the frames in which they were not detected, they are held before the first and after
+    the last detection
+    :param track: keypoints of one person (frames x joints x 3)
+    :return: 2d keypoints (frames x joints x 2)
+    """
+    frames = np.arange(len(track))
+    filled = track[:, :, :2].copy()
+    for joint in range(track.shape[1]):
+        detected = track[:, joint, 2] > 0
+        if not detected.any():
+            continue
+        for axis in range(2):
+            filled[:, joint, axis] = np.interp(frames, frames[detected], track[detected, joint, axis])
+    return filled
+
+
+def lift(tracks, width, height):
+    """
+    lift the 2d tracks to 3d poses in world coordinates
+    :param tracks: output of track_people
+    :param width: width of the video
+    :param height: height of the video
+    :return: list of 3d poses (frames x 17 x 3) in the h36m layout by person
+    """
+    estimator = get_estimator_3d()
+    # the lifting model was trained on the h36m cameras, so its extrinsics are used to get world coordinates
+    cam_params = camera.load_camera_params(Config.CAMERA_PARAMS_FILE)["S1"]["55011271"]
+    poses = []
+    for track in tracks:
+        pose3d = estimator.estimate(fill_missing(track), image_width=width, image_height=height)
+        pose3d_world = camera.camera2world(pose=pose3d, R=cam_params["R"], T=0)
+        # put the feet on the ground
+        pose3d_world[:, :, 2] -= np.min(pose3d_world[:, :, 2])
+        poses.append(pose3d_world)
+    return poses
+
+
+def skeleton():
+    """
+    :return: the bvh skeleton of the configured export format
+    """
+    if Config.EXPORT_FORMAT not in _skeletons:
+        if Config.EXPORT_FORMAT == "H36M":
+            _skeletons[Config.EXPORT_FORMAT] = h36m_skeleton.H36mSkeleton()
+        else:
+            _skeletons[Config.EXPORT_FORMAT] = cmu_skeleton.CMUSkeleton()
+    return _skeletons[Config.EXPORT_FORMAT]
@@ -0,0 +1,151 @@
+"""
+METRICS : Prometheus metrics of the web app (request latency and database queries per endpoint) and of the steps of
+the conversion pipeline (duration, frames, people and bytes).
+gunicorn and the rq worker (a process per job or a pool, see worker_pool.py) run several processes, so the metrics
+are collected in the multiprocess mode of prometheus_client if the environment variable prometheus_multiproc_dir
+points to an empty directory that is shared by the processes of a container.
+The web app serves the metrics at /metrics, the worker on its own port.
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, multiprocess, \
+    start_http_server
+from prometheus_client import CONTENT_TYPE_LATEST
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+STEP_SECONDS = Histogram("conversion_step_seconds", "Duration of the steps of the conversion pipeline", ["step"],
+                         buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200, 14400))
+STEP_FRAMES = Histogram("conversion_step_frames", "Frames processed by a step of the conversion pipeline", ["step"],
+                        buckets=(100, 300, 1000, 3000, 10000, 30000, 100000, 300000))
+STEP_PEOPLE = Histogram("conversion_step_people", "People processed by a step of the conversion pipeline", ["step"],
+                        buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16))
+STEP_BYTES = Histogram("conversion_step_bytes", "Bytes processed by a step of the conversion pipeline", ["step"],
+                       buckets=(1e5, 1e6, 1e7, 1e8, 1e9, 1e10))
+STEP_FAILURES = Counter("conversion_step_failures_total", "Steps of the conversion pipeline that raised an error",
+                        ["step"])
+JOB_OVERHEAD_SECONDS = Histogram("worker_job_overhead_seconds",
+                                 "Time a worker spends on a job besides the job function (fork, bookkeeping)",
+                                 ["mode"], buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Latency of the api requests",
+                            ["endpoint", "method", "status"])
+REQUEST_QUERIES = Histogram("http_request_db_queries", "Database queries per api request", ["endpoint"],
+                            buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200))
+REQUEST_DB_SECONDS = Histogram("http_request_db_seconds", "Time spent in database queries per api request",
+                               ["endpoint"])
+
+
+def observe(step, seconds, frames=None, people=None, bytes=None, **context):
+    """
+    record the measurements of a step and log them as json
+    :param step: name of the step
+    :param seconds: duration of the step
+    :param frames: number of processed frames
+    :param people: number of processed people
+    :param bytes: number of processed bytes
+    :param context: further values for the log (e.g. the job id)
+    """
+    STEP_SECONDS.labels(step).observe(seconds)
+    for histogram, value in ((STEP_FRAMES, frames), (STEP_PEOPLE, people), (STEP_BYTES, bytes)):
+        if value is not None:
+            histogram.labels(step).observe(value)
+    values = dict(context, step=step, seconds=round(seconds, 3), frames=frames, people=people, bytes=bytes)
+    print(json.dumps({key: value for key, value in values.items() if value is not None}, default=str))
+
+
+def observe_job_overhead(mode, seconds, **context):
+    """
+    record the fixed overhead of a job of the rq worker and log it as json
+    :param mode: mode of the worker (see project/worker_pool.py)
+    :param seconds: time of the worker for the job minus the run time of the job function
+    :param context: further values for the log (e.g. the rq job id)
+    """
+    JOB_OVERHEAD_SECONDS.labels(mode).observe(seconds)
+    print(json.dumps(dict(context, step="job_overhead", mode=mode, seconds=round(seconds, 4)), default=str))
+
+
+@contextmanager
+def measure(step, **values):
+    """
+    measure the duration of a step. frames, people and bytes can be given or set in the yielded dictionary.
+    :param step: name of the step
+    :param values: measurements and context known before the step
+    :return: dictionary for the measurements of the step
+    """
+    start = time.perf_counter()
+    try:
+        yield values
+    except BaseException:
+        STEP_FAILURES.labels(step).inc()
+        raise
+    observe(step, time.perf_counter() - start, **values)
+
+
+def _endpoint():
+    # the url rule instead of the path, so the number of label values stays small
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    if has_request_context() and "db_queries" in g:
+        g.db_queries += 1
+        g.db_seconds += elapsed
+
+
+def init_app(app):
+    """
+    measure the latency and the database queries of all requests of a flask app
+    :param app: flask app
+    """
+    @app.before_request
+    def start_request_metrics():
+        g.request_start = time.perf_counter()
+        g.db_queries = 0
+        g.db_seconds = 0.0
+
+    @app.after_request
+    def record_request_metrics(response):
+        if "request_start" in g:
+            endpoint = _endpoint()
+            REQUEST_SECONDS.labels(endpoint, request.method, response.status_code) \
+                .observe(time.perf_counter() - g.request_start)
+            REQUEST_QUERIES.labels(endpoint).observe(g.db_queries)
+            REQUEST_DB_SECONDS.labels(endpoint).observe(g.db_seconds)
+        return response
+
+
+def registry():
+    """
+    :return: registry with the metrics of all processes in the multiprocess mode, otherwise of this process
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.getenv("prometheus_multiproc_dir"):
+        collector_registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(collector_registry)
+        return collector_registry
+    return REGISTRY
+
+
+def latest():
+    """
+    :return: content type and text of the metrics for the /metrics endpoint
+    """
+    return CONTENT_TYPE_LATEST, generate_latest(registry())
+
+
+def start_server(port):
+    """
+    serve the metrics in a background thread, used by the worker
+    :param port: http port
+    """
+    start_http_server(port, registry=registry())
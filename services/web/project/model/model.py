@@ -10,12 +10,16 @@ import time
 import werkzeug
 from flask import jsonify
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import ForeignKey, desc, asc, or_
+from sqlalchemy import ForeignKey, desc, asc, or_, func, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import joinedload, relationship
 from werkzeug.exceptions import HTTPException
 from werkzeug.security import generate_password_hash, check_password_hash
-from project.app import app, ResultCode
+from project import response_cache
+from project.app import app, ResultCode, conn
+from project.config import Config
+from project.tag_index import TagIndex
 
 db = SQLAlchemy(app)
 
@@ -90,8 +94,8 @@ class UserMetadata(db.Model):
 # many to many connection between jobs and tags
 JobTag = db.Table(
     'JobTag', db.Model.metadata,
-    db.Column('tagID', db.Integer, ForeignKey('tags.id', ondelete="CASCADE")),
-    db.Column('jobID', db.Integer, ForeignKey('jobs.id', ondelete="CASCADE"))
+    db.Column('tagID', db.Integer, ForeignKey('tags.id', ondelete="CASCADE"), index=True),
+    db.Column('jobID', db.Integer, ForeignKey('jobs.id', ondelete="CASCADE"), index=True)
 )
 
 
@@ -100,6 +104,8 @@ class Bookmarks(db.Model):
     Bookmarks Table in Database
     """
     __tablename__ = 'bookmarks'
+    # a job can be bookmarked once per user
+    __table_args__ = (db.UniqueConstraint('user_id', 'job_id', name='bookmarks_user_job_key'),)
     id = db.Column(db.Integer, primary_key=True, unique=True, nullable=False)
     category = db.Column(db.String, default="Bookmarks")
     user_id = db.Column(db.Integer, ForeignKey('users.id', ondelete="CASCADE"))
@@ -114,7 +120,7 @@ class Tags(db.Model):
     """
     __tablename__ = 'tags'
     id = db.Column(db.Integer, primary_key=True, unique=True, nullable=False)
-    text = db.Column(db.String, nullable=False)
+    text = db.Column(db.String, nullable=False, index=True)
     jobs = relationship('Jobs', secondary=JobTag, back_populates='tags')
 
 
@@ -131,6 +137,16 @@ class Posts(db.Model):
     title = db.Column(db.String(64), nullable=False)
 
 
+class Batches(db.Model):
+    """
+    Batches Table in Database: jobs submitted together
+    """
+    __tablename__ = 'batches'
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.Integer, ForeignKey('users.id'))
+    date = db.Column(db.TIMESTAMP, nullable=False, default=datetime.utcnow)
+
+
 # parent
 class Jobs(db.Model):
     """
@@ -144,9 +160,18 @@ class Jobs(db.Model):
     user_id = db.Column(db.Integer, ForeignKey('users.id'))
     user = relationship("Users", backref="jobs")
     video_uploaded = db.Column(db.Boolean, default=False)
+    # sha256 hash of the uploaded video in the content store
+    video_hash = db.Column(db.String(64), index=True, nullable=True)
+    batch_id = db.Column(db.String(36), ForeignKey('batches.id', ondelete="SET NULL"), index=True, nullable=True)
     public = db.Column(db.Boolean, default=False, nullable=False)
+    # pose estimation backend (Config.BACKENDS or "auto")
+    backend = db.Column(db.String(16), default=Config.DEFAULT_BACKEND, nullable=False)
+    # quality tier of the analysis (Config.QUALITY_TIERS)
+    quality = db.Column(db.String(16), default=Config.DEFAULT_QUALITY, nullable=False)
     # Date updated
     date_updated = db.Column(db.TIMESTAMP, default=datetime.utcnow)
+    # number of bookmarks, maintained by save_bookmark and remove_bookmark
+    bookmark_count = db.Column(db.Integer, default=0, server_default="0", nullable=False)
 
 
 class Results(db.Model):
@@ -158,6 +183,19 @@ class Results(db.Model):
     date = db.Column(db.TIMESTAMP, default=datetime.utcnow, nullable=False)
 
 
+def load_public_tags():
+    """
+    loader for the tag index
+    :return: (job id, tag text) for every tag of every public job
+    """
+    return db.session.query(JobTag.c.jobID, Tags.text).join(Tags, Tags.id == JobTag.c.tagID) \
+        .join(Jobs, Jobs.id == JobTag.c.jobID).filter(Jobs.public.is_(True)).order_by(JobTag.c.jobID).all()
+
+
+# inverted tag index of the public feed, the gunicorn workers share their changes via a change log in redis
+tag_index = TagIndex(loader=load_public_tags, connection=conn)
+
+
 """
 EVENT LISTENERS : Triggers a specific event (eg. jobs inserted -> result insert)
 """
@@ -234,7 +272,9 @@ def add_job(**kwargs):
     :param kwargs: job attributes
     :return: the new job object
     """
-    job = Jobs(user_id=kwargs['user_id'], name=kwargs['name'])
+    job = Jobs(user_id=kwargs['user_id'], name=kwargs['name'],
+               backend=kwargs.get('backend') or Config.DEFAULT_BACKEND,
+               quality=kwargs.get('quality') or Config.DEFAULT_QUALITY)
     db.session.add(job)
     for tag in kwargs['tags']:
         t = db.session.query(Tags).filter_by(text=tag).first()
@@ -247,6 +287,80 @@ def add_job(**kwargs):
     return job
 
 
+class BatchDoesNotExist(HTTPException):
+    """
+    Exception: The batch does not exist
+    """
+    code = 404
+    description = "Batch does not exist."
+
+
+def add_jobs_batch(user_id, entries):
+    """
+    add many jobs with uploaded videos in one transaction using bulk inserts
+    :param user_id: user id
+    :param entries: list of dictionaries with name, tags, video_hash, backend and quality of the jobs
+    :return: batch id and the ids of the new jobs (in the order of the entries)
+    """
+    batch = Batches(user_id=user_id)
+    db.session.add(batch)
+    db.session.flush()
+    now = datetime.utcnow()
+    rows = [{"user_id": user_id, "name": entry["name"], "video_hash": entry["video_hash"], "video_uploaded": True,
+             "public": False, "date_updated": now, "batch_id": batch.id,
+             "backend": entry.get("backend") or Config.DEFAULT_BACKEND,
+             "quality": entry.get("quality") or Config.DEFAULT_QUALITY} for entry in entries]
+    jobs_table = Jobs.__table__
+    if db.session.bind.dialect.name == "postgresql":
+        # reserve all ids at once, so the jobs can be inserted with a single executemany
+        ids = [r[0] for r in db.session.execute(text("SELECT nextval('jobs_id_seq') FROM generate_series(1, :n)"),
+                                                {"n": len(rows)})]
+        for row, id in zip(rows, ids):
+            row["id"] = id
+        db.session.execute(jobs_table.insert(), rows)
+    else:
+        ids = [db.session.execute(jobs_table.insert().values(**row)).inserted_primary_key[0] for row in rows]
+    # the core insert does not trigger the after_insert event, so the results are inserted here
+    db.session.execute(Results.__table__.insert(), [{"id": id, "user_id": user_id} for id in ids])
+
+    # tags: one query for the existing ones, the missing ones are created
+    texts = set(tag for entry in entries for tag in entry["tags"])
+    tag_ids = {}
+    if texts:
+        tag_ids = dict(db.session.query(Tags.text, Tags.id).filter(Tags.text.in_(texts)).all())
+        missing = [Tags(text=tag) for tag in texts if tag not in tag_ids]
+        db.session.add_all(missing)
+        db.session.flush()
+        tag_ids.update({tag.text: tag.id for tag in missing})
+        db.session.execute(JobTag.insert(), [{"tagID": tag_ids[tag], "jobID": id}
+                                             for id, entry in zip(ids, entries) for tag in set(entry["tags"])])
+    db.session.commit()
+    return batch.id, ids
+
+
+def get_batch_progress(batch_id, user_id):
+    """
+    get the aggregated progress of a batch
+    :param batch_id: batch id
+    :param user_id: id of the user, who must own the batch
+    :return: number of jobs by state, progress and the job ids
+    """
+    batch = Batches.query.get(batch_id)
+    if batch is None or batch.user_id != user_id:
+        raise BatchDoesNotExist()
+    counts = dict(db.session.query(Results.result_code, func.count(Results.id))
+                  .join(Jobs, Jobs.id == Results.id).filter(Jobs.batch_id == batch_id)
+                  .group_by(Results.result_code).all())
+    total = sum(counts.values())
+    success = counts.get(ResultCode.success, 0)
+    failed = counts.get(ResultCode.failure, 0)
+    job_ids = [r[0] for r in db.session.query(Jobs.id).filter_by(batch_id=batch_id).order_by(asc(Jobs.id)).all()]
+    return {"id": batch_id, "total": total, "success": success, "failed": failed,
+            "pending": total - success - failed,
+            "progress": float(success + failed) / total if total else 1.0,
+            "finished": success + failed == total, "job_ids": job_ids}
+
+
 def get_jobs(user_id):
     """
     get all jobs by a user id
@@ -380,11 +494,29 @@ def filter_results(user_id):
     return results
 
 
-def get_all_public_posts():
+def get_all_public_posts(page=1, per_page=Config.POSTS_PER_PAGE):
+    """
+    :param page: page number, starting with 1
+    :param per_page: posts per page
+    :return: a page of the public posts
+    """
+    return db.session.query(Jobs).filter_by(public=True).order_by(desc(Jobs.date_updated), desc(Jobs.id)) \
+        .offset((page - 1) * per_page).limit(per_page).all()
+
+
+def get_job_ids():
+    """
+    :return: ids of all jobs
+    """
+    return [r[0] for r in db.session.query(Jobs.id).all()]
+
+
+def get_active_job_ids():
     """
-    :return: all public posts
+    :return: ids of the jobs that have not finished or failed yet
     """
-    return db.session.query(Jobs).filter_by(public=True).order_by(desc(Jobs.date_updated)).all()
+    return [r[0] for r in db.session.query(Results.id).filter(
+        Results.result_code.in_([ResultCode.default, ResultCode.pending])).all()]
 
 
 def get_pending_results():
@@ -436,6 +568,15 @@ def get_job_by_id(id):
     return Jobs.query.get(id)
 
 
+def get_job_with_result(id):
+    """
+    get a job and its result with a single query
+    :param id: job id
+    :return: job object with the loaded result, or None
+    """
+    return db.session.query(Jobs).options(joinedload(Jobs.result)).filter_by(id=id).first()
+
+
 def get_job_by_result_id(id):
     """
     @deprecated
@@ -454,6 +595,9 @@ def delete_job(id):
     """
     db.session.query(Results).filter_by(id=id).delete()
     result = db.session.query(Jobs).filter_by(id=id).delete()
+    db.session.commit()
+    tag_index.remove(id)
+    response_cache.bump(conn, response_cache.FEED, response_cache.job_scope(id))
     return result > 0
 
 
@@ -479,16 +623,51 @@ def set_job_public(id, user_id):
         raise Forbidden
     job.public = True
     db.session.commit()
+    tag_index.add(job.id, [tag.text for tag in job.tags])
+    response_cache.bump(conn, response_cache.FEED, response_cache.job_scope(job.id))
     return job
 
 
-def get_public_posts_filtered_by_tags(tags):
+def get_public_posts_filtered_by_tags(tags, match_all=False, page=1, per_page=Config.POSTS_PER_PAGE):
     """
     :param tags: tags
-    :return: get all public jobs given filtered with tags array
+    :param match_all: if True, a job must have all given tags, otherwise one of them
+    :param page: page number, starting with 1
+    :param per_page: posts per page
+    :return: a page of the public jobs filtered with the tags array
+    """
+    # the index pages by job id, which has the order of date_updated (it is only set when a job is created)
+    offset = (page - 1) * per_page
+    posts = []
+    while len(posts) < per_page:
+        ids = tag_index.page(tags, match_all, offset, per_page - len(posts))
+        if not ids:
+            break
+        offset += len(ids)
+        # ids of jobs unpublished or deleted by another worker can still be in its index, they are skipped and the
+        # page is filled up with the next ids
+        t = db.session.query(Jobs).filter(Jobs.public.is_(True), Jobs.id.in_(ids))
+        posts += t.order_by(desc(Jobs.date_updated), desc(Jobs.id)).all()
+    return posts
+
+
+def get_public_tag_counts(tags=None, match_all=False, limit=None):
+    """
+    :param tags: optional tags to filter the counted jobs
+    :param match_all: if True, a job must have all given tags, otherwise one of them
+    :param limit: maximum number of tags
+    :return: tags of public jobs with their number of occurrences
     """
-    t = db.session.query(Jobs).filter_by(public=True).filter(Jobs.tags.any(Tags.text.in_(tags)))
-    return t.order_by(desc(Jobs.date_updated)).all()
+    return tag_index.facets(tags, match_all, limit)
+
+
+def autocomplete_public_tags(prefix, limit=10):
+    """
+    :param prefix: prefix of the tag
+    :param limit: maximum number of tags
+    :return: tags of public jobs starting with the prefix
+    """
+    return tag_index.autocomplete(prefix, limit)
 
 
 def set_job_private(id, user_id):
@@ -505,6 +684,8 @@ def set_job_private(id, user_id):
         raise Forbidden
     job.public = False
     db.session.commit()
+    tag_index.remove(job.id)
+    response_cache.bump(conn, response_cache.FEED, response_cache.job_scope(job.id))
     return job
 
 
@@ -518,30 +699,34 @@ class BookmarkExists(werkzeug.exceptions.HTTPException):
 
 def save_bookmark(job_id, user_id, category):
     """
-    save a job with given id in the users bookmarks
+    save a job with given id in the users bookmarks. The counter of the job is incremented in the same transaction,
+    an existing bookmark is detected by the unique constraint, so the bookmarks of the job are never loaded.
     :param job_id: job id of saved job
     :param user_id: user id
     :param category: optional category as string
     """
     if category is None:
         category = "Bookmarks"
-    if db.session.query(Bookmarks).filter_by(job_id=job_id, user_id=user_id).scalar() is not None:
+    updated = db.session.query(Jobs).filter_by(id=job_id) \
+        .update({Jobs.bookmark_count: Jobs.bookmark_count + 1}, synchronize_session=False)
+    if updated == 0:
+        db.session.rollback()
+        raise JobDoesNotExist
+    try:
+        db.session.add(Bookmarks(job_id=job_id, user_id=user_id, category=category))
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
         raise BookmarkExists
-    bookmark = Bookmarks(job_id=job_id, user_id=user_id, category=category)
-    db.session.add(bookmark)
+    count = db.session.query(Jobs.bookmark_count).filter_by(id=job_id).scalar()
     db.session.commit()
-    f = db.session.query(Jobs).filter_by(id=job_id).first()
-    count = None
-    if f is not None:
-        count = len(f.bookmarks)
-    else:
-        raise JobDoesNotExist
+    response_cache.bump(conn, response_cache.FEED)
     return {"count": count, "success": True}
 
 
 def remove_bookmark(job_id, user_id, category):
     """
-    remove a bookmark with a given job and user id
+    remove a bookmark with a given job and user id, the counter of the job is decremented in the same transaction
     :param job_id: job id
     :param user_id: user id
     :param category: optional category
@@ -549,16 +734,24 @@ def remove_bookmark(job_id, user_id, category):
     """
     if category is None:
         category = "Bookmarks"
-    query = db.session.query(Bookmarks).filter_by(job_id=job_id, user_id=user_id)
-    count = None
-    result = query.delete()
-
-    f = db.session.query(Jobs).filter_by(id=job_id).first()
-    if f is not None:
-        count = len(f.bookmarks)
+    result = db.session.query(Bookmarks).filter_by(job_id=job_id, user_id=user_id).delete(synchronize_session=False)
+    if result > 0:
+        db.session.query(Jobs).filter_by(id=job_id) \
+            .update({Jobs.bookmark_count: Jobs.bookmark_count - result}, synchronize_session=False)
+    count = db.session.query(Jobs.bookmark_count).filter_by(id=job_id).scalar()
+    db.session.commit()
+    response_cache.bump(conn, response_cache.FEED)
     return {"count": count, "success": result > 0}
 
 
+def get_bookmarked_job_ids(user_id):
+    """
+    :param user_id: user id
+    :return: set of the ids of all jobs bookmarked by the user
+    """
+    return {job_id for job_id, in db.session.query(Bookmarks.job_id).filter_by(user_id=user_id)}
+
+
 def get_bookmarks_by_user(id):
     """
     returns all bookmarks for a user
@@ -598,8 +791,14 @@ def delete_failed_jobs(user_id):
     """
     results = db.session.query(Results).filter_by(user_id=user_id, result_code=ResultCode(-1))
     count = results.count()
-    for r in results.all():
-        db.session.query(Results).filter_by(id=r.id).delete()
-        db.session.query(Jobs).filter_by(id=r.id).delete()
+    ids = [r.id for r in results.all()]
+    for id in ids:
+        db.session.query(Results).filter_by(id=id).delete()
+        db.session.query(Jobs).filter_by(id=id).delete()
     results.delete()
+    db.session.commit()
+    for id in ids:
+        tag_index.remove(id)
+    if ids:
+        response_cache.bump(conn, response_cache.FEED, *[response_cache.job_scope(id) for id in ids])
     return count
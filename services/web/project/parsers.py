@@ -4,15 +4,42 @@ parser definitions for flask api
 import uuid
 
 import string
-from flask_restplus import reqparse
+from flask_restplus import inputs, reqparse
 import werkzeug
 
+from project.config import Config
+
 # request parser for posting a job
 post_job_parser = reqparse.RequestParser()
 post_job_parser.add_argument('name', default="My Project", type=str, location='form')
 post_job_parser.add_argument('tags', type=str, location='form', action='append', default=[])
 post_job_parser.add_argument('video', type=werkzeug.datastructures.FileStorage,
                              location='files', required=False, help='Video file in mp4 format')
+post_job_parser.add_argument('backend', type=str, location='form', choices=Config.BACKENDS + ["auto"],
+                             default=Config.DEFAULT_BACKEND,
+                             help='pose estimation: xnect (gpu), lifting (cpu) or auto (lifting if xnect is busy)')
+post_job_parser.add_argument('quality', type=str, location='form', choices=list(Config.QUALITY_TIERS),
+                             default=Config.DEFAULT_QUALITY,
+                             help='quality tier: limits the resolution and frame rate of the analysed video')
+post_job_parser.add_argument('preview', type=inputs.boolean, location='form', default=False,
+                             help='analyse the first seconds first, the rest only if people are found')
+
+# request parser for submitting many jobs at once
+batch_parser = reqparse.RequestParser()
+batch_parser.add_argument('videos', type=werkzeug.datastructures.FileStorage, location='files', action='append',
+                          default=[], help='Video files in mp4 format')
+batch_parser.add_argument('archive', type=werkzeug.datastructures.FileStorage, location='files', required=False,
+                          help='zip or tar archive with videos in mp4 format')
+batch_parser.add_argument('manifest', type=str, location='form', required=False,
+                          help='json list of {"file": file name, "name": job name, "tags": [tags]}')
+batch_parser.add_argument('tags', type=str, location='form', action='append', default=[],
+                          help='tags of all jobs without tags in the manifest')
+batch_parser.add_argument('backend', type=str, location='form', choices=Config.BACKENDS + ["auto"],
+                          default=Config.DEFAULT_BACKEND, help='pose estimation backend of all jobs')
+batch_parser.add_argument('quality', type=str, location='form', choices=list(Config.QUALITY_TIERS),
+                          default=Config.DEFAULT_QUALITY, help='quality tier of all jobs')
+batch_parser.add_argument('preview', type=inputs.boolean, location='form', default=False,
+                          help='analyse the first seconds of every video first')
 
 # request parser for getting jobs
 get_jobs_parser = reqparse.RequestParser()
@@ -26,6 +53,8 @@ upload_parser.add_argument('video',
                            required=True,
                            help='Video File in mp4 format'
                            )
+upload_parser.add_argument('preview', type=inputs.boolean, location='form', default=False,
+                           help='analyse the first seconds first, the rest only if people are found')
 
 # request parser for adding a new result (deprecated)
 results_parser = reqparse.RequestParser()
@@ -49,6 +78,22 @@ user_metadata_parser.add_argument('website', type=str, required=False)
 # request parser for posting a job
 posts_parser = reqparse.RequestParser()
 posts_parser.add_argument('tags[]', type=str, action='append')
+posts_parser.add_argument('match', type=str, choices=['any', 'all'], default='any',
+                          help='any: job has one of the tags (OR), all: job has every tag (AND)')
+
+# request parser for tag counts of the public posts
+tag_facets_parser = posts_parser.copy()
+tag_facets_parser.add_argument('limit', type=int, required=False)
+
+# the feed is paged, newest posts first
+posts_parser.add_argument('page', type=inputs.positive, default=1)
+posts_parser.add_argument('per_page', type=inputs.int_range(1, Config.POSTS_MAX_PER_PAGE),
+                          default=Config.POSTS_PER_PAGE)
+
+# request parser for tag autocompletion
+tag_autocomplete_parser = reqparse.RequestParser()
+tag_autocomplete_parser.add_argument('prefix', type=str, required=True)
+tag_autocomplete_parser.add_argument('limit', type=int, default=10)
 
 # deprecated request parser for rendering videos
 render_parser = reqparse.RequestParser()
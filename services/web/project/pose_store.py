@@ -0,0 +1,85 @@
+"""
+POSE STORE : Compact storage of the raw xnect outputs (raw2D, raw3D, IK3D).
+XNECT writes one text row per person and frame: frame index, person index and the joint values.
+The rows are stored as numpy archive (.npz) with float32 values and a frame index for random access.
+The float32 values are about half the size of the text and load many times faster. Zip compression on top of that
+saves only ~10% for noisy pose data but makes loading much slower, so it is optional.
+"""
+import os
+
+import numpy as np
+
+
+def convert_txt(txt_path, npz_path, compress=False):
+    """
+    convert a raw xnect text file to an archive
+    :param txt_path: path of the text file
+    :param npz_path: path of the archive, must end with .npz
+    :param compress: use zip compression
+    :return: number of rows
+    """
+    rows = np.loadtxt(txt_path, ndmin=2) if os.path.getsize(txt_path) > 0 else np.zeros([0, 2])
+    return save_rows(rows, npz_path, compress)
+
+
+def save_rows(rows, npz_path, compress=False):
+    """
+    store rows in the layout of the text file (frame, person, values...) as archive
+    :param rows: 2d array with one row per person and frame
+    :param npz_path: path of the archive, must end with .npz
+    :param compress: use zip compression
+    :return: number of rows
+    """
+    # xnect writes the rows ordered by frame, keep the order of the people within a frame
+    rows = rows[np.argsort(rows[:, 0], kind="stable")] if len(rows) else rows
+    index = rows[:, :2].astype(np.int32)
+    values = rows[:, 2:].astype(np.float32)
+    num_frames = int(index[:, 0].max()) + 1 if len(index) else 0
+    # rows of frame f are frame_offsets[f]:frame_offsets[f + 1]
+    frame_offsets = np.searchsorted(index[:, 0], np.arange(num_frames + 1)).astype(np.int64)
+    save = np.savez_compressed if compress else np.savez
+    save(npz_path, index=index, values=values, frame_offsets=frame_offsets)
+    return len(rows)
+
+
+class PoseArchive(object):
+    """
+    read access to an archived raw xnect output
+    """
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.index = data["index"]
+            self.values = data["values"]
+            self.frame_offsets = data["frame_offsets"]
+
+    @property
+    def num_frames(self):
+        return len(self.frame_offsets) - 1
+
+    def frame(self, idx):
+        """
+        get the rows of a frame
+        :param idx: frame index
+        :return: person indices and values (people x values) of the frame
+        """
+        if idx < 0 or idx >= self.num_frames:
+            return self.index[:0, 1], self.values[:0]
+        start, end = self.frame_offsets[idx], self.frame_offsets[idx + 1]
+        return self.index[start:end, 1], self.values[start:end]
+
+    def rows(self):
+        """
+        :return: all rows in the layout of the text file (frame, person, values...)
+        """
+        return np.hstack([self.index.astype(np.float64), self.values.astype(np.float64)])
+
+
+def load_rows(path):
+    """
+    load a raw xnect output in the layout of the text file, from the archive or from the text file
+    :param path: path of the .npz archive or .txt file
+    :return: 2d array with one row per person and frame
+    """
+    if str(path).endswith(".npz"):
+        return PoseArchive(path).rows()
+    return np.loadtxt(path, ndmin=2)
@@ -0,0 +1,141 @@
+"""
+PROFILING : Opt-in profiling of single api requests in production. A request is profiled if it carries the header
+X-Profile with the value of PROFILING_TOKEN (known to the admins) or if it is sampled (PROFILING_SAMPLE_RATE).
+The cProfile statistics and the sql statements with their durations of the last PROFILING_KEEP profiles are stored
+in redis, so every gunicorn worker can serve them to the admins (/api/v1/profiles/).
+If neither a token nor a sample rate is configured, no hooks are installed and the requests are not slowed down.
+"""
+import cProfile
+import hmac
+import io
+import json
+import pstats
+import random
+import time
+import uuid
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from project.config import Config
+
+HEADER = "X-Profile"
+PROFILES_KEY = "profiles"
+# statements per profile, the rest is only counted
+MAX_STATEMENTS = 200
+
+
+def enabled():
+    """
+    :return: if requests can be profiled
+    """
+    return bool(Config.PROFILING_TOKEN) or Config.PROFILING_SAMPLE_RATE > 0
+
+
+def _trigger():
+    """
+    :return: why the current request is profiled ("header" or "sample"), or None
+    """
+    token = request.headers.get(HEADER)
+    if token and Config.PROFILING_TOKEN and hmac.compare_digest(token, Config.PROFILING_TOKEN):
+        return "header"
+    if Config.PROFILING_SAMPLE_RATE > 0 and random.random() < Config.PROFILING_SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "profile" in g:
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "profile" in g and conn.info.get("profile_start"):
+        elapsed = time.perf_counter() - conn.info["profile_start"].pop()
+        profile = g.profile
+        profile["db_queries"] += 1
+        profile["db_seconds"] += elapsed
+        # the parameters are not stored, they can contain passwords
+        if len(profile["statements"]) < MAX_STATEMENTS:
+            profile["statements"].append({"statement": statement, "ms": round(elapsed * 1000, 3)})
+
+
+def save(connection, profile):
+    """
+    store a profile and drop the oldest ones
+    :param connection: redis connection
+    :param profile: profile as dictionary
+    """
+    pipe = connection.pipeline()
+    pipe.lpush(PROFILES_KEY, json.dumps(profile))
+    pipe.ltrim(PROFILES_KEY, 0, Config.PROFILING_KEEP - 1)
+    pipe.execute()
+
+
+def get_profiles(connection):
+    """
+    :param connection: redis connection
+    :return: stored profiles without statistics and statements, newest first
+    """
+    profiles = [json.loads(value) for value in connection.lrange(PROFILES_KEY, 0, -1)]
+    return [{key: value for key, value in profile.items() if key not in ["stats", "statements"]}
+            for profile in profiles]
+
+
+def get_profile(connection, profile_id):
+    """
+    :param connection: redis connection
+    :param profile_id: id of the profile
+    :return: the profile or None if it does not exist (anymore)
+    """
+    for value in connection.lrange(PROFILES_KEY, 0, -1):
+        profile = json.loads(value)
+        if profile["id"] == profile_id:
+            return profile
+    return None
+
+
+def init_app(app, connection):
+    """
+    install the profiling hooks, if profiling is enabled
+    :param app: flask app
+    :param connection: redis connection for the profiles
+    """
+    if not enabled():
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    @app.before_request
+    def start_profile():
+        trigger = _trigger()
+        if trigger is None:
+            return
+        g.profile = {"id": uuid.uuid4().hex, "date": time.time(), "trigger": trigger, "method": request.method,
+                     "path": request.full_path.rstrip("?"), "db_queries": 0, "db_seconds": 0.0, "statements": []}
+        g.profile_start = time.perf_counter()
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+    @app.after_request
+    def finish_profile(response):
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        profile = g.pop("profile")
+        profile["seconds"] = round(time.perf_counter() - g.pop("profile_start"), 6)
+        profile["db_seconds"] = round(profile["db_seconds"], 6)
+        profile["endpoint"] = request.url_rule.rule if request.url_rule is not None else None
+        profile["status"] = response.status_code
+        stats = io.StringIO()
+        pstats.Stats(profiler, stream=stats).sort_stats("cumulative").print_stats(Config.PROFILING_TOP_FUNCTIONS)
+        profile["stats"] = stats.getvalue()
+        try:
+            save(connection, profile)
+            response.headers["X-Profile-Id"] = profile["id"]
+        except Exception as e:
+            # profiling must never break a request
+            print("Could not store profile: %s" % e)
+        return response
@@ -0,0 +1,147 @@
+"""
+RESPONSE CACHE : Redis cache for responses that stay the same until a job changes: the public feed, finished results
+and the render_html pages. Every response is stored under the versions of the scopes it depends on (the feed or a
+single job). The versions are incremented when a job is published, unpublished, bookmarked, finished or deleted,
+so stale responses are never served and simply expire.
+The versions also make up the ETag, so clients, nginx or a CDN revalidating a response get a 304 before the view
+touches the database, and the Cache-Control header tells them how long a public response can be reused.
+"""
+import functools
+import hashlib
+import json
+
+from flask import Response, g, request
+from flask_restplus.utils import unpack
+from werkzeug.wrappers import BaseResponse
+
+from project.config import Config
+
+FEED = "feed"
+KEY_PREFIX = "response_cache:"
+
+
+def job_scope(job_id):
+    """
+    :return: scope of the responses depending on a job
+    """
+    return "job:%s" % job_id
+
+
+def _version_key(scope):
+    return KEY_PREFIX + "version:" + scope
+
+
+def bump(connection, *scopes):
+    """
+    invalidate all cached responses of the given scopes
+    :param connection: redis connection
+    :param scopes: FEED or job_scope(id)
+    """
+    try:
+        pipe = connection.pipeline()
+        for scope in scopes:
+            pipe.incr(_version_key(scope))
+        pipe.execute()
+    except Exception as e:
+        # without the new version, cached responses could be served until they expire
+        print("Could not invalidate the response cache: %s" % e)
+
+
+def skip():
+    """
+    do not cache the response of the current request (e.g. the result is not finished yet)
+    """
+    g.response_cache_skip = True
+
+
+class ResponseCache(object):
+    """
+    Decorator factory for the get methods of the api resources, see cached.
+    """
+    def __init__(self, connection, api):
+        """
+        :param connection: redis connection
+        :param api: flask_restplus api, it converts the return values of the views to responses
+        """
+        self.connection = connection
+        self.api = api
+
+    def _etag(self, scopes, per_user):
+        """
+        :return: etag of the current request, made of the path, the user and the versions of the scopes
+        """
+        versions = self.connection.mget([_version_key(scope) for scope in scopes])
+        user = g.user.id if per_user else None
+        content = json.dumps([request.full_path, user, scopes, [int(v or 0) for v in versions]])
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def _load(self, key):
+        """
+        :return: cached response or None
+        """
+        try:
+            entry = self.connection.hgetall(key)
+        except Exception:
+            return None
+        if not entry:
+            return None
+        return Response(entry[b"body"], content_type=entry[b"content_type"].decode())
+
+    def _store(self, key, response):
+        try:
+            pipe = self.connection.pipeline()
+            pipe.hset(key, mapping={"body": response.get_data(), "content_type": response.headers["Content-Type"]})
+            pipe.expire(key, Config.RESPONSE_CACHE_TTL)
+            pipe.execute()
+        except Exception as e:
+            print("Could not cache response: %s" % e)
+
+    def _headers(self, response, etag, public):
+        response.set_etag(etag)
+        if public:
+            response.headers["Cache-Control"] = "public, max-age=%d" % Config.RESPONSE_CACHE_MAX_AGE
+        else:
+            # responses behind the login are revalidated with the etag on every request
+            response.headers["Cache-Control"] = "private, no-cache"
+            response.vary.add("Authorization")
+        return response
+
+    def cached(self, scopes, public=False, per_user=False, store=True):
+        """
+        cache the responses of a view. The decorator must be placed below auth.login_required.
+        :param scopes: function of the view arguments returning the scopes the response depends on
+        :param public: if the response can be cached by shared caches (no login required)
+        :param per_user: if the response depends on the logged in user
+        :param store: store the body in redis, otherwise only the caching headers are set (e.g. file downloads)
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(resource, *args, **kwargs):
+                if not Config.RESPONSE_CACHE:
+                    return func(resource, *args, **kwargs)
+                try:
+                    etag = self._etag(scopes(*args, **kwargs), per_user)
+                except Exception as e:
+                    print("Response cache not available: %s" % e)
+                    return func(resource, *args, **kwargs)
+                if request.if_none_match.contains(etag):
+                    return self._headers(Response(status=304), etag, public)
+                key = KEY_PREFIX + etag
+                response = self._load(key) if store else None
+                if response is not None:
+                    return self._headers(response, etag, public)
+
+                g.response_cache_skip = False
+                rv = func(resource, *args, **kwargs)
+                if isinstance(rv, BaseResponse):
+                    response = rv
+                else:
+                    data, code, headers = unpack(rv)
+                    response = self.api.make_response(data, code, headers=headers)
+                if response.status_code != 200 or g.response_cache_skip:
+                    return response
+                if store and not response.direct_passthrough:
+                    self._store(key, response)
+                return self._headers(response, etag, public)
+            return wrapper
+        return decorator
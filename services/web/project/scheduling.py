@@ -0,0 +1,177 @@
+"""
+SCHEDULING : The conversion pipeline is split into stages (Config.STAGES). Every stage has one queue per priority,
+so that workers can be dedicated to a stage and short videos do not wait behind long ones.
+"""
+from rq import Queue, Retry
+
+from project.config import Config
+
+# first stage of the pipeline. The web app enqueues it by dotted path, so its workers do not import the pipeline
+# with opencv, scikit-video, video2bvh and numpy; only the rq workers running the stages do.
+CONVERT_XNECT = "project.conversion_task.convert_xnect"
+
+
+def queue_name(stage, priority):
+    """
+    :param stage: name of the stage
+    :param priority: name of the priority
+    :return: name of the redis queue
+    """
+    return "%s_%s" % (stage, priority)
+
+
+def queue_names(stages=None):
+    """
+    get the queues a worker listens to, ordered by priority
+    :param stages: stages handled by the worker (default: all stages)
+    :return: list of queue names
+    """
+    stages = stages or Config.STAGES
+    return [queue_name(stage, priority) for priority in Config.PRIORITIES for stage in stages]
+
+
+def priority_for_duration(seconds):
+    """
+    estimate the priority of a job by the length of its video
+    :param seconds: length of the video in seconds, or None if it is unknown
+    :return: name of the priority
+    """
+    if seconds is None:
+        return Config.DEFAULT_PRIORITY
+    for max_seconds, priority in Config.PRIORITY_DURATIONS:
+        if seconds <= max_seconds:
+            return priority
+    return Config.PRIORITIES[-1]
+
+
+def stage_backlog(connection, stage):
+    """
+    :param connection: redis connection
+    :param stage: name of the stage
+    :return: number of jobs waiting in the queues of the stage
+    """
+    return sum(Queue(queue_name(stage, priority), connection=connection).count for priority in Config.PRIORITIES)
+
+
+def select_backend(connection, backend=None):
+    """
+    select the pose estimation backend of a job. With "auto", the lifting backend is used if too many jobs are
+    waiting for xnect, so the cpu workers take over load from the gpu container.
+    :param connection: redis connection
+    :param backend: requested backend (see Config.BACKENDS), "auto" or None for Config.DEFAULT_BACKEND
+    :return: name of the backend
+    """
+    backend = backend or Config.DEFAULT_BACKEND
+    if backend == "auto":
+        if stage_backlog(connection, "inference") >= Config.AUTO_BACKEND_BACKLOG:
+            return "lifting"
+        return "xnect"
+    return backend
+
+
+def stage_job_id(my_job_id, stage, part=None):
+    """
+    :param my_job_id: database id of the job
+    :param stage: name of the stage
+    :param part: index of the part, if the stage is split into parts running in parallel
+    :return: id of the redis job running the stage for the job
+    """
+    if part is not None:
+        return "%s-%s-%d" % (my_job_id, stage, part)
+    return "%s-%s" % (my_job_id, stage)
+
+
+def _parts_keys(my_job_id):
+    return "parts:%s:total" % my_job_id, "parts:%s:done" % my_job_id
+
+
+def start_parts(connection, my_job_id, count):
+    """
+    start counting the finished parts of a stage that is split into parts
+    :param connection: redis connection
+    :param my_job_id: database id of the job
+    :param count: number of parts
+    """
+    total_key, done_key = _parts_keys(my_job_id)
+    with connection.pipeline() as pipe:
+        pipe.delete(done_key)
+        pipe.set(total_key, count, ex=Config.PARTS_TTL)
+        pipe.execute()
+
+
+def finish_part(connection, my_job_id, part):
+    """
+    mark a part as finished
+    :param connection: redis connection
+    :param my_job_id: database id of the job
+    :param part: index of the part
+    :return: True, if all parts have finished. Only the call finishing the last part (or a retry of a part after
+    that) gets True, so the next stage is scheduled once.
+    """
+    total_key, done_key = _parts_keys(my_job_id)
+    with connection.pipeline() as pipe:
+        pipe.sadd(done_key, part)
+        pipe.expire(done_key, Config.PARTS_TTL)
+        pipe.scard(done_key)
+        pipe.get(total_key)
+        _, _, done, total = pipe.execute()
+    return total is not None and done == int(total)
+
+
+def parts_progress(connection, my_job_id):
+    """
+    :param connection: redis connection
+    :param my_job_id: database id of the job
+    :return: progress between 0 and 1 of a stage that is split into parts, or None if it is not split
+    """
+    total_key, done_key = _parts_keys(my_job_id)
+    total = connection.get(total_key)
+    if total is None:
+        return None
+    return connection.scard(done_key) / float(int(total))
+
+
+def enqueue_stages(connection, stage, func, job_kwargs, priority=None):
+    """
+    enqueue a stage for many jobs at once with a single redis pipeline
+    :param connection: redis connection
+    :param stage: name of the stage
+    :param func: function executing the stage or its dotted path
+    :param job_kwargs: further arguments for the function by database id of the job
+    :param priority: name of the priority (default: Config.DEFAULT_PRIORITY)
+    :return: redis jobs
+    """
+    priority = priority or Config.DEFAULT_PRIORITY
+    q = Queue(queue_name(stage, priority), connection=connection)
+    retry = Retry(max=Config.STAGE_RETRIES) if Config.STAGE_RETRIES else None
+    jobs = []
+    with connection.pipeline() as pipe:
+        for my_job_id, kwargs in job_kwargs.items():
+            kwargs = dict(kwargs, my_job_id=my_job_id, priority=priority)
+            job = q.create_job(func, kwargs=kwargs, timeout=Config.STAGE_TIMEOUTS.get(stage),
+                               job_id=stage_job_id(my_job_id, stage), retry=retry)
+            jobs.append(q.enqueue_job(job, pipeline=pipe))
+        pipe.execute()
+    return jobs
+
+
+def enqueue_stage(connection, stage, func, my_job_id, priority=None, part=None, **kwargs):
+    """
+    enqueue a stage of a job
+    :param connection: redis connection
+    :param stage: name of the stage
+    :param func: function executing the stage or its dotted path
+    :param my_job_id: database id of the job
+    :param priority: name of the priority (default: Config.DEFAULT_PRIORITY)
+    :param part: index of the part, if the stage is split into parts running in parallel
+    :param kwargs: further arguments for the function
+    :return: redis job
+    """
+    priority = priority or Config.DEFAULT_PRIORITY
+    kwargs.update(my_job_id=my_job_id, priority=priority)
+    if part is not None:
+        kwargs["part"] = part
+    q = Queue(queue_name(stage, priority), connection=connection)
+    retry = Retry(max=Config.STAGE_RETRIES) if Config.STAGE_RETRIES else None
+    return q.enqueue_call(func, kwargs=kwargs, timeout=Config.STAGE_TIMEOUTS.get(stage),
+                          job_id=stage_job_id(my_job_id, stage, part), retry=retry)
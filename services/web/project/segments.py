@@ -0,0 +1,115 @@
+"""
+SEGMENTS : Long videos are split into overlapping time segments, which are analysed by xnect in parallel.
+The raw outputs of the segments are stitched back together: the person indices of every segment are mapped to the
+indices of the previous segment by comparing the poses in the overlapping frames, new people get new indices.
+Inside an overlap, the frames before its middle are taken from the earlier segment, the others from the later one,
+so that neither segment contributes frames from the start of its analysis, where the tracking of xnect is not
+settled yet.
+"""
+import numpy as np
+
+from project import pose_store
+
+
+def plan(num_frames, length, overlap):
+    """
+    split a video into overlapping segments
+    :param num_frames: number of frames of the video
+    :param length: frames per segment
+    :param overlap: frames shared by two consecutive segments
+    :return: list of {"start", "frames"}
+    """
+    if length <= overlap:
+        raise ValueError("The segments must be longer than their overlap")
+    segments = []
+    start = 0
+    while True:
+        frames = min(length, num_frames - start)
+        segments.append({"start": start, "frames": frames})
+        if start + frames >= num_frames:
+            return segments
+        start += length - overlap
+
+
+def parallel_length(num_frames, parts, overlap):
+    """
+    :param num_frames: number of frames of the video
+    :param parts: number of segments
+    :param overlap: frames shared by two consecutive segments
+    :return: frames per segment, so that the video is split into the number of segments
+    """
+    return int(np.ceil((num_frames + (parts - 1) * overlap) / parts))
+
+
+def people(rows):
+    """
+    :return: person indices of the rows grouped by frame, {frame: {person: values}}
+    """
+    frames = {}
+    for row in rows:
+        frames.setdefault(int(row[0]), {})[int(row[1])] = row[2:]
+    return frames
+
+
+def match_people(previous, current, frames, max_distance):
+    """
+    map the person indices of a segment to the indices of the previous segment
+    :param previous: ik3d rows of the previous segment with global frames and indices
+    :param current: ik3d rows of the segment with global frames and its own indices
+    :param frames: overlapping frames
+    :param max_distance: maximum mean joint distance of the same person
+    :return: dictionary index in the segment -> index in the previous segment
+    """
+    previous, current = people(previous), people(current)
+    distances = {}
+    for frame in frames:
+        for a, pose_a in previous.get(frame, {}).items():
+            for b, pose_b in current.get(frame, {}).items():
+                distance = np.mean(np.linalg.norm((pose_a - pose_b).reshape([-1, 3]), axis=1))
+                distances.setdefault((b, a), []).append(distance)
+    pairs = sorted((np.mean(values), b, a) for (b, a), values in distances.items())
+    mapping = {}
+    for distance, b, a in pairs:
+        if distance > max_distance:
+            break
+        if b not in mapping and a not in mapping.values():
+            mapping[b] = a
+    return mapping
+
+
+def stitch(segments, output_paths, max_distance):
+    """
+    stitch the raw xnect outputs of the segments
+    :param segments: list of {"start", "frames", "paths"}, paths are the raw outputs of the segment by name
+    :param output_paths: paths of the stitched outputs by name
+    :param max_distance: maximum mean joint distance (ik3d) of the same person in two segments
+    :return: number of people
+    """
+    stitched = {name: [] for name in output_paths}
+    previous = None
+    next_index = 0
+    for i, segment in enumerate(segments):
+        rows = {name: pose_store.load_rows(path).copy() for name, path in segment["paths"].items()}
+        for values in rows.values():
+            values[:, 0] += segment["start"]
+        mapping = {}
+        if previous is not None:
+            end = segments[i - 1]["start"] + segments[i - 1]["frames"]
+            mapping = match_people(previous, rows["ik3d"], range(segment["start"], end), max_distance)
+        for person in sorted(set(int(p) for values in rows.values() for p in values[:, 1])):
+            if person not in mapping:
+                mapping[person] = next_index
+                next_index += 1
+        # the overlaps are split in the middle
+        first = 0 if i == 0 else (segment["start"] + segments[i - 1]["start"] + segments[i - 1]["frames"]) // 2
+        last = float("inf")
+        if i + 1 < len(segments):
+            last = (segments[i + 1]["start"] + segment["start"] + segment["frames"]) // 2
+        for name, values in rows.items():
+            values[:, 1] = [mapping[int(p)] for p in values[:, 1]]
+            stitched[name].append(values[(values[:, 0] >= first) & (values[:, 0] < last)])
+        next_index = max(next_index, max(mapping.values()) + 1 if mapping else 0)
+        previous = rows["ik3d"]
+    for name, path in output_paths.items():
+        pose_store.save_rows(np.vstack(stitched[name]), path)
+    return next_index
@@ -13,12 +13,14 @@ var mixers = [], skeletonHelpers = []
 // Get all urls and convert them
 const newURLS = JSON.parse(document.getElementById("urls-array").content.replace(/'/g, '"'))
 const dataURL = newURLS[0]
+// start time of each bvh file in seconds, people can enter the video later than others
+const offsets = JSON.parse(document.getElementById("offsets-array").content)
 const originalURL = document.getElementById("original-url").content
 const rotate = document.getElementById("auto-rotate").content === "True"
 init();
 animate();
 // Iterate through each url
-for(var i = 0; i < newURLS.length; i++) {
+for(let i = 0; i < newURLS.length; i++) {
 	var loader = new BVHLoader()
 	console.log(newURLS[i])
 
@@ -34,7 +36,7 @@ for(var i = 0; i < newURLS.length; i++) {
 
 		// play animation
 		mixer = new THREE.AnimationMixer( skeletonHelper );
-		mixer.clipAction( result.clip ).setEffectiveWeight( 1.0 ).play();
+		mixer.clipAction( result.clip ).startAt( offsets[i] || 0 ).setEffectiveWeight( 1.0 ).play();
 		mixers.push(mixer);
 	})
 }
@@ -0,0 +1,376 @@
+"""
+STORAGE : Retention and eviction of the files in Config.CACHE_DIR.
+- raw xnect text outputs of a job are compressed after the bvh export (the tracked poses are kept as checkpoint)
+- source videos and unreferenced objects of the content store are moved to a cold backend after some days
+- regenerable files (filtered bvhs, zips, downscaled videos of finished jobs) are evicted by least recent use if the
+  free disk space is low
+- dirs of jobs deleted from the database are removed
+Archived files leave a small marker file (<name>.cold) and are fetched back from the cold backend on access.
+A stored video is archived together with the source videos of the jobs linking it, their markers point to the object.
+The last use of a file is tracked by its access time, the modification time is kept for the checkpoints.
+"""
+import fcntl
+import fnmatch
+import json
+import os
+import re
+import shutil
+import time
+
+from project.checkpoints import atomic_output
+from project.config import Config
+
+# suffix of the marker files of archived files
+COLD_SUFFIX = ".cold"
+
+
+class LocalBackend(object):
+    """
+    cold storage in a local directory (e.g. a cheap network drive)
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def put(self, path, key):
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target)
+
+    def get(self, key, path):
+        shutil.copyfile(self._path(key), path)
+
+    def delete(self, key):
+        if os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+
+class S3Backend(object):
+    """
+    cold storage in a S3 compatible object store (e.g. MinIO)
+    """
+    def __init__(self, bucket, endpoint_url=None, access_key=None, secret_key=None):
+        # optional dependency, only needed for this backend
+        import boto3
+        self.bucket = bucket
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, aws_access_key_id=access_key,
+                                   aws_secret_access_key=secret_key)
+
+    def put(self, path, key):
+        self.client.upload_file(path, self.bucket, key)
+
+    def get(self, key, path):
+        self.client.download_file(self.bucket, key, path)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+
+_backend = None
+
+
+def get_backend():
+    """
+    :return: the configured cold storage backend
+    """
+    global _backend
+    if _backend is None:
+        if Config.STORAGE_BACKEND == "s3":
+            _backend = S3Backend(Config.STORAGE_S3_BUCKET, Config.STORAGE_S3_ENDPOINT,
+                                 Config.STORAGE_S3_ACCESS_KEY, Config.STORAGE_S3_SECRET_KEY)
+        else:
+            _backend = LocalBackend(Config.STORAGE_COLD_DIR)
+    return _backend
+
+
+def file_pattern(name):
+    """
+    :param name: file name from the config, possibly with format placeholders
+    :return: glob pattern matching all files of this kind
+    """
+    return re.sub(r"%[di]", "*", name)
+
+
+def touch(path):
+    """
+    mark a file as recently used by setting its access time, the modification time is not changed
+    :param path: path of the file
+    """
+    try:
+        os.utime(str(path), (time.time(), os.path.getmtime(str(path))))
+    except OSError:
+        pass
+
+
+def _write_marker(path, info):
+    with atomic_output(path + COLD_SUFFIX) as tmp:
+        with open(tmp, 'w') as file:
+            json.dump(info, file)
+
+
+def archive(path, backend=None, links=()):
+    """
+    move a file to the cold backend and leave a marker
+    :param path: path of the file inside the cache dir
+    :param links: hard links of the file (source videos of jobs linking a stored video), they are replaced by markers
+    pointing to the file, so the space is freed and the data is stored only once
+    """
+    path = str(path)
+    backend = backend or get_backend()
+    key = os.path.relpath(path, Config.CACHE_DIR)
+    mtime = os.path.getmtime(path)
+    backend.put(path, key)
+    _write_marker(path, {"key": key, "mtime": mtime})
+    for link in links:
+        _write_marker(str(link), {"key": key, "mtime": mtime, "object": key})
+        os.remove(str(link))
+    os.remove(path)
+
+
+def is_archived(path):
+    """
+    :return: if a file has been moved to the cold backend
+    """
+    return not os.path.exists(str(path)) and os.path.exists(str(path) + COLD_SUFFIX)
+
+
+def ensure_local(path, backend=None):
+    """
+    fetch a file back from the cold backend, if it has been archived
+    :param path: path of the file inside the cache dir
+    :return: True, if the file exists locally now
+    """
+    path = str(path)
+    if os.path.exists(path):
+        touch(path)
+        return True
+    marker = path + COLD_SUFFIX
+    try:
+        file = open(marker)
+    except FileNotFoundError:
+        # not archived, or restored by another caller in the meantime
+        return os.path.exists(path)
+    with file:
+        # request threads and workers may fetch the same file at the same time, only the first one restores it
+        fcntl.flock(file, fcntl.LOCK_EX)
+        if os.path.exists(path):
+            touch(path)
+            return True
+        info = json.load(file)
+        if "object" in info:
+            # the file has been archived with the stored video it linked, restore the video and link it again
+            source = os.path.join(Config.CACHE_DIR, info["object"])
+            if not ensure_local(source, backend):
+                return False
+            with atomic_output(path) as tmp:
+                try:
+                    os.link(source, tmp)
+                except OSError:
+                    shutil.copyfile(source, tmp)
+            os.remove(marker)
+            return True
+        backend = backend or get_backend()
+        with atomic_output(path) as tmp:
+            backend.get(info["key"], tmp)
+            # restore the modification time, so the checkpoints depending on the file stay valid
+            os.utime(tmp, (time.time(), info["mtime"]))
+        os.remove(marker)
+        backend.delete(info["key"])
+    return True
+
+
+def drop_xnect_raw(result_cache_dir):
+    """
+    remove the raw xnect text outputs of a job, they are kept in compressed form for reprocessing
+    :param result_cache_dir: result dir of the job
+    :return: number of freed bytes
+    """
+    # imported here, so the web app can use this module without loading numpy
+    from project import pose_store
+    freed = 0
+    for name in ["raw2d", "raw3d", "ik3d"]:
+        path = os.path.join(str(result_cache_dir), "%s.txt" % name)
+        if os.path.exists(path):
+            freed += os.path.getsize(path)
+            compressed = os.path.join(str(result_cache_dir), Config.XNECT_OUTPUT_FILE % name)
+            if not os.path.exists(compressed):
+                with atomic_output(compressed) as tmp:
+                    pose_store.convert_txt(path, tmp)
+                freed -= os.path.getsize(compressed)
+            os.remove(path)
+    return freed
+
+
+def _job_dirs():
+    for name in os.listdir(Config.CACHE_DIR):
+        path = os.path.join(Config.CACHE_DIR, name)
+        if name.isdigit() and os.path.isdir(path):
+            yield path
+
+
+def _object_files():
+    objects_dir = os.path.join(Config.CACHE_DIR, Config.OBJECTS_DIR)
+    if not os.path.isdir(objects_dir):
+        return
+    for name in os.listdir(objects_dir):
+        directory = os.path.join(objects_dir, name)
+        if os.path.isdir(directory):
+            for file in os.listdir(directory):
+                if not file.endswith(COLD_SUFFIX):
+                    yield os.path.join(directory, file)
+
+
+def _regenerable_files():
+    patterns = [file_pattern(Config.OUTPUT_BVH_FILE_FILTERED_DYNAMIC_NUMBERED), Config.OUTPUT_ZIP_FILE]
+    for job_dir in _job_dirs():
+        result_dir = os.path.join(job_dir, Config.RESULT_DIR)
+        if not os.path.isdir(result_dir):
+            continue
+        # the downscaled video is only needed until the bvh export has finished
+        analysed = os.path.join(job_dir, Config.ANALYSED_VIDEO_FILE)
+        exported = os.path.exists(os.path.join(result_dir, Config.OUTPUT_BVH_FILE_RAW_NUMBERED % 1))
+        if exported and os.path.exists(analysed):
+            yield analysed
+        for file in os.listdir(result_dir):
+            if any(fnmatch.fnmatch(file, pattern) for pattern in patterns):
+                yield os.path.join(result_dir, file)
+
+
+def _inode(stat):
+    return stat.st_dev, stat.st_ino
+
+
+def _archivable_files(min_age, active_jobs=()):
+    """
+    source videos of jobs and objects of the content store, with the links that are archived with them.
+    The source video of a job is usually a hard link to a stored video (see content_store.link_video). A stored video
+    is archived with all source videos linking it, once it is not linked by any other file and no queued or running
+    job uses it. The links share the access time, so a stored video is as old as the last access of any job.
+    :param min_age: seconds since the last access
+    :param active_jobs: ids of the jobs that are queued or running, their source videos are kept
+    :return: list of (path, links of the path)
+    """
+    now = time.time()
+    active = set(str(job_id) for job_id in active_jobs)
+    sources = {}
+    used = set()
+    for job_dir in _job_dirs():
+        path = os.path.join(job_dir, Config.SOURCE_VIDEO_FILE)
+        if not os.path.exists(path):
+            continue
+        inode = _inode(os.stat(path))
+        sources.setdefault(inode, []).append(path)
+        if os.path.basename(job_dir) in active:
+            used.add(inode)
+    candidates = []
+    stored = set()
+    for path in _object_files():
+        stat = os.stat(path)
+        stored.add(_inode(stat))
+        links = sources.get(_inode(stat), [])
+        if _inode(stat) not in used and stat.st_nlink == 1 + len(links) and now - stat.st_atime >= min_age:
+            candidates.append((path, links))
+    # source videos that are not in the content store (stored before it, or copied because linking failed)
+    for inode, paths in sources.items():
+        stat = os.stat(paths[0])
+        if inode not in stored and inode not in used and stat.st_nlink == 1 and now - stat.st_atime >= min_age:
+            candidates.append((paths[0], []))
+    return candidates
+
+
+def reclaim_deleted_jobs(job_ids, backend=None):
+    """
+    remove the dirs of jobs that have been deleted from the database, the stored videos they linked are kept
+    :param job_ids: ids of all jobs in the database
+    :return: statistics of the removed dirs
+    """
+    stats = {"reclaimed_dirs": 0, "reclaimed_bytes": 0}
+    known = set(int(job_id) for job_id in job_ids)
+    if not known:
+        return stats
+    # a dir of a job newer than the list may belong to a job created in the meantime
+    newest = max(known)
+    for job_dir in list(_job_dirs()):
+        job_id = int(os.path.basename(job_dir))
+        if job_id in known or job_id > newest:
+            continue
+        for root, _, files in os.walk(job_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith(COLD_SUFFIX):
+                    with open(path) as file:
+                        info = json.load(file)
+                    # the key of a linked video belongs to the stored video
+                    if "object" not in info:
+                        (backend or get_backend()).delete(info["key"])
+                elif os.stat(path).st_nlink == 1:
+                    stats["reclaimed_bytes"] += os.path.getsize(path)
+        shutil.rmtree(job_dir)
+        stats["reclaimed_dirs"] += 1
+    return stats
+
+
+def apply_retention(active_jobs=()):
+    """
+    apply the retention policies to all jobs
+    :param active_jobs: ids of the jobs that are queued or running
+    :return: statistics of the removed and archived files
+    """
+    stats = {"dropped_bytes": 0, "archived_files": 0, "archived_bytes": 0}
+    if Config.STORAGE_DROP_XNECT_RAW:
+        for job_dir in _job_dirs():
+            result_dir = os.path.join(job_dir, Config.RESULT_DIR)
+            # only drop the outputs, if the bvh export has finished
+            if os.path.exists(os.path.join(result_dir, Config.OUTPUT_BVH_FILE_RAW_NUMBERED % 1)):
+                stats["dropped_bytes"] += drop_xnect_raw(result_dir)
+    if Config.STORAGE_ARCHIVE_AFTER_DAYS is not None:
+        for path, links in _archivable_files(Config.STORAGE_ARCHIVE_AFTER_DAYS * 86400, active_jobs):
+            stats["archived_bytes"] += os.path.getsize(path)
+            stats["archived_files"] += 1
+            archive(path, links=links)
+    return stats
+
+
+def evict(min_free_bytes, active_jobs=(), job_ids=None):
+    """
+    free disk space until at least min_free_bytes are free. The dirs of deleted jobs are removed first, then
+    regenerable files are deleted and source videos and stored videos are archived, both in least recently used order.
+    :param min_free_bytes: required free space of the cache dir
+    :param active_jobs: ids of the jobs that are queued or running, the stages still read their source videos
+    :param job_ids: ids of all jobs in the database, None keeps the dirs of all jobs
+    :return: statistics of the evicted files
+    """
+    stats = {"evicted_files": 0, "evicted_bytes": 0, "archived_files": 0, "archived_bytes": 0}
+    if job_ids is not None:
+        stats.update(reclaim_deleted_jobs(job_ids))
+
+    def free():
+        return shutil.disk_usage(Config.CACHE_DIR).free
+
+    for path in sorted(_regenerable_files(), key=os.path.getatime):
+        if free() >= min_free_bytes:
+            return stats
+        stats["evicted_bytes"] += os.path.getsize(path)
+        stats["evicted_files"] += 1
+        os.remove(path)
+    for path, links in sorted(_archivable_files(0, active_jobs), key=lambda candidate: os.path.getatime(candidate[0])):
+        if free() >= min_free_bytes:
+            return stats
+        stats["archived_bytes"] += os.path.getsize(path)
+        stats["archived_files"] += 1
+        archive(path, links=links)
+    return stats
+
+
+def run_maintenance(active_jobs=(), job_ids=None):
+    """
+    apply the retention policies and evict files if the disk space is low
+    :param active_jobs: ids of the jobs that are queued or running
+    :param job_ids: ids of all jobs in the database, the dirs of other jobs are removed
+    :return: statistics
+    """
+    stats = apply_retention(active_jobs)
+    stats.update(evict(Config.STORAGE_MIN_FREE_BYTES, active_jobs, job_ids))
+    return stats
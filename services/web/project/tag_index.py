@@ -0,0 +1,329 @@
+"""
+TAG INDEX : In-memory inverted index over the tags of public jobs. It is used for filtering the feed by tags,
+for tag counts (facets) and for prefix autocomplete without touching the JobTag table on every request.
+"""
+import bisect
+import heapq
+import itertools
+import json
+import threading
+
+
+class TagIndex(object):
+    """
+    Inverted index tag -> ids of public jobs carrying the tag. The ids of a tag are also kept sorted, so a page of
+    the newest jobs matching some tags is found without sorting all matches. For every tag, the number of jobs
+    carrying it together with each other tag is kept, so the facets of one tag are counted without visiting its jobs.
+    The index is built lazily with the given loader and kept in sync by calling add / remove when a job is
+    published or unpublished. If a redis connection is given, every change is published in a change log in redis
+    under an increasing version. The other gunicorn workers apply the changes they have missed to their own copy and
+    only rebuild it, if the changes are not in the log anymore.
+    """
+    def __init__(self, loader=None, connection=None, version_key="tag_index:version", log_key="tag_index:log",
+                 log_size=10000, facet_sample=1000):
+        """
+        :param loader: function returning an iterable of (job_id, tag_text) for all public jobs
+        :param connection: optional redis connection used to share the changes between processes
+        :param version_key: redis key of the version counter
+        :param log_key: redis key of the change log (hash version -> change)
+        :param log_size: number of changes kept in the log
+        :param facet_sample: the facets of several tags are counted over this many of the newest matching jobs
+        """
+        self.loader = loader
+        self.connection = connection
+        self.version_key = version_key
+        self.log_key = log_key
+        self.log_size = log_size
+        self.facet_sample = facet_sample
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._ordered = {}
+        self._cooccurrence = {}
+        self._job_tags = {}
+        self._sorted_tags = []
+        self._version = None
+        self._loaded = False
+
+    def _remote_version(self):
+        """
+        :return: version of the index stored in redis, or the local version if there is no connection
+        """
+        if self.connection is None:
+            return self._version
+        try:
+            return int(self.connection.get(self.version_key) or 0)
+        except Exception:
+            # redis is not reachable, keep using the local copy
+            return self._version
+
+    def _publish(self, change):
+        """
+        append a change to the log
+        :param change: change as dict, see _apply
+        :return: version of the change, None if there is no connection or redis is not reachable
+        """
+        if self.connection is None:
+            return None
+        try:
+            version = self.connection.incr(self.version_key)
+            pipeline = self.connection.pipeline()
+            pipeline.hset(self.log_key, version, json.dumps(change))
+            pipeline.hdel(self.log_key, version - self.log_size)
+            pipeline.execute()
+        except Exception:
+            self._loaded = False
+            return None
+        return version
+
+    def _catch_up(self, version):
+        """
+        apply the changes of the other processes up to a version
+        :param version: version to reach
+        :return: False, if the changes are not in the log anymore and the index has to be rebuilt
+        """
+        if self._version is None or version < self._version or version - self._version > self.log_size:
+            return False
+        if version == self._version:
+            return True
+        try:
+            changes = self.connection.hmget(self.log_key, list(range(self._version + 1, version + 1)))
+        except Exception:
+            return False
+        # a change is missing if it has been trimmed, or if its version was taken but it is not written yet
+        if any(change is None for change in changes):
+            return False
+        for change in changes:
+            self._apply(json.loads(change))
+        self._version = version
+        return True
+
+    def _apply(self, change):
+        """
+        apply a change, applying it twice has no effect
+        :param change: {"op": "add", "job": job id, "tags": tag texts} or {"op": "remove", "job": job id}
+        """
+        self._remove(change["job"])
+        if change["op"] == "add":
+            self._add(change["job"], change["tags"])
+
+    def _add(self, job_id, tags):
+        self._job_tags[job_id] = set(tags)
+        for tag in self._job_tags[job_id]:
+            postings = self._postings.get(tag)
+            if postings is None:
+                postings = self._postings[tag] = set()
+                self._ordered[tag] = []
+                bisect.insort(self._sorted_tags, tag)
+            postings.add(job_id)
+            bisect.insort(self._ordered[tag], job_id)
+        self._count_pairs(self._job_tags[job_id], 1)
+
+    def _count_pairs(self, tags, delta):
+        for tag in tags:
+            counts = self._cooccurrence.setdefault(tag, {})
+            for other in tags:
+                if other != tag:
+                    count = counts.get(other, 0) + delta
+                    if count:
+                        counts[other] = count
+                    else:
+                        del counts[other]
+
+    def _remove(self, job_id):
+        tags = self._job_tags.pop(job_id, ())
+        self._count_pairs(tags, -1)
+        for tag in tags:
+            postings = self._postings[tag]
+            postings.discard(job_id)
+            ordered = self._ordered[tag]
+            del ordered[bisect.bisect_left(ordered, job_id)]
+            if not postings:
+                del self._postings[tag]
+                del self._ordered[tag]
+                del self._cooccurrence[tag]
+                del self._sorted_tags[bisect.bisect_left(self._sorted_tags, tag)]
+
+    def rebuild(self):
+        """
+        rebuild the complete index using the loader
+        """
+        with self._lock:
+            # changes made while loading are applied again by the next _catch_up, which has no effect
+            version = self._remote_version()
+            self._postings = {}
+            self._ordered = {}
+            self._cooccurrence = {}
+            self._job_tags = {}
+            self._sorted_tags = []
+            if self.loader is not None:
+                for job_id, tag in self.loader():
+                    tags = self._job_tags.get(job_id)
+                    if tags is None:
+                        tags = self._job_tags[job_id] = set()
+                    tags.add(tag)
+            # the lists are sorted once, inserting every id in order would be quadratic on unsorted rows
+            for job_id, tags in self._job_tags.items():
+                for tag in tags:
+                    postings = self._postings.get(tag)
+                    if postings is None:
+                        postings = self._postings[tag] = set()
+                        self._ordered[tag] = []
+                    postings.add(job_id)
+                    self._ordered[tag].append(job_id)
+                self._count_pairs(tags, 1)
+            for ordered in self._ordered.values():
+                ordered.sort()
+            self._sorted_tags = sorted(self._postings)
+            self._version = version
+            self._loaded = True
+
+    def ensure_fresh(self):
+        """
+        build the index if it has not been built yet and apply the changes of other processes
+        """
+        if not self._loaded:
+            self.rebuild()
+            return
+        version = self._remote_version()
+        if version != self._version and not self._catch_up(version):
+            self.rebuild()
+
+    def _change(self, change):
+        """
+        apply a change to the local index and publish it for the other processes
+        """
+        with self._lock:
+            self.ensure_fresh()
+            version = self._publish(change)
+            # changes published by other processes since ensure_fresh come before this one
+            if version is not None and not self._catch_up(version - 1):
+                # the database already contains this change
+                self.rebuild()
+                return
+            self._apply(change)
+            if version is not None:
+                self._version = version
+
+    def add(self, job_id, tags):
+        """
+        add (or replace) a public job in the index
+        :param job_id: job id
+        :param tags: tag texts of the job
+        """
+        self._change({"op": "add", "job": job_id, "tags": list(tags)})
+
+    def remove(self, job_id):
+        """
+        remove a job from the index, e.g. when it is unpublished or deleted
+        :param job_id: job id
+        """
+        self._change({"op": "remove", "job": job_id})
+
+    def search(self, tags, match_all=False):
+        """
+        get the ids of all public jobs matching the tags
+        :param tags: tag texts
+        :param match_all: if True, a job needs all tags (AND), otherwise one of them is enough (OR)
+        :return: set of job ids
+        """
+        with self._lock:
+            self.ensure_fresh()
+            postings = [self._postings.get(tag, set()) for tag in set(tags)]
+            if not postings:
+                return set()
+            if match_all:
+                # intersect starting with the smallest set
+                postings.sort(key=len)
+                return set.intersection(*postings)
+            return set().union(*postings)
+
+    def _newest(self, tags, match_all, count):
+        """
+        :return: ids of the newest jobs matching the tags, newest first, at most count (None: all)
+        """
+        tags = set(tags)
+        if not tags or (match_all and any(tag not in self._postings for tag in tags)):
+            return []
+        if len(tags) == 1:
+            ordered = self._ordered.get(tags.pop(), [])
+            start = 0 if count is None else max(0, len(ordered) - count)
+            return ordered[start:][::-1]
+        if match_all:
+            # filter the newest ids of the smallest posting list block by block, until enough of them match
+            tags = sorted(tags, key=lambda tag: len(self._postings[tag]))
+            others = [self._postings[tag] for tag in tags[1:]]
+            ordered = self._ordered[tags[0]]
+            ids = []
+            end, block_size = len(ordered), 1024
+            while end > 0 and (count is None or len(ids) < count):
+                block = ordered[max(0, end - block_size):end]
+                end -= len(block)
+                block_size *= 2
+                for postings in others:
+                    block = [job_id for job_id in block if job_id in postings]
+                ids.extend(reversed(block))
+            return ids[:count]
+        merged = heapq.merge(*[reversed(self._ordered[tag]) for tag in tags if tag in self._ordered], reverse=True)
+        # a job with several of the tags appears once per tag, next to each other
+        return list(itertools.islice((job_id for job_id, _ in itertools.groupby(merged)), count))
+
+    def page(self, tags, match_all=False, offset=0, limit=None):
+        """
+        get a page of the ids of the public jobs matching the tags, newest (highest id) first
+        :param tags: tag texts
+        :param match_all: if True, a job needs all tags (AND), otherwise one of them is enough (OR)
+        :param offset: number of skipped ids
+        :param limit: maximum number of ids, None for all
+        :return: list of job ids
+        """
+        with self._lock:
+            self.ensure_fresh()
+            return self._newest(tags, match_all, None if limit is None else offset + limit)[offset:]
+
+    def facets(self, tags=None, match_all=False, limit=None):
+        """
+        count the tags of public jobs. The counts of one filter tag are exact, the counts of several filter tags are
+        taken from the newest facet_sample matching jobs.
+        :param tags: optional tags, only jobs matching them are counted
+        :param match_all: combine the filter tags with AND instead of OR
+        :param limit: maximum number of returned tags
+        :return: list of {"text", "count"} ordered by count
+        """
+        with self._lock:
+            self.ensure_fresh()
+            tags = set(tags or ())
+            if not tags:
+                counts = [(-len(postings), tag) for tag, postings in self._postings.items()]
+            elif len(tags) == 1:
+                tag = tags.pop()
+                if tag not in self._postings:
+                    return []
+                counts = [(-count, other) for other, count in self._cooccurrence[tag].items()]
+                counts.append((-len(self._postings[tag]), tag))
+            else:
+                sample = {}
+                for job_id in self._newest(tags, match_all, self.facet_sample):
+                    for tag in self._job_tags[job_id]:
+                        sample[tag] = sample.get(tag, 0) + 1
+                counts = [(-count, tag) for tag, count in sample.items()]
+        # (-count, tag) tuples sort by count, then by text
+        facets = sorted(counts) if limit is None else heapq.nsmallest(limit, counts)
+        return [{"text": tag, "count": -count} for count, tag in facets]
+
+    def autocomplete(self, prefix, limit=10):
+        """
+        get tags starting with a prefix
+        :param prefix: prefix of the tag
+        :param limit: maximum number of returned tags
+        :return: list of {"text", "count"} ordered by count
+        """
+        with self._lock:
+            self.ensure_fresh()
+            matches = []
+            start = bisect.bisect_left(self._sorted_tags, prefix)
+            for tag in self._sorted_tags[start:]:
+                if not tag.startswith(prefix):
+                    break
+                matches.append((tag, len(self._postings[tag])))
+        matches.sort(key=lambda item: (-item[1], item[0]))
+        return [{"text": tag, "count": count} for tag, count in matches[:limit]]
@@ -0,0 +1,153 @@
+"""
+TRACKING : Online tracking of the people in the ik3d output of xnect.
+The frames are processed one after another: detections are matched greedily to the active tracks by their mean joint
+distance, unmatched detections start new tracks (birth) and tracks without detections for some frames end (death).
+Every track has its own start and end frame, so people entering late or leaving early do not cut the motion of the
+others. The run time is linear in the number of frames, so the tracker can also consume a stream of frames.
+"""
+import numpy as np
+
+
+def pose_distance(a, b):
+    """
+    :return: mean distance of the joints of two poses (joints x 3)
+    """
+    return float(np.mean(np.linalg.norm(a - b, axis=-1)))
+
+
+class Track(object):
+    """
+    poses of one person from its first to its last detection. Frames without a detection and outliers are filled
+    with the last valid pose.
+    """
+    def __init__(self, id, start, pose):
+        self.id = id
+        self.start = start
+        self.poses = [pose]
+        self.valid = [True]
+        self.is_outlier = [False]
+        self.last_pose = pose
+        self.mean_step = None
+        self.steps = 0
+        self.outliers = 0
+
+    @property
+    def end(self):
+        """
+        :return: last frame of the track
+        """
+        return self.start + len(self.poses) - 1
+
+    def add(self, frame, pose, distance, outlier_factor, max_outliers):
+        """
+        add the detection of a frame
+        :param frame: frame index
+        :param pose: pose (joints x 3)
+        :param distance: distance to the last valid pose
+        :param outlier_factor: a pose is an outlier, if the distance is this many times the mean distance
+        :param max_outliers: number of consecutive outliers after which the pose is accepted as new position
+        """
+        for _ in range(frame - self.end - 1):
+            self.poses.append(self.last_pose)
+            self.valid.append(False)
+            self.is_outlier.append(False)
+        outlier = self.mean_step is not None and distance > outlier_factor * self.mean_step and \
+            self.outliers < max_outliers
+        self.valid.append(True)
+        self.is_outlier.append(outlier)
+        if outlier:
+            self.outliers += 1
+            self.poses.append(self.last_pose)
+            return
+        self.outliers = 0
+        self.poses.append(pose)
+        self.last_pose = pose
+        self.mean_step = distance if self.mean_step is None else \
+            (self.mean_step * self.steps + distance) / (self.steps + 1)
+        self.steps += 1
+
+
+class TrackManager(object):
+    """
+    Online tracker: call update for every frame with detections (in increasing order) and close at the end.
+    """
+    def __init__(self, max_distance, max_missed, min_length, outlier_factor=3, max_outliers=5):
+        """
+        :param max_distance: maximum mean joint distance of a detection to the last pose of its track per frame
+        :param max_missed: a track ends after this many frames without a detection
+        :param min_length: shorter tracks are dropped as false detections
+        :param outlier_factor: see Track.add
+        :param max_outliers: see Track.add
+        """
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.min_length = min_length
+        self.outlier_factor = outlier_factor
+        self.max_outliers = max_outliers
+        self.active = []
+        self.finished = []
+        self._next_id = 0
+
+    def _end(self, track):
+        self.active.remove(track)
+        if len(track.poses) >= self.min_length:
+            self.finished.append(track)
+
+    def update(self, frame, poses):
+        """
+        process the detections of a frame
+        :param frame: frame index
+        :param poses: poses (people x joints x 3) detected in the frame
+        """
+        for track in list(self.active):
+            if frame - track.end > self.max_missed:
+                self._end(track)
+        pairs = []
+        for didx, pose in enumerate(poses):
+            for tidx, track in enumerate(self.active):
+                distance = pose_distance(pose, track.last_pose)
+                # people can move further, if the track has not been seen for some frames
+                if distance <= self.max_distance * (frame - track.end):
+                    pairs.append((distance, didx, tidx))
+        pairs.sort()
+        matched_detections, matched_tracks = set(), set()
+        for distance, didx, tidx in pairs:
+            if didx in matched_detections or tidx in matched_tracks:
+                continue
+            matched_detections.add(didx)
+            matched_tracks.add(tidx)
+            self.active[tidx].add(frame, poses[didx], distance, self.outlier_factor, self.max_outliers)
+        for didx, pose in enumerate(poses):
+            if didx not in matched_detections:
+                self.active.append(Track(self._next_id, frame, pose))
+                self._next_id += 1
+
+    def close(self):
+        """
+        end all active tracks
+        :return: all tracks ordered by their start frame
+        """
+        for track in list(self.active):
+            self._end(track)
+        return sorted(self.finished, key=lambda track: (track.start, track.id))
+
+
+def track_archive(archive, manager):
+    """
+    track the people of an archived ik3d output (see project/pose_store.py)
+    :param archive: PoseArchive of the ik3d output
+    :param manager: TrackManager
+    :return: tracks ordered by their start frame, the poses are relative to the origin of the first pose
+    """
+    origin = None
+    for idx in range(archive.num_frames):
+        _, values = archive.frame(idx)
+        if len(values) == 0:
+            continue
+        poses = values.reshape([len(values), -1, 3]).astype(np.float64)
+        if origin is None:
+            # source: XNECT Matlab demo import
+            direction_vector = poses[0][13] - poses[0][10]
+            origin = poses[0][13] - direction_vector * .5
+        manager.update(idx, poses - origin)
+    return manager.close()
@@ -0,0 +1,73 @@
+"""
+TRANSCODING : Downscaling and frame rate reduction of the source videos before the pose estimation.
+The cost of xnect grows with the number of pixels and frames, but the bvh quality hardly improves above ~720p
+and 30 fps. The limits are set by quality tiers (Config.QUALITY_TIERS), videos below the limits are used as they are.
+"""
+import math
+import subprocess
+
+from project.config import Config
+
+
+def even(value):
+    """
+    :return: value rounded to an even number (required by the h264 encoder)
+    """
+    return max(2, int(round(value / 2.0)) * 2)
+
+
+def target_format(width, height, fps, quality=None):
+    """
+    get the format of the analysed video for a quality tier. The shorter side of the video is scaled to the
+    maximum height of the tier, the frame rate is divided by an integer, so the remaining frames keep an even spacing.
+    :param width: width of the source video
+    :param height: height of the source video
+    :param fps: frame rate of the source video
+    :param quality: name of the quality tier (default: Config.DEFAULT_QUALITY)
+    :return: dictionary with quality, width, height, fps and step (every step-th frame is kept),
+    or None if the source video can be used as it is
+    """
+    quality = quality or Config.DEFAULT_QUALITY
+    tier = Config.QUALITY_TIERS[quality]
+    scale = 1.0
+    if tier.get("max_height") and min(width, height) > tier["max_height"]:
+        scale = tier["max_height"] / float(min(width, height))
+    step = 1
+    if tier.get("max_fps") and fps and fps > tier["max_fps"]:
+        step = int(math.ceil(fps / float(tier["max_fps"])))
+    if scale == 1.0 and step == 1:
+        return None
+    return {"quality": quality, "width": even(width * scale), "height": even(height * scale),
+            "fps": fps / float(step), "step": step}
+
+
+def extract_frames(source, target, start, fps, count=None):
+    """
+    cut a segment of a video, the first frame is found by an accurate seek, so the frames before are not decoded
+    :param source: path of the video
+    :param target: path of the segment (.mp4)
+    :param start: first frame of the segment
+    :param fps: frame rate of the video
+    :param count: number of frames of the segment, None until the end of the video
+    """
+    command = ["ffmpeg", "-y", "-v", "error", "-ss", "%f" % (start / float(fps)), "-i", str(source)]
+    if count is not None:
+        command += ["-frames:v", str(count)]
+    subprocess.run(command + ["-an", "-c:v", "libx264", "-preset", Config.TRANSCODE_PRESET,
+                              "-crf", str(Config.TRANSCODE_CRF), str(target)], check=True)
+
+
+def transcode(source, target, video_format):
+    """
+    transcode a video with ffmpeg
+    :param source: path of the source video
+    :param target: path of the transcoded video (.mp4)
+    :param video_format: output of target_format
+    """
+    filters = "scale=%d:%d" % (video_format["width"], video_format["height"])
+    if video_format["step"] > 1:
+        # keep every step-th frame
+        filters += ",select='not(mod(n\\,%d))',setpts=N/(%f*TB)" % (video_format["step"], video_format["fps"])
+    subprocess.run(["ffmpeg", "-y", "-v", "error", "-i", str(source), "-vf", filters, "-r", "%f" % video_format["fps"],
+                    "-an", "-c:v", "libx264", "-preset", Config.TRANSCODE_PRESET, "-crf", str(Config.TRANSCODE_CRF),
+                    str(target)], check=True)
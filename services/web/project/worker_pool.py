@@ -0,0 +1,126 @@
+"""
+WORKER POOL : Processes of the rq worker (manage.py run_worker).
+By default rq forks a new process for every job, so everything a job loads (the models of the lifting stage, the
+skeletons, database connections) is gone after the job. In the warm mode, the pipeline is imported and the skeletons
+are built once, then a pool of processes is forked that run the jobs in-process (rq.SimpleWorker) and keep what
+they have loaded between jobs. A process is replaced after max_jobs jobs, so its memory cannot grow without bound.
+In both modes, the fixed overhead of every job (everything but the job function itself) is recorded as
+worker_job_overhead_seconds (see project/metrics.py).
+"""
+import multiprocessing
+import signal
+import time
+
+import redis
+from rq import Connection, Queue, SimpleWorker, Worker
+from rq.exceptions import NoSuchJobError
+
+from project import metrics
+from project.config import Config
+
+MODES = ["fork", "warm"]
+
+
+def warm_up():
+    """
+    import the pipeline and build the skeletons, the processes of the pool inherit them when they are forked
+    """
+    from project import conversion_task, lifting
+    conversion_task.muco_skeleton()
+    lifting.skeleton()
+
+
+class OverheadMixin(object):
+    """
+    measures the time the worker spends on a job minus the run time of the job function
+    """
+    mode = None
+
+    def execute_job(self, job, queue):
+        start = time.perf_counter()
+        result = super(OverheadMixin, self).execute_job(job, queue)
+        seconds = time.perf_counter() - start
+        try:
+            # the forked process stores the start and the end of the job function in redis
+            job.refresh()
+        except NoSuchJobError:
+            return result
+        if job.started_at is not None and job.ended_at is not None:
+            run_seconds = (job.ended_at - job.started_at).total_seconds()
+            metrics.observe_job_overhead(self.mode, max(seconds - run_seconds, 0.0), job=job.id)
+        return result
+
+
+class ForkWorker(OverheadMixin, Worker):
+    mode = "fork"
+
+
+class WarmWorker(OverheadMixin, SimpleWorker):
+    mode = "warm"
+
+
+def run_worker(queues, mode="fork", max_jobs=None, burst=False):
+    """
+    run a rq worker in this process (blocking)
+    :param queues: queue names ordered by priority
+    :param mode: "fork" or "warm"
+    :param max_jobs: the worker stops after this many jobs
+    :param burst: stop when the queues are empty
+    """
+    worker_class = WarmWorker if mode == "warm" else ForkWorker
+    with Connection(redis.from_url(Config.REDIS_URL)):
+        worker_class(queues).work(burst=burst, max_jobs=max_jobs or None)
+
+
+def queued_jobs(queues):
+    """
+    :param queues: queue names
+    :return: number of jobs waiting in the queues
+    """
+    connection = redis.from_url(Config.REDIS_URL)
+    return sum(Queue(name, connection=connection).count for name in queues)
+
+
+def run_pool(queues, processes=1, mode="fork", max_jobs=0, burst=False):
+    """
+    keep a number of worker processes running, a process that stopped after max_jobs jobs is replaced (blocking).
+    SIGTERM and SIGINT are passed on, the processes finish their current job before they stop.
+    :param queues: queue names ordered by priority
+    :param processes: number of worker processes
+    :param mode: "fork" or "warm"
+    :param max_jobs: jobs after which a process is replaced, 0: never
+    :param burst: stop when the queues are empty
+    """
+    if mode == "warm":
+        warm_up()
+    if processes == 1 and not max_jobs:
+        run_worker(queues, mode, burst=burst)
+        return
+    pool = []
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for process in pool:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while True:
+        for i in range(processes):
+            if stopping or i < len(pool) and pool[i].is_alive():
+                continue
+            if burst and i < len(pool) and pool[i].exitcode == 0 and queued_jobs(queues) == 0:
+                continue
+            if i < len(pool):
+                print("Worker process %d exited with code %s, starting a new one" % (pool[i].pid, pool[i].exitcode))
+            process = multiprocessing.Process(target=run_worker, args=(queues, mode, max_jobs, burst))
+            process.start()
+            if i < len(pool):
+                pool[i] = process
+            else:
+                pool.append(process)
+        if not any(process.is_alive() for process in pool):
+            return
+        time.sleep(1)
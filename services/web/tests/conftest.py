@@ -0,0 +1,60 @@
+"""
+Fixtures of the tests. They run without docker: the cache dir and the cold storage are temporary dirs, the database is
+sqlite in memory and redis is replaced by fakeredis.
+"""
+import os
+
+import pytest
+
+# settings of the app, as in docker-compose.yml
+os.environ.setdefault("APP_SETTINGS", "project.config.Config")
+
+from project import storage
+from project.config import Config
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """
+    :return: empty cache dir, used as Config.CACHE_DIR
+    """
+    directory = tmp_path / "cache"
+    directory.mkdir()
+    monkeypatch.setattr(Config, "CACHE_DIR", str(directory))
+    return str(directory)
+
+
+@pytest.fixture
+def cold_backend(tmp_path, monkeypatch):
+    """
+    :return: local cold storage backend in a temporary dir, used as the configured backend
+    """
+    backend = storage.LocalBackend(str(tmp_path / "cold"))
+    monkeypatch.setattr(storage, "_backend", backend)
+    return backend
+
+
+@pytest.fixture
+def redis_connection():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeStrictRedis()
+
+
+@pytest.fixture
+def model(redis_connection, monkeypatch):
+    """
+    :return: the model module with empty tables and an empty tag index
+    """
+    # the app imports the model, not the other way round
+    import project.app
+    from project.model import model
+    monkeypatch.setattr(model, "conn", redis_connection)
+    monkeypatch.setattr(model.tag_index, "connection", redis_connection)
+    # the index is built again from the empty tables
+    monkeypatch.setattr(model.tag_index, "_loaded", False)
+    with model.app.app_context():
+        model.db.create_all()
+        yield model
+        model.db.session.remove()
+        model.db.drop_all()
+
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from project import checkpoints
+
+
+def write(path, data=b"data", mtime=None):
+    with open(str(path), "wb") as file:
+        file.write(data)
+    if mtime is not None:
+        os.utime(str(path), (mtime, mtime))
+    return path
+
+
+def test_is_fresh(tmp_path):
+    source = write(tmp_path / "source", mtime=1000)
+    output = write(tmp_path / "output", mtime=2000)
+    assert checkpoints.is_fresh([output], [source])
+    assert checkpoints.is_fresh([output], [tmp_path / "missing input"])
+    write(source, mtime=3000)
+    assert not checkpoints.is_fresh([output], [source])
+    assert not checkpoints.is_fresh([output, tmp_path / "missing"], [])
+    assert not checkpoints.is_fresh([write(tmp_path / "empty", b"")])
+    assert not checkpoints.is_fresh([])
+
+
+def test_atomic_output_replaces_the_output(tmp_path):
+    path = write(tmp_path / "output.npz", b"old")
+    with checkpoints.atomic_output(path) as tmp:
+        assert tmp.endswith(".npz") and tmp != str(path)
+        write(tmp, b"new")
+        assert open(str(path), "rb").read() == b"old"
+    assert open(str(path), "rb").read() == b"new"
+    assert os.listdir(str(tmp_path)) == ["output.npz"]
+
+
+def test_atomic_output_keeps_the_output_on_errors(tmp_path):
+    path = write(tmp_path / "output.npz", b"old")
+    with pytest.raises(RuntimeError):
+        with checkpoints.atomic_output(path) as tmp:
+            write(tmp, b"partial")
+            raise RuntimeError("worker died")
+    assert open(str(path), "rb").read() == b"old"
+    assert os.listdir(str(tmp_path)) == ["output.npz"]
+
+
+def test_json_checkpoint(tmp_path):
+    checkpoints.write_json(tmp_path / "plan.json", [{"start": 0, "frames": 10}])
+    assert checkpoints.read_json(tmp_path / "plan.json") == [{"start": 0, "frames": 10}]
@@ -0,0 +1,41 @@
+import hashlib
+import io
+import os
+
+from project import content_store
+from project.config import Config
+
+
+def test_same_video_is_stored_once(cache_dir):
+    first = content_store.store_stream(io.BytesIO(b"video"))
+    second = content_store.store_stream(io.BytesIO(b"video"))
+    assert first == second == hashlib.sha256(b"video").hexdigest()
+    assert os.listdir(content_store.object_dir(first)) == [Config.SOURCE_VIDEO_FILE]
+    # no temporary uploads are left behind
+    assert os.listdir(os.path.join(cache_dir, Config.OBJECTS_DIR)) == [first]
+
+
+def test_jobs_link_the_stored_video(cache_dir, tmp_path):
+    video_hash = content_store.store_stream(io.BytesIO(b"video"))
+    targets = [str(tmp_path / "1.mp4"), str(tmp_path / "2.mp4")]
+    for target in targets:
+        assert content_store.link_video(video_hash, target)
+    stored = os.path.join(content_store.object_dir(video_hash), Config.SOURCE_VIDEO_FILE)
+    assert all(os.path.samefile(stored, target) for target in targets)
+    assert not content_store.link_video("0" * 64, str(tmp_path / "3.mp4"))
+
+
+def test_outputs_are_shared_per_quality(cache_dir, tmp_path):
+    video_hash = content_store.store_stream(io.BytesIO(b"video"))
+    first, second = tmp_path / "first", tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+    paths = {name: str(first / ("%s.npz" % name)) for name in ["raw2d", "ik3d"]}
+    for path in paths.values():
+        with open(path, "wb") as file:
+            file.write(b"outputs")
+    content_store.publish_outputs(video_hash, paths, "fast")
+    linked = {name: str(second / ("%s.npz" % name)) for name in paths}
+    assert not content_store.link_outputs(video_hash, linked)
+    assert content_store.link_outputs(video_hash, linked, "fast")
+    assert all(os.path.samefile(paths[name], linked[name]) for name in paths)
@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+from project import conversion_task
+from project.config import Config
+
+# raw xnect output: frame, person and the values
+OUTPUT = b"0 0 1 2 3\n1 0 1 2 3\n"
+
+
+class Response(object):
+    def __init__(self, status_code, data=None, content=b""):
+        self.status_code = status_code
+        self.data = data
+        self.content = content
+
+    def json(self):
+        return self.data
+
+
+@pytest.fixture
+def xnect(monkeypatch):
+    """
+    stub of the xnect api: set "post" to the response of the upload and "status" to the responses of GET /<id>
+    :return: the stub, its "requests" lists the requested urls
+    """
+    class Xnect(object):
+        post = Response(200, {"message": "success"})
+        status = []
+        requests = []
+
+    def post(url, data=None, headers=None, timeout=None):
+        data.read()
+        Xnect.requests.append(("POST", url))
+        return Xnect.post
+
+    def get(url):
+        Xnect.requests.append(("GET", url))
+        if url.rsplit("/", 1)[1] in ["raw2d", "raw3d", "ik3d"]:
+            return Response(200, content=OUTPUT)
+        return Xnect.status.pop(0)
+
+    monkeypatch.setattr(conversion_task.requests, "post", post)
+    monkeypatch.setattr(conversion_task.requests, "get", get)
+    monkeypatch.setattr(conversion_task.time, "sleep", lambda seconds: None)
+    return Xnect
+
+
+def status_requests(xnect):
+    return [url for method, url in xnect.requests if method == "GET" and not url.endswith(("raw2d", "raw3d", "ik3d"))]
+
+
+def test_outputs_are_fetched_after_the_analysis(xnect, tmp_path):
+    paths = conversion_task.analyse_xnect(b"video", "7", str(tmp_path))
+    assert paths == conversion_task.xnect_output_paths(str(tmp_path))
+    assert all(os.path.exists(path) for path in paths.values())
+    assert status_requests(xnect) == []
+
+
+def test_conflict_waits_for_the_running_analysis(xnect, tmp_path):
+    # an earlier attempt of the job is still analysed by xnect
+    xnect.post = Response(409, {"message": "conflict", "status": False})
+    xnect.status = [Response(200, {"status": False}), Response(200, {"status": True})]
+    paths = conversion_task.analyse_xnect(b"video", "7", str(tmp_path))
+    assert all(os.path.exists(path) for path in paths.values())
+    # only the status of this video is polled
+    assert status_requests(xnect) == ["%s/7" % Config.XNECT_URL] * 2
+
+
+def test_conflict_fails_if_the_earlier_attempt_failed(xnect, tmp_path):
+    xnect.post = Response(409, {"message": "conflict", "status": False})
+    xnect.status = [Response(200, {"status": False}), Response(404, {"message": "not found"})]
+    assert conversion_task.analyse_xnect(b"video", "7", str(tmp_path)) is False
+
+
+def test_unfinished_response_polls_the_status_of_the_video(xnect, tmp_path):
+    xnect.post = Response(200, {"message": "started"})
+    xnect.status = [Response(200, {"status": True})]
+    assert conversion_task.analyse_xnect(b"video", "7", str(tmp_path))
+    assert status_requests(xnect) == ["%s/7" % Config.XNECT_URL]
+
+
+def test_failed_analysis(xnect, tmp_path):
+    xnect.post = Response(400, {"code": 1})
+    assert conversion_task.analyse_xnect(b"video", "7", str(tmp_path)) is False
+    assert [method for method, url in xnect.requests] == ["POST"]
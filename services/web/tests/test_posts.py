@@ -0,0 +1,46 @@
+def publish_jobs(model, count):
+    """
+    add finished public jobs, every job is tagged "walk", the odd ones also "run"
+    """
+    model.add_user("someone", "secret")
+    for i in range(1, count + 1):
+        job = model.add_job(user_id=1, name="clip%d" % i, tags=["walk"] + (["run"] if i % 2 else []),
+                            backend="xnect", quality="standard")
+        model.db.session.commit()
+        model.get_result_by_id(job.id).result_code = model.ResultCode.success
+        model.db.session.commit()
+        model.set_job_public(job.id, 1)
+
+
+def ids(posts):
+    return [post.id for post in posts]
+
+
+def test_pages_of_the_feed(model):
+    publish_jobs(model, 7)
+    assert ids(model.get_all_public_posts(1, 3)) == [7, 6, 5]
+    assert ids(model.get_all_public_posts(3, 3)) == [1]
+    assert ids(model.get_public_posts_filtered_by_tags(["walk"], False, 2, 3)) == [4, 3, 2]
+    assert ids(model.get_public_posts_filtered_by_tags(["walk", "run"], True, 1, 2)) == [7, 5]
+
+
+def test_unpublished_jobs_leave_the_index(model):
+    publish_jobs(model, 4)
+    model.set_job_private(4, 1)
+    model.delete_job(3)
+    assert ids(model.get_public_posts_filtered_by_tags(["walk"], False, 1, 10)) == [2, 1]
+
+
+def test_stale_ids_are_replaced(model):
+    publish_jobs(model, 7)
+    # unpublished by another worker, whose change has not reached this index yet
+    for job_id in (7, 6):
+        model.Jobs.query.get(job_id).public = False
+    model.db.session.commit()
+    assert model.tag_index.page(["walk"], limit=3) == [7, 6, 5]
+    assert ids(model.get_public_posts_filtered_by_tags(["walk"], False, 1, 3)) == [5, 4, 3]
+    assert ids(model.get_public_posts_filtered_by_tags(["walk"], False, 3, 3)) == [1]
+    # the change reaches the index
+    model.tag_index.remove(7)
+    model.tag_index.remove(6)
+    assert ids(model.get_public_posts_filtered_by_tags(["walk"], False, 2, 3)) == [2, 1]
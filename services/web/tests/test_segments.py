@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from project import pose_store, segments
+
+JOINTS = 21
+
+
+def test_plan_covers_the_video():
+    assert segments.plan(10, 4, 1) == [{"start": 0, "frames": 4}, {"start": 3, "frames": 4},
+                                       {"start": 6, "frames": 4}]
+    assert segments.plan(3, 4, 1) == [{"start": 0, "frames": 3}]
+    with pytest.raises(ValueError):
+        segments.plan(10, 2, 2)
+
+
+@pytest.mark.parametrize("num_frames, parts, overlap", [(30000, 2, 50), (30001, 3, 50), (1000, 4, 0), (7, 2, 1)])
+def test_one_segment_per_part(num_frames, parts, overlap):
+    plan = segments.plan(num_frames, segments.parallel_length(num_frames, parts, overlap), overlap)
+    assert len(plan) == parts
+    assert plan[-1]["start"] + plan[-1]["frames"] == num_frames
+
+
+def pose(person, frame):
+    """
+    :return: pose of a person walking along x, the people are 1 m apart
+    """
+    joints = np.zeros([JOINTS, 3]) + [1000.0 * person + 5 * frame, 0, 4000]
+    joints[:, 1] = np.arange(JOINTS) * 50
+    return joints.reshape(-1)
+
+
+def segment_rows(start, frames, people):
+    """
+    :param people: person index in the segment of every person
+    :return: ik3d rows of a segment, with its own frame numbers and person indices
+    """
+    return np.array([np.concatenate([[frame - start, index], pose(person, frame)])
+                     for frame in range(start, start + frames) for person, index in enumerate(people)])
+
+
+def test_stitching_maps_the_people_of_the_segments(tmp_path):
+    plan = segments.plan(100, 40, 10)
+    # xnect numbers the people of every segment on its own, a person may enter in a later segment
+    people = [[0, 1], [1, 0], [2, 0, 1]]
+    parts = []
+    for i, (segment, indices) in enumerate(zip(plan, people)):
+        path = str(tmp_path / ("ik3d_%d.txt" % i))
+        np.savetxt(path, segment_rows(segment["start"], segment["frames"], indices))
+        parts.append(dict(segment, paths={"ik3d": path}))
+    output = str(tmp_path / "ik3d.npz")
+    assert segments.stitch(parts, {"ik3d": output}, 300) == 3
+    rows = pose_store.load_rows(output)
+    frames = rows[:, 0].astype(int)
+    assert sorted(set(frames)) == list(range(100))
+    # every frame once per person, the overlaps are split in the middle
+    first = (plan[2]["start"] + plan[1]["start"] + plan[1]["frames"]) // 2
+    assert len(rows) == 2 * 100 + 100 - first
+    # each person keeps the index of its first segment
+    for row in rows:
+        person = int(round((row[2] - 5 * row[0]) / 1000.0))
+        assert int(row[1]) == person
@@ -0,0 +1,96 @@
+import io
+import os
+import time
+
+from project import content_store, storage
+from project.config import Config
+
+OLD = time.time() - 365 * 86400
+
+
+def job_source(cache_dir, job_id):
+    return os.path.join(cache_dir, str(job_id), Config.SOURCE_VIDEO_FILE)
+
+
+def store_video(cache_dir, data, job_ids):
+    """
+    store a video and link it to the source videos of jobs, which have not been used for a long time
+    :return: path of the stored video
+    """
+    video_hash = content_store.store_stream(io.BytesIO(data))
+    for job_id in job_ids:
+        os.makedirs(os.path.join(cache_dir, str(job_id)), exist_ok=True)
+        assert content_store.link_video(video_hash, job_source(cache_dir, job_id))
+    path = os.path.join(content_store.object_dir(video_hash), Config.SOURCE_VIDEO_FILE)
+    os.utime(path, (OLD, OLD))
+    return path
+
+
+def test_stored_video_is_archived_with_its_links(cache_dir, cold_backend):
+    stored = store_video(cache_dir, b"video", [1, 2])
+    stats = storage.apply_retention()
+    assert stats["archived_files"] == 1 and stats["archived_bytes"] == 5
+    for path in [stored, job_source(cache_dir, 1), job_source(cache_dir, 2)]:
+        assert storage.is_archived(path)
+    # the job restores the stored video and links it again
+    assert storage.ensure_local(job_source(cache_dir, 1))
+    assert os.path.samefile(stored, job_source(cache_dir, 1))
+    assert os.path.getmtime(stored) == OLD
+    assert storage.is_archived(job_source(cache_dir, 2))
+    assert storage.ensure_local(job_source(cache_dir, 2))
+    assert os.stat(stored).st_nlink == 3
+    # the restored video is deleted from the cold storage
+    assert not any(files for _, _, files in os.walk(cold_backend.root))
+
+
+def test_stored_video_of_an_active_job_is_kept(cache_dir, cold_backend):
+    stored = store_video(cache_dir, b"video", [1, 2])
+    assert storage.apply_retention(active_jobs=[2])["archived_files"] == 0
+    assert os.path.exists(stored)
+    assert storage.evict(float("inf"), active_jobs=[2])["archived_files"] == 0
+    assert os.path.exists(job_source(cache_dir, 1))
+
+
+def test_stored_video_with_unknown_links_is_kept(cache_dir, cold_backend, tmp_path):
+    stored = store_video(cache_dir, b"video", [1])
+    os.link(stored, str(tmp_path / "elsewhere.mp4"))
+    assert storage.apply_retention()["archived_files"] == 0
+    assert os.path.exists(stored) and os.path.exists(job_source(cache_dir, 1))
+
+
+def test_copied_source_video_is_archived_and_restored(cache_dir, cold_backend):
+    path = job_source(cache_dir, 1)
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as file:
+        file.write(b"copy")
+    os.utime(path, (OLD, OLD - 10))
+    assert storage.apply_retention()["archived_files"] == 1
+    assert storage.is_archived(path)
+    assert storage.ensure_local(path)
+    assert open(path, "rb").read() == b"copy"
+    # the checkpoints depending on the video stay valid
+    assert os.path.getmtime(path) == OLD - 10
+    assert not storage.is_archived(path) and not os.path.exists(path + storage.COLD_SUFFIX)
+
+
+def test_dirs_of_deleted_jobs_are_reclaimed(cache_dir, cold_backend):
+    stored = store_video(cache_dir, b"video", [1, 2, 3, 5])
+    archived = job_source(cache_dir, 4)
+    os.makedirs(os.path.dirname(archived))
+    with open(archived, "wb") as file:
+        file.write(b"copy")
+    storage.archive(archived)
+    stats = storage.reclaim_deleted_jobs([1, 3, 5])
+    assert stats["reclaimed_dirs"] == 2
+    assert sorted(os.listdir(cache_dir)) == ["1", "3", "5", Config.OBJECTS_DIR]
+    # the stored video is still linked by other jobs, the archived copy is deleted from the cold storage
+    assert os.path.exists(stored)
+    assert not any(files for _, _, files in os.walk(cold_backend.root))
+
+
+def test_dirs_of_jobs_newer_than_the_list_are_kept(cache_dir):
+    for job_id in (1, 2, 3):
+        os.makedirs(os.path.join(cache_dir, str(job_id)))
+    assert storage.reclaim_deleted_jobs([1, 2])["reclaimed_dirs"] == 0
+    assert storage.reclaim_deleted_jobs([])["reclaimed_dirs"] == 0
+    assert sorted(os.listdir(cache_dir)) == ["1", "2", "3"]
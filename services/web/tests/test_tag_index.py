@@ -0,0 +1,100 @@
+import random
+
+from project.tag_index import TagIndex
+
+ROWS = [(1, "walk"), (2, "walk"), (2, "run"), (3, "run"), (4, "walk"), (4, "run"), (4, "dance"), (5, "dance")]
+
+
+def index(rows=ROWS, **kwargs):
+    return TagIndex(loader=lambda: list(rows), **kwargs)
+
+
+def counts(facets):
+    return [(facet["text"], facet["count"]) for facet in facets]
+
+
+def test_postings():
+    tags = index()
+    assert tags.search(["walk"]) == {1, 2, 4}
+    assert tags.search(["walk", "dance"]) == {1, 2, 4, 5}
+    assert tags.search(["walk", "run"], match_all=True) == {2, 4}
+    assert tags.search(["walk", "unknown"], match_all=True) == set()
+
+
+def test_page_is_newest_first():
+    tags = index()
+    assert tags.page(["walk", "run"]) == [4, 3, 2, 1]
+    assert tags.page(["walk", "run"], offset=1, limit=2) == [3, 2]
+    assert tags.page(["walk", "run"], match_all=True) == [4, 2]
+    assert tags.page(["walk"], offset=3, limit=2) == []
+    assert tags.page([]) == []
+
+
+def test_rebuild_sorts_unordered_rows():
+    rows = list(ROWS)
+    random.Random(0).shuffle(rows)
+    assert index(rows).page(["walk", "run", "dance"]) == [5, 4, 3, 2, 1]
+
+
+def test_add_and_remove():
+    tags = index()
+    tags.add(6, ["walk", "swim"])
+    tags.add(2, ["swim"])
+    tags.remove(4)
+    assert tags.page(["walk"]) == [6, 1]
+    assert tags.page(["swim"]) == [6, 2]
+    assert tags.page(["run"]) == [3]
+    assert tags.autocomplete("s") == [{"text": "swim", "count": 2}]
+
+
+def test_facets():
+    tags = index()
+    assert counts(tags.facets()) == [("run", 3), ("walk", 3), ("dance", 2)]
+    assert counts(tags.facets(limit=1)) == [("run", 3)]
+    assert counts(tags.facets(["walk"])) == [("walk", 3), ("run", 2), ("dance", 1)]
+    assert counts(tags.facets(["walk", "dance"], match_all=True)) == [("dance", 1), ("run", 1), ("walk", 1)]
+    tags.remove(4)
+    assert counts(tags.facets(["walk"])) == [("walk", 2), ("run", 1)]
+
+
+def test_facets_and_pages_match_a_full_scan():
+    rng = random.Random(1)
+    names = ["tag%d" % i for i in range(12)]
+    jobs = {job_id: set(rng.sample(names[:rng.randint(3, 12)], rng.randint(1, 3))) for job_id in range(1, 3000)}
+    tags = index([(job_id, tag) for job_id, job_tags in jobs.items() for tag in job_tags], facet_sample=10 ** 6)
+    for job_id in rng.sample(list(jobs), 300):
+        del jobs[job_id]
+        tags.remove(job_id)
+    for filter_tags in [["tag0"], ["tag1", "tag5"], ["tag2", "tag3", "tag11"]]:
+        for match_all in (False, True):
+            matches = sorted((job_id for job_id, job_tags in jobs.items()
+                              if (set(filter_tags) <= job_tags if match_all else set(filter_tags) & job_tags)),
+                             reverse=True)
+            assert tags.page(filter_tags, match_all, 10, 50) == matches[10:60]
+            expected = {}
+            for job_id in matches:
+                for tag in jobs[job_id]:
+                    expected[tag] = expected.get(tag, 0) + 1
+            assert counts(tags.facets(filter_tags, match_all)) == sorted(expected.items(),
+                                                                         key=lambda item: (-item[1], item[0]))
+
+
+def test_changes_are_shared_between_processes(redis_connection):
+    rows = list(ROWS)
+    first = index(rows, connection=redis_connection)
+    second = index(rows, connection=redis_connection)
+    assert second.page(["walk"]) == [4, 2, 1]
+    first.add(6, ["walk"])
+    first.remove(1)
+    assert second.page(["walk"]) == [6, 4, 2]
+
+
+def test_rebuild_when_the_log_is_trimmed(redis_connection):
+    rows = list(ROWS)
+    first = index(rows, connection=redis_connection, log_size=2)
+    second = index(rows, connection=redis_connection, log_size=2)
+    assert second.page(["dance"]) == [5, 4]
+    for job_id in range(6, 10):
+        rows.append((job_id, "dance"))
+        first.add(job_id, ["dance"])
+    assert second.page(["dance"]) == [9, 8, 7, 6, 5, 4]
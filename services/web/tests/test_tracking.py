@@ -0,0 +1,58 @@
+import numpy as np
+
+from project.tracking import TrackManager
+
+JOINTS = 21
+
+
+def pose(x, frame):
+    """
+    :return: pose (joints x 3) of a person at x, walking slowly along z
+    """
+    joints = np.zeros([JOINTS, 3]) + [x, 0, 4000 + 10 * frame]
+    joints[:, 1] = np.arange(JOINTS) * 50
+    return joints
+
+
+def manager():
+    return TrackManager(max_distance=300, max_missed=5, min_length=5)
+
+
+def test_late_entrant_gets_its_own_track():
+    tracker = manager()
+    for frame in range(100):
+        poses = [pose(0, frame)] + ([pose(1000, frame)] if frame >= 40 else [])
+        tracker.update(frame, np.array(poses))
+    first, late = tracker.close()
+    assert (first.start, first.end) == (0, 99)
+    assert (late.start, late.end) == (40, 99)
+    assert np.allclose(np.array(late.poses)[:, 0, 0], 1000)
+
+
+def test_swapped_indices_keep_the_tracks():
+    tracker = manager()
+    for frame in range(60):
+        poses = [pose(0, frame), pose(1000, frame)]
+        # xnect swaps the indices of the two people from frame 30 on
+        if frame >= 30:
+            poses.reverse()
+        tracker.update(frame, np.array(poses))
+    tracks = tracker.close()
+    assert len(tracks) == 2
+    for track, x in zip(tracks, [0, 1000]):
+        assert (track.start, track.end) == (0, 59)
+        assert np.allclose(np.array(track.poses)[:, 0, 0], x)
+
+
+def test_missed_frames_are_filled_and_short_tracks_dropped():
+    tracker = manager()
+    for frame in range(30):
+        poses = [pose(0, frame)] if frame not in (10, 11) else []
+        # a false detection in two frames
+        if frame in (20, 21):
+            poses.append(pose(3000, frame))
+        tracker.update(frame, np.array(poses))
+    track, = tracker.close()
+    assert (track.start, track.end) == (0, 29)
+    assert track.valid[10:12] == [False, False]
+    assert np.allclose(track.poses[10], track.poses[9])
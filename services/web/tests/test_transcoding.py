@@ -0,0 +1,25 @@
+from project import transcoding
+
+
+def test_small_videos_are_used_as_they_are():
+    assert transcoding.target_format(1280, 720, 30, "standard") is None
+    assert transcoding.target_format(3840, 2160, 60, "full") is None
+
+
+def test_shorter_side_is_scaled_to_the_tier():
+    assert transcoding.target_format(3840, 2160, 25, "standard") == \
+        {"quality": "standard", "width": 1280, "height": 720, "fps": 25.0, "step": 1}
+    # portrait videos and odd sizes
+    assert transcoding.target_format(1081, 1921, 30, "fast") == \
+        {"quality": "fast", "width": 480, "height": 852, "fps": 15.0, "step": 2}
+
+
+def test_frame_rate_is_divided_by_an_integer():
+    assert transcoding.target_format(640, 360, 60, "standard")["step"] == 2
+    video_format = transcoding.target_format(640, 360, 50, "fast")
+    assert (video_format["step"], video_format["fps"]) == (4, 12.5)
+
+
+def test_default_quality(monkeypatch):
+    monkeypatch.setattr(transcoding.Config, "DEFAULT_QUALITY", "high")
+    assert transcoding.target_format(3840, 2160, 30)["height"] == 1080
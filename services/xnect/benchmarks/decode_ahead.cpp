@@ -0,0 +1,107 @@
+// Demo of the decoding ahead of ./XNECT <folder> (decodeAhead() in src/InferenceScheduler.hpp) without a GPU.
+// processImg is replaced by a dummy that waits a fixed time per frame, like the thread of XNECT waits for the GPU.
+// The video is decoded serially (XNECT_FRAME_QUEUE=0, like before) and on a background thread, the time per frame
+// should drop from decode + inference to the slower of both.
+//
+//   g++ -std=c++11 -O2 -pthread -I../src decode_ahead.cpp -o decode_ahead
+//   ./decode_ahead [frames] [decode ms] [inference ms]
+//
+// With OpenCV, a real video is decoded by the same decoder as in main.cpp:
+//
+//   OPENCV=$(pkg-config --cflags --libs opencv)
+//   g++ -std=c++11 -O2 -pthread -DWITH_OPENCV -I../src decode_ahead.cpp -o decode_ahead $OPENCV
+//   ./decode_ahead <video.mp4> [inference ms]
+#include <chrono>
+#include <cstdlib>
+#include <iostream>
+#include <string>
+#include <thread>
+#include "InferenceScheduler.hpp"
+#ifdef WITH_OPENCV
+#include "opencv2/opencv.hpp"
+typedef cv::Mat Frame;
+#else
+#include <vector>
+typedef std::vector<unsigned char> Frame;
+#endif
+
+int frameCount = 300;
+int decodeMs = 10;
+int inferenceMs = 20;
+
+#ifdef WITH_OPENCV
+void decodeVideo(const std::string &videoFilePath, const std::function<bool(Frame &)> &push)
+{
+    cv::VideoCapture cap(videoFilePath);
+    if (!cap.isOpened())
+        CV_Error(CV_StsError, "Can not open Video file");
+    for (;;)
+    {
+        Frame frame;
+        cap >> frame;
+        if (frame.empty() || !push(frame))
+            break;
+    }
+}
+#else
+// keeps the cpu busy for decodeMs per frame, like the decoder of a 720p video
+void decodeVideo(const std::string &, const std::function<bool(Frame &)> &push)
+{
+    for (int i = 0; i < frameCount; i++)
+    {
+        Frame frame(1280 * 720 * 3);
+        auto end = std::chrono::steady_clock::now() + std::chrono::milliseconds(decodeMs);
+        unsigned char value = 0;
+        while (std::chrono::steady_clock::now() < end)
+            for (size_t j = 0; j < frame.size(); j += 4096)
+                frame[j] = value++;
+        if (!push(frame))
+            break;
+    }
+}
+#endif
+
+// dummy processImg
+void processImg(Frame &, int)
+{
+    std::this_thread::sleep_for(std::chrono::milliseconds(inferenceMs));
+}
+
+double measure(const std::string &video, size_t capacity, int &frames)
+{
+    auto start = std::chrono::steady_clock::now();
+    frames = decodeAhead<Frame>(video, decodeVideo, processImg, capacity);
+    return std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count();
+}
+
+int main(int argc, char **argv)
+{
+    std::string video = "synthetic";
+#ifdef WITH_OPENCV
+    if (argc < 2)
+    {
+        std::cout << "Usage: ./decode_ahead <video.mp4> [inference ms]" << std::endl;
+        return 1;
+    }
+    video = argv[1];
+    if (argc > 2)
+        inferenceMs = atoi(argv[2]);
+#else
+    if (argc > 1)
+        frameCount = atoi(argv[1]);
+    if (argc > 2)
+        decodeMs = atoi(argv[2]);
+    if (argc > 3)
+        inferenceMs = atoi(argv[3]);
+    std::cout << frameCount << " frames, decode " << decodeMs << " ms, ";
+#endif
+    std::cout << "inference " << inferenceMs << " ms per frame" << std::endl;
+
+    int frames = 0;
+    double serial = measure(video, 0, frames);
+    std::cout << "serial:       " << frames << " frames, " << frames / serial << " frames/s" << std::endl;
+    double ahead = measure(video, 32, frames);
+    std::cout << "decode ahead: " << frames << " frames, " << frames / ahead << " frames/s" << std::endl;
+    std::cout << "speedup:      " << serial / ahead << std::endl;
+    return 0;
+}
@@ -0,0 +1,154 @@
+// Benchmark of the scheduler of the XNECT daemon (src/InferenceScheduler.hpp) without a GPU.
+// The decoder and processImg are replaced by mocks that take a fixed time per frame, so the aggregate frames per second
+// for a number of concurrent videos (queue depth) can be measured. Every frame carries the id of its video, the mock
+// engine checks that a slot only gets the frames of its current video, in order, and that the number of frames
+// "saved" into the folder of a video is right (also with a frame limit).
+//
+//   g++ -std=c++11 -O2 -pthread -I../src scheduler_mock.cpp -o scheduler_mock
+//   ./scheduler_mock [frames per video] [decode ms] [inference ms] [slots]
+//
+// A sleeping processImg overlaps perfectly, like the GPU while one video does not use all of it. On a real GPU the
+// speedup ends when the GPU is busy, so the number of slots should be measured with the real networks.
+#include <atomic>
+#include <chrono>
+#include <cstdlib>
+#include <iostream>
+#include <map>
+#include <stdexcept>
+#include <string>
+#include <thread>
+#include "InferenceScheduler.hpp"
+
+struct MockFrame
+{
+    std::string video;
+    int index;
+};
+
+int decodeMs = 2;
+int inferenceMs = 10;
+int framesPerVideo = 100;
+std::mutex savedMutex;
+std::map<std::string, int> saved;
+
+class MockEngine
+{
+public:
+    void start()
+    {
+        m_video.clear();
+        m_frames = 0;
+    }
+
+    void process(MockFrame &frame, int index)
+    {
+        if (index == 0)
+            m_video = frame.video;
+        if (frame.video != m_video || frame.index != index)
+            throw std::runtime_error("frame " + std::to_string(frame.index) + " of " + frame.video +
+                                     " routed to " + m_video);
+        std::this_thread::sleep_for(std::chrono::milliseconds(inferenceMs));
+        m_frames++;
+    }
+
+    void finish(const std::string &folder)
+    {
+        if (folder + "/video.mp4" != m_video)
+            throw std::runtime_error("outputs of " + m_video + " saved into " + folder);
+        std::lock_guard<std::mutex> lock(savedMutex);
+        saved[folder] = m_frames;
+    }
+
+private:
+    std::string m_video;
+    int m_frames;
+};
+
+void decodeMock(const std::string &video, const std::function<bool(MockFrame &)> &push)
+{
+    if (video.find("missing") != std::string::npos)
+        throw std::runtime_error("Can not open Video file");
+    for (int i = 0; i < framesPerVideo; i++)
+    {
+        std::this_thread::sleep_for(std::chrono::milliseconds(decodeMs));
+        MockFrame frame = {video, i};
+        if (!push(frame))
+            break;
+    }
+}
+
+int main(int argc, char **argv)
+{
+    if (argc > 1)
+        framesPerVideo = atoi(argv[1]);
+    if (argc > 2)
+        decodeMs = atoi(argv[2]);
+    if (argc > 3)
+        inferenceMs = atoi(argv[3]);
+    int slots = argc > 4 ? atoi(argv[4]) : 4;
+    std::cout << framesPerVideo << " frames per video, decode " << decodeMs << " ms, inference " << inferenceMs
+              << " ms per frame, " << slots << " slots" << std::endl;
+
+    InferenceScheduler<MockEngine, MockFrame> scheduler(
+        [] { return std::unique_ptr<MockEngine>(new MockEngine()); }, decodeMock, slots, slots + 1, 32);
+    bool ok = true;
+
+    // a video that can not be decoded fails alone
+    std::future<int> missing = scheduler.submit("missing/video.mp4", "missing");
+    try
+    {
+        missing.get();
+        ok = false;
+    }
+    catch (const std::exception &e)
+    {
+        std::cout << "missing video: " << e.what() << std::endl;
+    }
+
+    // only the first frames of a video are analysed (./XNECT <folder> <frames>)
+    int limit = framesPerVideo / 2;
+    if (scheduler.submit("limited/video.mp4", "limited", limit).get() != limit)
+        ok = false;
+    {
+        std::lock_guard<std::mutex> lock(savedMutex);
+        if (saved["limited"] != limit)
+            ok = false;
+        saved.erase("limited");
+    }
+
+    std::cout << "depth\tseconds\tframes/s" << std::endl;
+    for (int depth = 1; depth <= 2 * slots; depth *= 2)
+    {
+        std::vector<std::future<int>> results;
+        auto start = std::chrono::steady_clock::now();
+        for (int i = 0; i < depth; i++)
+        {
+            std::string folder = "depth" + std::to_string(depth) + "_video" + std::to_string(i);
+            results.push_back(scheduler.submit(folder + "/video.mp4", folder));
+        }
+        int frames = 0;
+        for (auto &result : results)
+        {
+            try
+            {
+                frames += result.get();
+            }
+            catch (const std::exception &e)
+            {
+                std::cout << "error: " << e.what() << std::endl;
+                ok = false;
+            }
+        }
+        double seconds = std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count();
+        std::cout << depth << "\t" << seconds << "\t" << frames / seconds << std::endl;
+    }
+
+    for (auto &video : saved)
+        if (video.second != framesPerVideo)
+        {
+            std::cout << video.first << ": " << video.second << " frames saved" << std::endl;
+            ok = false;
+        }
+    std::cout << (ok ? "routing ok" : "routing FAILED") << std::endl;
+    return ok ? 0 : 1;
+}
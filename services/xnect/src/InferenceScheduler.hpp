@@ -0,0 +1,269 @@
+#pragma once
+// Scheduling of several videos on the GPU for the daemon mode of XNECT.
+// XNECT tracks the people of a video over time, so the frames of a video must go through the same XNECT instance
+// in order and one instance can not be shared by two videos. The scheduler therefore keeps a number of slots, each
+// with its own engine (XNECT instance) and inference thread. Several videos are analysed at the same time, their
+// frames are interleaved on the GPU, and every engine saves the outputs of its video into the folder of the job.
+// The frames are decoded by a separate pool of threads into a bounded queue per video, so the inference never waits
+// for the decoder while frames are available. The engine and the frame type are template parameters, so the
+// scheduler can be tested without a GPU (see services/xnect/benchmarks/scheduler_mock.cpp).
+// decodeAhead() does the same for a single video without the scheduler (./XNECT <folder>).
+#include <condition_variable>
+#include <deque>
+#include <exception>
+#include <functional>
+#include <future>
+#include <memory>
+#include <mutex>
+#include <string>
+#include <thread>
+#include <vector>
+
+// Bounded queue of decoded frames between a decoder and an inference thread
+template <typename Frame>
+class FrameQueue
+{
+public:
+    explicit FrameQueue(size_t capacity) : m_capacity(capacity), m_closed(false), m_cancelled(false) {}
+
+    // Blocks while the queue is full, returns false if the consumer does not want more frames
+    bool push(Frame &frame)
+    {
+        std::unique_lock<std::mutex> lock(m_mutex);
+        m_notFull.wait(lock, [this] { return m_frames.size() < m_capacity || m_cancelled; });
+        if (m_cancelled)
+            return false;
+        m_frames.push_back(std::move(frame));
+        m_notEmpty.notify_one();
+        return true;
+    }
+
+    // Blocks until a frame is available, returns false if the queue is closed and empty
+    bool pop(Frame &frame)
+    {
+        std::unique_lock<std::mutex> lock(m_mutex);
+        m_notEmpty.wait(lock, [this] { return !m_frames.empty() || m_closed; });
+        if (m_frames.empty())
+            return false;
+        frame = std::move(m_frames.front());
+        m_frames.pop_front();
+        m_notFull.notify_one();
+        return true;
+    }
+
+    // The decoder has no more frames
+    void close()
+    {
+        std::lock_guard<std::mutex> lock(m_mutex);
+        m_closed = true;
+        m_notEmpty.notify_all();
+    }
+
+    // The consumer stops (e.g. after an error), the decoder is released
+    void cancel()
+    {
+        std::lock_guard<std::mutex> lock(m_mutex);
+        m_cancelled = true;
+        m_frames.clear();
+        m_notFull.notify_all();
+    }
+
+private:
+    size_t m_capacity;
+    bool m_closed;
+    bool m_cancelled;
+    std::deque<Frame> m_frames;
+    std::mutex m_mutex;
+    std::condition_variable m_notFull;
+    std::condition_variable m_notEmpty;
+};
+
+// Decodes a video on a background thread while process(frame, index) runs on the calling thread, up to capacity frames
+// ahead. With capacity 0 the frames are decoded and processed one after another on the calling thread.
+// Only the first maxFrames frames are decoded, -1 decodes the whole video.
+// :return: number of processed frames
+template <typename Frame>
+int decodeAhead(const std::string &video,
+                const std::function<void(const std::string &, const std::function<bool(Frame &)> &)> &decoder,
+                const std::function<void(Frame &, int)> &process, size_t capacity, int maxFrames = -1)
+{
+    int index = 0;
+    if (capacity == 0)
+    {
+        decoder(video, [&process, &index, maxFrames](Frame &frame) {
+            if (index == maxFrames)
+                return false;
+            process(frame, index++);
+            return true;
+        });
+        return index;
+    }
+    FrameQueue<Frame> frames(capacity);
+    std::exception_ptr decodeError;
+    std::thread decodeThread([&video, &decoder, &frames, &decodeError, maxFrames] {
+        try
+        {
+            int decoded = 0;
+            decoder(video, [&frames, &decoded, maxFrames](Frame &frame) {
+                return decoded++ != maxFrames && frames.push(frame);
+            });
+        }
+        catch (...)
+        {
+            decodeError = std::current_exception();
+        }
+        frames.close();
+    });
+    try
+    {
+        Frame frame;
+        while (frames.pop(frame))
+            process(frame, index++);
+    }
+    catch (...)
+    {
+        frames.cancel();
+        decodeThread.join();
+        throw;
+    }
+    decodeThread.join();
+    if (decodeError)
+        std::rethrow_exception(decodeError);
+    return index;
+}
+
+// Engine needs: void start(); void process(Frame &frame, int index); void finish(const std::string &folder);
+template <typename Engine, typename Frame>
+class InferenceScheduler
+{
+public:
+    // reads the frames of a video and passes them on, until the callback returns false
+    typedef std::function<void(const std::string &, const std::function<bool(Frame &)> &)> Decoder;
+    // creates an engine, called in the inference thread of the slot
+    typedef std::function<std::unique_ptr<Engine>()> EngineFactory;
+
+    InferenceScheduler(EngineFactory engineFactory, Decoder decoder, int slots, int decoders, size_t queueCapacity)
+        : m_decoder(decoder), m_queueCapacity(queueCapacity), m_stopping(false), m_readySlots(0)
+    {
+        for (int i = 0; i < slots; i++)
+            m_threads.emplace_back(&InferenceScheduler::runSlot, this, engineFactory);
+        for (int i = 0; i < decoders; i++)
+            m_threads.emplace_back(&InferenceScheduler::runDecoder, this);
+        // the engines are loaded before the first video is accepted
+        std::unique_lock<std::mutex> lock(m_mutex);
+        m_ready.wait(lock, [this, slots] { return m_readySlots == slots; });
+    }
+
+    // Finishes the queued videos and stops the threads
+    ~InferenceScheduler()
+    {
+        {
+            std::lock_guard<std::mutex> lock(m_mutex);
+            m_stopping = true;
+        }
+        m_jobAvailable.notify_all();
+        for (auto &thread : m_threads)
+            thread.join();
+    }
+
+    // Queue a video, the future returns the number of analysed frames or the error of the analysis.
+    // Only the first maxFrames frames are analysed, -1 analyses the whole video.
+    std::future<int> submit(const std::string &video, const std::string &folder, int maxFrames = -1)
+    {
+        std::shared_ptr<Job> job(new Job(video, folder, maxFrames, m_queueCapacity));
+        std::future<int> result = job->result.get_future();
+        {
+            std::lock_guard<std::mutex> lock(m_mutex);
+            m_decodeQueue.push_back(job);
+            m_inferenceQueue.push_back(job);
+        }
+        m_jobAvailable.notify_all();
+        return result;
+    }
+
+private:
+    struct Job
+    {
+        Job(const std::string &video, const std::string &folder, int maxFrames, size_t capacity)
+            : video(video), folder(folder), maxFrames(maxFrames), frames(capacity) {}
+        std::string video;
+        std::string folder;
+        int maxFrames;
+        FrameQueue<Frame> frames;
+        std::exception_ptr decodeError;
+        std::promise<int> result;
+    };
+
+    // Takes the next job of a queue, returns nullptr if the scheduler stops
+    std::shared_ptr<Job> next(std::deque<std::shared_ptr<Job>> &queue)
+    {
+        std::unique_lock<std::mutex> lock(m_mutex);
+        m_jobAvailable.wait(lock, [this, &queue] { return !queue.empty() || m_stopping; });
+        if (queue.empty())
+            return nullptr;
+        std::shared_ptr<Job> job = queue.front();
+        queue.pop_front();
+        return job;
+    }
+
+    void runDecoder()
+    {
+        while (std::shared_ptr<Job> job = next(m_decodeQueue))
+        {
+            try
+            {
+                int decoded = 0;
+                m_decoder(job->video, [&job, &decoded](Frame &frame) {
+                    return decoded++ != job->maxFrames && job->frames.push(frame);
+                });
+            }
+            catch (...)
+            {
+                job->decodeError = std::current_exception();
+            }
+            job->frames.close();
+        }
+    }
+
+    void runSlot(EngineFactory engineFactory)
+    {
+        std::unique_ptr<Engine> engine = engineFactory();
+        {
+            std::lock_guard<std::mutex> lock(m_mutex);
+            m_readySlots++;
+        }
+        m_ready.notify_all();
+        while (std::shared_ptr<Job> job = next(m_inferenceQueue))
+        {
+            try
+            {
+                engine->start();
+                Frame frame;
+                int index = 0;
+                while (job->frames.pop(frame))
+                    engine->process(frame, index++);
+                // the queue is closed after the decoder has stored its error
+                if (job->decodeError)
+                    std::rethrow_exception(job->decodeError);
+                engine->finish(job->folder);
+                job->result.set_value(index);
+            }
+            catch (...)
+            {
+                job->frames.cancel();
+                job->result.set_exception(std::current_exception());
+            }
+        }
+    }
+
+    Decoder m_decoder;
+    size_t m_queueCapacity;
+    bool m_stopping;
+    int m_readySlots;
+    std::deque<std::shared_ptr<Job>> m_decodeQueue;
+    std::deque<std::shared_ptr<Job>> m_inferenceQueue;
+    std::vector<std::thread> m_threads;
+    std::mutex m_mutex;
+    std::condition_variable m_jobAvailable;
+    std::condition_variable m_ready;
+};
@@ -0,0 +1,76 @@
+"""
+CHECK DAEMON : Checks that the daemon analyses a video like ./XNECT <folder>, also after it has analysed other videos.
+The video is analysed by ./XNECT <folder>, then twice by the daemon with another video in between, and the outputs
+are compared byte by byte. Run it with a real build before changing XNECT_REUSE or main.cpp:
+
+    python3 check_daemon.py --video a.mp4 --other b.mp4
+
+It prints a json report and exits with 1 if an output differs. The mock can be checked with
+--command "python3 mock_daemon.py".
+"""
+import argparse
+import filecmp
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from xnect_client import XnectDaemon
+
+OUTPUTS = ["raw2D.txt", "raw3D.txt", "IK3D.txt"]
+
+
+def prepare(root, name, video):
+    """
+    :return: a folder with the video as video.mp4
+    """
+    folder = os.path.join(root, name)
+    os.makedirs(folder)
+    shutil.copyfile(video, os.path.join(folder, "video.mp4"))
+    return folder
+
+
+def differences(folder, reference):
+    """
+    :return: names of the outputs that differ from those of the reference folder
+    """
+    return [name for name in OUTPUTS
+            if not os.path.exists(os.path.join(folder, name))
+            or not filecmp.cmp(os.path.join(folder, name), os.path.join(reference, name), shallow=False)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the outputs of the XNECT daemon with ./XNECT <folder>")
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--other", help="video analysed in between, default: the same video")
+    parser.add_argument("--command", default="./XNECT", help="command of XNECT, e.g. python3 mock_daemon.py")
+    parser.add_argument("--frames", type=int, help="analyse only the first frames")
+    args = parser.parse_args()
+
+    command = shlex.split(args.command)
+    frames = [str(args.frames)] if args.frames else []
+    root = tempfile.mkdtemp()
+    daemon = XnectDaemon(os.path.join(root, "xnect.sock"), command)
+    try:
+        reference = prepare(root, "reference", args.video)
+        subprocess.run(command + [reference] + frames, check=True)
+        daemon.start()
+        runs = []
+        for name, video in [("first", args.video), ("other", args.other or args.video), ("second", args.video)]:
+            folder = prepare(root, name, video)
+            daemon.analyse(folder, args.frames)
+            runs.append((name, folder))
+        report = {name: differences(folder, reference) for name, folder in runs if name != "other"}
+        report["ok"] = not any(report.values())
+    finally:
+        daemon.stop()
+        shutil.rmtree(root, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
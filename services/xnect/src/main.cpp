@@ -1,180 +1,357 @@
-// xnect.cpp : Defines the entry point for the console application.
-//
-#include <chrono>
-#include <thread>
-#include <cstdlib>
-#include "xnect.hpp"
-#include "opencv2/opencv.hpp"
-#include "mongoose.h"
-#define WEB_CAM 0
-
-std::string videoFilePath = "";
-
-using namespace cv;
-
-// Draw the bones (from XNECT)
-void drawBones(cv::Mat &img, XNECT &xnect, int person)
-{
-	int numOfJoints = xnect.getNumOf3DJoints();
-
-	for (int i = 0; i < numOfJoints; i++)
-	{
-		int parentID = xnect.getJoint3DParent(i);
-		if (parentID == -1 ) continue;
-		// lookup 2 connected body/hand parts
-		cv::Point2f partA = xnect.ProjectWithIntrinsics(xnect.getJoint3DIK(person,i));
-		cv::Point2f partB = xnect.ProjectWithIntrinsics(xnect.getJoint3DIK(person, parentID));
-
-
-		if (partA.x <= 0 || partA.y <= 0 || partB.x <= 0 || partB.y <= 0)
-			continue;
-
-		line(img, partA, partB, xnect.getPersonColor(person), 4);
-
-	}
-
-}
-void drawJoints(cv::Mat &img, XNECT &xnect, int person)
-{
-
-	int numOfJoints = xnect.getNumOf3DJoints() - 2; // don't render feet, can be unstable
-
-	for (int i = 0; i < numOfJoints; i++)
-	{
-		int thickness = -1;
-		int lineType = 8;
-		cv::Point2f point2D = xnect.ProjectWithIntrinsics(xnect.getJoint3DIK(person, i));
-		cv::circle(img, point2D, 6, xnect.getPersonColor(person), -1);
-
-	}
-}
-
-void drawPeople(cv::Mat &img, XNECT &xnect)
-{
-	for (int i = 0; i < xnect.getNumOfPeople(); i++)
-       if (xnect.isPersonActive(i))
-	     {
-	     	drawBones(img, xnect,i);
-	     	drawJoints(img, xnect,i);
-	     }
-
-}
-bool playLIVE(XNECT &xnect)
-{
-	cv::VideoCapture cap;
-
-	if (!cap.open(0))
-	{
-		std::cout << "Can't open webcam!\n";
-		cv::waitKey(0);
-		return false;
-	}
-	if (!(cap.set(CV_CAP_PROP_FRAME_WIDTH, xnect.processWidth) && cap.set(CV_CAP_PROP_FRAME_HEIGHT, xnect.processHeight)))
-	{
-
-		std::cout << "[ ERROR ]: the connected webcam does not support " << xnect.processWidth << " x " << xnect.processHeight << " resolution." << std::endl;
-		cv::waitKey(0);
-		return false;
-	}
-	// open the default camera, use something different from 0 otherwise;
-	// Check VideoCapture documentation.
-
-
-	for (;;)
-	{
-		cv::Mat frame;
-		cap >> frame;
-		if (frame.empty()) break; // end of video stream
-		xnect.processImg(frame);
-
-		xnect.sendDataToUnity();
-		drawPeople(frame, xnect);
-
-		cv::namedWindow("liveWebCam", cv::WINDOW_NORMAL);
-		imshow("liveWebCam", frame);
-
-		char ch = cv::waitKey(1);
-
-
-		if (ch == 27) break; // stop capturing by pressing ESC
-
-		if (ch == 'p' || ch == 'P')
-		{
-			xnect.rescaleSkeletons();
-			std::cout << "rescaling" << std::endl;
-
-		}
-
-		if (ch == 'r' || ch == 'R')
-		{
-			xnect.resetSkeletons();
-			std::cout << "resetting" << std::endl;
-		}
-
-
-	}
-	// the camera will be closed automatically upon exit
-
-	return true;
-}
-
-void analyseVideo(std::string &videoFilePath, XNECT &xnect)
-{
-    std::cout << "[ANALYSIS] " << videoFilePath << std::endl;
-
-    VideoCapture cap(videoFilePath); // open the video file
-    if(!cap.isOpened())  // check if we succeeded
-        CV_Error(CV_StsError, "Can not open Video file");
-
-    //cap.get(CV_CAP_PROP_FRAME_COUNT) contains the number of frames in the video;
-    int index = 0;
-    while(1)
-    {
-        Mat frame;
-        cap >> frame; // get the next frame from video
-        if(frame.empty())
-            break;
-        if(index == 0) {
-            xnect.processHeight = cap.get(CAP_PROP_FRAME_HEIGHT);
-            xnect.processWidth = cap.get(CV_CAP_PROP_FRAME_WIDTH);
-        }
-        index++;
-        xnect.processImg(frame);
-        //xnect.sendDataToUnity();
-        //drawPeople(frame, xnect);
-        //namedWindow("main", WINDOW_NORMAL);
-        //imshow("main", frame);
-        //waitKey(1);
-    }
-    cap.release();
-
-    std::cout << "Finished analysis..." << std::endl;
-}
-
-int main(int argc, char **argv)
-{
-	std::cout << "Starting XNECT" << argc << std::endl;
-	// Check if image path is given
-	if (argc <= 1) {
-		std::cout << "Please give the image path (example: ./XNECT <path_to_video>)" << std::endl;
-		return 1;
-	}
-	videoFilePath = argv[1];
-	std::cout << "Working dir: " << videoFilePath << std::endl;
-
-	std::string video = videoFilePath + "/video.mp4";
-    // Check if only a certain number of frames should be analysed (for debugging)
-	int num_frames = -1;
-	if(argc == 3) {
-		std::cout << "Analysing first " << argv[2] << " frames." << std::endl;
-		num_frames = atoi(argv[2]);
-	}
-	XNECT xnect;
-	// Analyse the video in xnect
-    analyseVideo(video, xnect);
-    // Save joint and raw joint positions
-	xnect.save_joint_positions(videoFilePath);
-	xnect.save_raw_joint_positions(videoFilePath);
-
-	return 0;
-}
+// xnect.cpp : Defines the entry point for the console application.
+//
+#include <chrono>
+#include <thread>
+#include <cstdlib>
+#include <algorithm>
+#include <memory>
+#include <cstring>
+#include <sstream>
+#include <sys/socket.h>
+#include <sys/un.h>
+#include <unistd.h>
+#include "InferenceScheduler.hpp"
+#include "xnect.hpp"
+#include "opencv2/opencv.hpp"
+#include "mongoose.h"
+#define WEB_CAM 0
+
+std::string videoFilePath = "";
+
+using namespace cv;
+
+// Draw the bones (from XNECT)
+void drawBones(cv::Mat &img, XNECT &xnect, int person)
+{
+	int numOfJoints = xnect.getNumOf3DJoints();
+
+	for (int i = 0; i < numOfJoints; i++)
+	{
+		int parentID = xnect.getJoint3DParent(i);
+		if (parentID == -1 ) continue;
+		// lookup 2 connected body/hand parts
+		cv::Point2f partA = xnect.ProjectWithIntrinsics(xnect.getJoint3DIK(person,i));
+		cv::Point2f partB = xnect.ProjectWithIntrinsics(xnect.getJoint3DIK(person, parentID));
+
+
+		if (partA.x <= 0 || partA.y <= 0 || partB.x <= 0 || partB.y <= 0)
+			continue;
+
+		line(img, partA, partB, xnect.getPersonColor(person), 4);
+
+	}
+
+}
+void drawJoints(cv::Mat &img, XNECT &xnect, int person)
+{
+
+	int numOfJoints = xnect.getNumOf3DJoints() - 2; // don't render feet, can be unstable
+
+	for (int i = 0; i < numOfJoints; i++)
+	{
+		int thickness = -1;
+		int lineType = 8;
+		cv::Point2f point2D = xnect.ProjectWithIntrinsics(xnect.getJoint3DIK(person, i));
+		cv::circle(img, point2D, 6, xnect.getPersonColor(person), -1);
+
+	}
+}
+
+void drawPeople(cv::Mat &img, XNECT &xnect)
+{
+	for (int i = 0; i < xnect.getNumOfPeople(); i++)
+       if (xnect.isPersonActive(i))
+	     {
+	     	drawBones(img, xnect,i);
+	     	drawJoints(img, xnect,i);
+	     }
+
+}
+bool playLIVE(XNECT &xnect)
+{
+	cv::VideoCapture cap;
+
+	if (!cap.open(0))
+	{
+		std::cout << "Can't open webcam!\n";
+		cv::waitKey(0);
+		return false;
+	}
+	if (!(cap.set(CV_CAP_PROP_FRAME_WIDTH, xnect.processWidth) && cap.set(CV_CAP_PROP_FRAME_HEIGHT, xnect.processHeight)))
+	{
+
+		std::cout << "[ ERROR ]: the connected webcam does not support " << xnect.processWidth << " x " << xnect.processHeight << " resolution." << std::endl;
+		cv::waitKey(0);
+		return false;
+	}
+	// open the default camera, use something different from 0 otherwise;
+	// Check VideoCapture documentation.
+
+
+	for (;;)
+	{
+		cv::Mat frame;
+		cap >> frame;
+		if (frame.empty()) break; // end of video stream
+		xnect.processImg(frame);
+
+		xnect.sendDataToUnity();
+		drawPeople(frame, xnect);
+
+		cv::namedWindow("liveWebCam", cv::WINDOW_NORMAL);
+		imshow("liveWebCam", frame);
+
+		char ch = cv::waitKey(1);
+
+
+		if (ch == 27) break; // stop capturing by pressing ESC
+
+		if (ch == 'p' || ch == 'P')
+		{
+			xnect.rescaleSkeletons();
+			std::cout << "rescaling" << std::endl;
+
+		}
+
+		if (ch == 'r' || ch == 'R')
+		{
+			xnect.resetSkeletons();
+			std::cout << "resetting" << std::endl;
+		}
+
+
+	}
+	// the camera will be closed automatically upon exit
+
+	return true;
+}
+
+void decodeVideo(const std::string &videoFilePath, const std::function<bool(Mat &)> &push)
+{
+    VideoCapture cap(videoFilePath);
+    if (!cap.isOpened())
+        CV_Error(CV_StsError, "Can not open Video file");
+    for (;;)
+    {
+        Mat frame;
+        cap >> frame;
+        if (frame.empty() || !push(frame))
+            break;
+    }
+}
+
+int getenvInt(const char *name, int fallback)
+{
+    const char *value = getenv(name);
+    return value ? atoi(value) : fallback;
+}
+
+void processFrame(XNECT &xnect, Mat &frame, int index)
+{
+    if (index == 0)
+    {
+        xnect.processHeight = frame.rows;
+        xnect.processWidth = frame.cols;
+    }
+    xnect.processImg(frame);
+    //xnect.sendDataToUnity();
+    //drawPeople(frame, xnect);
+    //namedWindow("main", WINDOW_NORMAL);
+    //imshow("main", frame);
+    //waitKey(1);
+}
+
+// The next frames are decoded on a background thread while XNECT processes a frame, up to XNECT_FRAME_QUEUE frames
+// ahead (0 decodes and processes one after another). Only the first maxFrames frames are analysed, -1: all frames.
+int analyseVideo(std::string &videoFilePath, XNECT &xnect, int maxFrames = -1)
+{
+    std::cout << "[ANALYSIS] " << videoFilePath << std::endl;
+    int frames = decodeAhead<Mat>(videoFilePath, decodeVideo,
+                                  [&xnect](Mat &frame, int index) { processFrame(xnect, frame, index); },
+                                  std::max(0, getenvInt("XNECT_FRAME_QUEUE", 32)), maxFrames);
+    std::cout << "Finished analysis..." << std::endl;
+    return frames;
+}
+
+// Analyse <folder>/video.mp4 and save the joint positions into the folder
+int analyseFolder(const std::string &folder, XNECT &xnect, int maxFrames = -1)
+{
+    std::string video = folder + "/video.mp4";
+    int frames = analyseVideo(video, xnect, maxFrames);
+    xnect.save_joint_positions(folder);
+    xnect.save_raw_joint_positions(folder);
+    return frames;
+}
+
+// Read one command line from a client
+std::string readLine(int client)
+{
+    std::string line;
+    char c;
+    while (recv(client, &c, 1, 0) == 1 && c != '\n')
+        line += c;
+    return line;
+}
+
+void reply(int client, std::string message)
+{
+    std::replace(message.begin(), message.end(), '\n', ' ');
+    message += "\n";
+    send(client, message.c_str(), message.size(), MSG_NOSIGNAL);
+    close(client);
+}
+
+// One XNECT instance of the daemon, the scheduler runs one video at a time on it
+// One slot of the daemon. XNECT keeps the people of a video (skeletons, joint positions saved by
+// save_joint_positions), so every video gets a new XNECT instance; the process, CUDA and the files of the networks
+// stay warm. With XNECT_REUSE=1 the instance is kept and only resetSkeletons() is called, which saves loading the
+// networks, but only check_daemon.py can tell if the outputs are still those of ./XNECT <folder>.
+class XnectEngine
+{
+public:
+    XnectEngine() : reuse(getenvInt("XNECT_REUSE", 0) == 1), xnect(new XNECT()), used(false)
+    {
+    }
+
+    void start()
+    {
+        if (used && reuse)
+            xnect->resetSkeletons();
+        else if (used)
+        {
+            // free the GPU memory of the old instance first
+            xnect.reset();
+            xnect.reset(new XNECT());
+        }
+        used = true;
+    }
+
+    void process(Mat &frame, int index)
+    {
+        processFrame(*xnect, frame, index);
+    }
+
+    void finish(const std::string &folder)
+    {
+        xnect->save_joint_positions(folder);
+        xnect->save_raw_joint_positions(folder);
+    }
+
+private:
+    bool reuse;
+    std::unique_ptr<XNECT> xnect;
+    // the instance has analysed a video
+    bool used;
+};
+
+// Daemon mode: XNECT is started once, then the videos are analysed by the scheduler (InferenceScheduler.hpp).
+// XNECT_SLOTS (default: 2) videos are analysed at the same time, each slot has its own XNECT instance (and GPU memory).
+// XNECT_DECODERS threads decode the videos, XNECT_FRAME_QUEUE frames per video are decoded ahead.
+// A client connects to the unix socket, sends one command and gets one reply:
+//   "analyse <folder> [<frames>]" -> "ok <frames>" or "error <message>", when the analysis of <folder>/video.mp4
+//   (or of its first <frames> frames) is finished
+//   "ping" -> "pong"
+//   "quit" -> "bye", the daemon exits after the running analyses
+int serve(const std::string &socketPath)
+{
+    int slots = std::max(1, getenvInt("XNECT_SLOTS", 2));
+    int decoders = std::max(1, getenvInt("XNECT_DECODERS", slots + 1));
+    int queueCapacity = std::max(1, getenvInt("XNECT_FRAME_QUEUE", 32));
+    std::cout << "[DAEMON] " << slots << " slots, " << decoders << " decoders" << std::endl;
+    InferenceScheduler<XnectEngine, Mat> scheduler(
+        [] { return std::unique_ptr<XnectEngine>(new XnectEngine()); }, decodeVideo, slots, decoders, queueCapacity);
+
+    int server = socket(AF_UNIX, SOCK_STREAM, 0);
+    struct sockaddr_un addr;
+    memset(&addr, 0, sizeof(addr));
+    addr.sun_family = AF_UNIX;
+    strncpy(addr.sun_path, socketPath.c_str(), sizeof(addr.sun_path) - 1);
+    unlink(socketPath.c_str());
+    if (server < 0 || bind(server, (struct sockaddr *) &addr, sizeof(addr)) < 0 || listen(server, 16) < 0)
+    {
+        perror("[DAEMON] Can not listen");
+        return 1;
+    }
+    std::cout << "[DAEMON] Listening on " << socketPath << std::endl;
+    // clients waiting for their analysis
+    std::mutex pendingMutex;
+    std::condition_variable pendingDone;
+    int pending = 0;
+    bool running = true;
+    while (running)
+    {
+        int client = accept(server, NULL, NULL);
+        if (client < 0)
+            continue;
+        std::istringstream command(readLine(client));
+        std::string name, folder;
+        int maxFrames = -1;
+        command >> name >> folder >> maxFrames;
+        if (name == "analyse" && !folder.empty())
+        {
+            std::cout << "[ANALYSIS] " << folder << std::endl;
+            std::shared_ptr<std::future<int>> frames(new std::future<int>(
+                scheduler.submit(folder + "/video.mp4", folder, maxFrames > 0 ? maxFrames : -1)));
+            {
+                std::lock_guard<std::mutex> lock(pendingMutex);
+                pending++;
+            }
+            // the reply is sent when the video is analysed, meanwhile other clients are accepted
+            std::thread([client, frames, &pendingMutex, &pendingDone, &pending] {
+                try
+                {
+                    reply(client, "ok " + std::to_string(frames->get()));
+                }
+                catch (const std::exception &e)
+                {
+                    reply(client, std::string("error ") + e.what());
+                }
+                std::lock_guard<std::mutex> lock(pendingMutex);
+                pending--;
+                pendingDone.notify_all();
+            }).detach();
+        }
+        else if (name == "ping")
+            reply(client, "pong");
+        else if (name == "quit")
+        {
+            reply(client, "bye");
+            running = false;
+        }
+        else
+            reply(client, "error unknown command");
+    }
+    close(server);
+    unlink(socketPath.c_str());
+    std::unique_lock<std::mutex> lock(pendingMutex);
+    pendingDone.wait(lock, [&pending] { return pending == 0; });
+    return 0;
+}
+
+int main(int argc, char **argv)
+{
+	std::cout << "Starting XNECT" << argc << std::endl;
+	// Check if image path is given
+	if (argc <= 1) {
+		std::cout << "Please give the image path (example: ./XNECT <path_to_video> [<frames>])" << std::endl;
+		std::cout << "or run it as daemon (example: XNECT_SLOTS=2 ./XNECT --daemon /tmp/xnect.sock)" << std::endl;
+		return 1;
+	}
+	if (argc == 3 && std::string(argv[1]) == "--daemon") {
+		return serve(argv[2]);
+	}
+	videoFilePath = argv[1];
+	std::cout << "Working dir: " << videoFilePath << std::endl;
+
+    // Check if only a certain number of frames should be analysed (e.g. for a preview)
+	int num_frames = -1;
+	if(argc == 3 && atoi(argv[2]) > 0) {
+		std::cout << "Analysing first " << argv[2] << " frames." << std::endl;
+		num_frames = atoi(argv[2]);
+	}
+	XNECT xnect;
+	// Analyse the video in xnect and save joint and raw joint positions
+	analyseFolder(videoFilePath, xnect, num_frames);
+
+	return 0;
+}
@@ -0,0 +1,147 @@
+"""
+MOCK DAEMON : Stand-in for ./XNECT on machines without a gpu or without the XNECT sources, for tests of the whole
+pipeline. It speaks the protocol of the daemon (see xnect_client.py) and writes synthetic outputs with one row per
+person and frame, like XNECT does:
+
+    XNECT_DAEMON=/tmp/xnect.sock XNECT_COMMAND="python3 mock_daemon.py" flask run --port 8081
+
+Without --daemon, it analyses one folder like ./XNECT <folder>. Like the daemon, it analyses up to XNECT_SLOTS videos
+at the same time.
+"""
+import argparse
+import math
+import os
+import socket
+import threading
+import time
+
+import cv2
+
+JOINTS_2D = 14
+JOINTS_3D = 21
+
+
+def count_frames(video):
+    """
+    :return: number of frames of a video
+    """
+    cap = cv2.VideoCapture(video)
+    if not cap.isOpened():
+        raise IOError("Can not open Video file")
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return frames
+
+
+def write_outputs(folder, frames, people):
+    """
+    write raw2D.txt, raw3D.txt and IK3D.txt: frame, person and the joint positions (people walking in circles)
+    """
+    files = {name: open(os.path.join(folder, name), "w") for name in ["raw2D.txt", "raw3D.txt", "IK3D.txt"]}
+    try:
+        for frame in range(frames):
+            for person in range(people):
+                x, z = 1000.0 * person + 500 * math.cos(frame * 0.02), 4000 + 500 * math.sin(frame * 0.02)
+                joints = [(x + 50 * (j % 3), -800 + 100 * j, z) for j in range(JOINTS_3D)]
+                row_3d = " ".join("%g" % value for joint in joints for value in joint)
+                row_2d = " ".join("%g" % (500 + value / 4) for joint in joints[:JOINTS_2D] for value in joint[:2])
+                files["raw2D.txt"].write("%d %d %s\n" % (frame, person, row_2d))
+                files["raw3D.txt"].write("%d %d %s\n" % (frame, person, row_3d))
+                files["IK3D.txt"].write("%d %d %s\n" % (frame, person, row_3d))
+    finally:
+        for file in files.values():
+            file.close()
+
+
+def analyse(folder, people, seconds_per_frame, max_frames=None):
+    """
+    :param max_frames: analyse only the first frames, None analyses the whole video
+    :return: number of analysed frames
+    """
+    frames = count_frames(os.path.join(folder, "video.mp4"))
+    if max_frames:
+        frames = min(frames, max_frames)
+    time.sleep(frames * seconds_per_frame)
+    write_outputs(folder, frames, people)
+    return frames
+
+
+def reply(client, message):
+    with client:
+        client.sendall(message.encode() + b"\n")
+
+
+def answer_analyse(client, folder, max_frames, people, seconds_per_frame, slots):
+    """
+    analyse a folder in a slot and answer the client
+    """
+    with slots:
+        try:
+            message = "ok %d" % analyse(folder, people, seconds_per_frame, max_frames)
+        except Exception as e:
+            message = "error %s" % str(e).replace("\n", " ")
+    reply(client, message)
+
+
+def serve(socket_path, people, seconds_per_frame, load_seconds, slots):
+    """
+    answer the commands of the daemon protocol until "quit"
+    """
+    # like XNECT loading its networks
+    time.sleep(load_seconds)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(16)
+    print("[DAEMON] Listening on %s" % socket_path, flush=True)
+    slots = threading.Semaphore(slots)
+    analyses = []
+    running = True
+    while running:
+        client, _ = server.accept()
+        with client.makefile() as file:
+            line = file.readline().split()
+        if len(line) in (2, 3) and line[0] == "analyse":
+            max_frames = int(line[2]) if len(line) == 3 and line[2].isdigit() else None
+            analysis = threading.Thread(target=answer_analyse,
+                                        args=(client, line[1], max_frames, people, seconds_per_frame, slots))
+            analysis.start()
+            analyses = [running_analysis for running_analysis in analyses if running_analysis.is_alive()]
+            analyses.append(analysis)
+        elif line == ["ping"]:
+            reply(client, "pong")
+        elif line == ["quit"]:
+            reply(client, "bye")
+            running = False
+        else:
+            reply(client, "error unknown command")
+    server.close()
+    os.remove(socket_path)
+    for analysis in analyses:
+        analysis.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock of the XNECT daemon")
+    parser.add_argument("folder", nargs="?", help="analyse one folder and exit")
+    parser.add_argument("frames", nargs="?", type=int, help="analyse only the first frames of the video")
+    parser.add_argument("--daemon", metavar="SOCKET", help="serve the daemon protocol on this unix socket")
+    parser.add_argument("--people", type=int, default=int(os.getenv("MOCK_PEOPLE", 2)))
+    parser.add_argument("--seconds-per-frame", type=float, default=float(os.getenv("MOCK_SECONDS_PER_FRAME", 0)))
+    parser.add_argument("--load-seconds", type=float, default=float(os.getenv("MOCK_LOAD_SECONDS", 0)),
+                        help="time to load the networks")
+    parser.add_argument("--slots", type=int, default=int(os.getenv("XNECT_SLOTS", 2)),
+                        help="videos analysed at the same time")
+    args = parser.parse_args()
+    if args.daemon:
+        serve(args.daemon, args.people, args.seconds_per_frame, args.load_seconds, max(1, args.slots))
+    elif args.folder:
+        time.sleep(args.load_seconds)
+        analyse(args.folder, args.people, args.seconds_per_frame, args.frames)
+    else:
+        parser.error("give a folder or --daemon <socket>")
+
+
+if __name__ == "__main__":
+    main()
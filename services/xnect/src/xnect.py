@@ -1,16 +1,34 @@
+import atexit
+import json
 import os
+import shlex
+import shutil
+import threading
 from ctypes import *
 import cv2
 import pathlib
 import subprocess
 from flask import Flask, request, jsonify, send_from_directory
 
+from xnect_client import DaemonError, XnectDaemon
+
 app = Flask(__name__)
 
 UPLOAD_FOLDER = "/xnect/videos/"
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['FINISHED'] = False
+# False while a video is analysed, True when its outputs are complete
 my_status = {}
+# written into the folder of a video when its outputs are complete, so a restarted api still knows the video
+FINISHED_FILE = "finished.json"
+# the status of a video is checked and set at once, two requests of the same video do not both start XNECT
+status_lock = threading.Lock()
+# command of XNECT, e.g. "python3 mock_daemon.py" without a gpu
+XNECT_COMMAND = shlex.split(os.getenv("XNECT_COMMAND", "./XNECT"))
+# with a socket path, XNECT runs as daemon and loads its networks once instead of for every video
+XNECT_DAEMON = os.getenv("XNECT_DAEMON")
+daemon = XnectDaemon(XNECT_DAEMON, XNECT_COMMAND) if XNECT_DAEMON else None
+if daemon is not None:
+    atexit.register(daemon.stop)
 
 
 class InvalidUsage(Exception):
@@ -28,6 +46,33 @@ class InvalidUsage(Exception):
         return rv
 
 
+def job_status(id):
+    """
+    :param id: id of the video
+    :return: True if the outputs are complete, False while the video is analysed, None if it is unknown
+    """
+    if os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], str(id), FINISHED_FILE)):
+        return True
+    return my_status.get(str(id))
+
+
+def set_finished(id, folder, frames=None):
+    """
+    mark the outputs of a video as complete
+    """
+    with open(os.path.join(folder, FINISHED_FILE), "w") as file:
+        json.dump({"frames": frames}, file)
+    my_status[str(id)] = True
+
+
+def set_failed(id, folder):
+    """
+    forget a video whose analysis failed, the partial outputs are removed and a retry analyses it again
+    """
+    shutil.rmtree(folder, ignore_errors=True)
+    my_status.pop(str(id), None)
+
+
 # redirect
 @app.route("/")
 def status():
@@ -38,50 +83,59 @@ def status():
     return jsonify({"message": "XNECT running."})
 
 
-@app.route("/finished")
-def finished():
-    """
-    check if latest job is finished
-    :return:
-    """
-    return jsonify({"finished": app.config['FINISHED']})
-
-
-@app.route("/<int:id>", methods=['GET', 'POST'])
+@app.route("/<id>", methods=['GET', 'POST'])
 def analyse(id):
     """
-    analyse a video with given id and a video
+    analyse a video with given id and a video. With the form field "frames", only the first frames are analysed
     """
     if request.method == 'POST':
         print(request.files)
-        app.config['FINISHED'] = False
         if 'video' not in request.files:
             print("NO VIDEO")
             return jsonify({"message": "bad request"}), 400
         elif request.files['video'].mimetype != "video/mp4":
             print("WRONG MIMETYPE")
             return jsonify({"message": "bad request"}), 400
+        frames = request.form.get("frames", type=int)
         folder = os.path.join(app.config['UPLOAD_FOLDER'], str(id))
-        if os.path.isdir(folder):
-            return jsonify({"message": "conflict"}), 409
-        my_status[str(id)] = False
-        os.makedirs(folder)
-        file = request.files['video']
-        filename = os.path.join(folder, "video.mp4")
-        file.save(filename)
-        print(folder)
+        with status_lock:
+            status = job_status(id)
+            if status is not None:
+                # analysed before or still running, the client waits for GET /<id> and fetches the outputs
+                return jsonify({"message": "conflict", "status": status}), 409
+            # outputs of an attempt that crashed or was interrupted by a restart are not complete
+            if os.path.isdir(folder):
+                shutil.rmtree(folder)
+            my_status[str(id)] = False
+            os.makedirs(folder)
         try:
-            # run a subprocess in C++
-            subprocess.run("./XNECT " + folder, shell=True, check=True)
-            my_status[str(id)] = True
-            app.config['FINISHED'] = True
-            return jsonify({"message": "success"})
+            request.files['video'].save(os.path.join(folder, "video.mp4"))
+            print(folder)
+            if daemon is not None:
+                analysed = daemon.analyse(folder, frames)
+            else:
+                # run a subprocess in C++
+                subprocess.run(XNECT_COMMAND + [folder] + ([str(frames)] if frames else []), check=True)
+                analysed = None
+        except DaemonError as e:
+            print(e)
+            set_failed(id, folder)
+            return jsonify({"message": str(e)}), 400
         except subprocess.CalledProcessError as e:
+            set_failed(id, folder)
             return jsonify({"code": e.returncode}), 400
+        except Exception:
+            set_failed(id, folder)
+            raise
+        set_finished(id, folder, analysed)
+        if daemon is not None:
+            return jsonify({"message": "success", "frames": analysed})
+        return jsonify({"message": "success"})
 
     else:
-        if str(id) in my_status:
-            return jsonify({"status": my_status[str(id)]})
+        status = job_status(id)
+        if status is not None:
+            return jsonify({"status": status})
         return jsonify({"message": "not found"}), 404
 
 
@@ -96,7 +150,7 @@ def get_file(id, filename):
     return send_from_directory(directory=folder, filename=filename)
 
 
-@app.route("/<int:id>/ik3d", methods=['GET'])
+@app.route("/<id>/ik3d", methods=['GET'])
 def get_ik3d(id):
     """
     Get IK3D File
@@ -106,7 +160,7 @@ def get_ik3d(id):
     return get_file(id, "IK3D.txt")
 
 
-@app.route("/<int:id>/ik2d", methods=['GET'])
+@app.route("/<id>/ik2d", methods=['GET'])
 def get_ik2d(id):
     """
     Get IK2D File
@@ -116,7 +170,7 @@ def get_ik2d(id):
     return get_file(id, "IK2D.txt")
 
 
-@app.route("/<int:id>/raw3d", methods=['GET'])
+@app.route("/<id>/raw3d", methods=['GET'])
 def get_raw3d(id):
     """
     Get RAW3D File
@@ -126,7 +180,7 @@ def get_raw3d(id):
     return get_file(id, "raw3D.txt")
 
 
-@app.route("/<int:id>/raw2d", methods=['GET'])
+@app.route("/<id>/raw2d", methods=['GET'])
 def get_raw2d(id):
     """
     Get RAW2D File
@@ -0,0 +1,115 @@
+"""
+XNECT CLIENT : Client of the XNECT daemon (./XNECT --daemon <socket>). The daemon loads the networks and initializes
+CUDA once and then analyses the videos, instead of starting ./XNECT for every video. XNECT_SLOTS videos are analysed
+at the same time (see InferenceScheduler.hpp), so several clients can wait for their analysis at once.
+Every command is one line over a new connection to the unix socket of the daemon:
+"analyse <folder> [<frames>]" is answered with "ok <frames>" or "error <message>" when the analysis is finished,
+"ping" with "pong" and "quit" with "bye". With <frames>, only the first frames of the video are analysed.
+"""
+import os
+import socket
+import subprocess
+import threading
+import time
+
+
+class DaemonError(Exception):
+    """
+    the daemon is not reachable or could not analyse a video
+    """
+
+
+class XnectDaemon(object):
+    """
+    starts the daemon on demand and sends commands to it
+    """
+    def __init__(self, socket_path, command=("./XNECT",)):
+        """
+        :param socket_path: path of the unix socket
+        :param command: command of the daemon, "--daemon <socket_path>" is appended (e.g. python3 mock_daemon.py)
+        """
+        self.socket_path = socket_path
+        self.command = list(command)
+        self.process = None
+        # concurrent requests start the daemon only once
+        self.lock = threading.Lock()
+
+    def request(self, line, timeout=None):
+        """
+        send a command and wait for the reply
+        :param line: command without newline
+        :param timeout: seconds to wait for the reply, None waits until the daemon answers
+        :return: the reply without newline
+        """
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.settimeout(timeout)
+                client.connect(self.socket_path)
+                client.sendall(line.encode() + b"\n")
+                reply = b""
+                while not reply.endswith(b"\n"):
+                    data = client.recv(4096)
+                    if not data:
+                        break
+                    reply += data
+        except OSError as e:
+            raise DaemonError("XNECT daemon not reachable: %s" % e)
+        if not reply:
+            raise DaemonError("XNECT daemon closed the connection")
+        return reply.decode().strip()
+
+    def ping(self):
+        """
+        :return: if the daemon answers
+        """
+        try:
+            return self.request("ping", timeout=5) == "pong"
+        except DaemonError:
+            return False
+
+    def start(self, timeout=600):
+        """
+        start the daemon, unless it is already running (e.g. started by an earlier process of the web server)
+        :param timeout: seconds to wait until the networks are loaded
+        """
+        if self.ping():
+            return
+        print("Starting XNECT daemon: %s" % " ".join(self.command))
+        self.process = subprocess.Popen(self.command + ["--daemon", self.socket_path])
+        end = time.time() + timeout
+        while time.time() < end:
+            if self.process.poll() is not None:
+                raise DaemonError("XNECT daemon exited with code %d" % self.process.returncode)
+            if os.path.exists(self.socket_path) and self.ping():
+                return
+            time.sleep(0.5)
+        raise DaemonError("XNECT daemon did not start within %d seconds" % timeout)
+
+    def analyse(self, folder, frames=None):
+        """
+        analyse <folder>/video.mp4, the outputs are saved into the folder. The daemon is (re)started if needed.
+        :param folder: working dir of the video, without whitespace
+        :param frames: analyse only the first frames, None analyses the whole video
+        :return: number of analysed frames
+        """
+        if len(folder.split()) != 1:
+            raise DaemonError("Invalid folder: %r" % folder)
+        if not self.ping():
+            with self.lock:
+                self.start()
+        reply = self.request("analyse %s %d" % (folder, frames) if frames else "analyse %s" % folder)
+        if not reply.startswith("ok "):
+            raise DaemonError(reply)
+        return int(reply.split()[1])
+
+    def stop(self):
+        """
+        stop the daemon, if it was started by this client
+        """
+        if self.process is None or self.process.poll() is not None:
+            return
+        try:
+            self.request("quit", timeout=5)
+            self.process.wait(30)
+        except (DaemonError, subprocess.TimeoutExpired):
+            self.process.kill()
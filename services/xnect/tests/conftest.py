@@ -0,0 +1,8 @@
+"""
+The api (src/xnect.py) is tested without XNECT and without a gpu: XNECT is replaced by a python script writing
+outputs.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,93 @@
+import io
+import os
+import subprocess
+import threading
+import time
+
+import pytest
+
+import xnect
+
+OUTPUTS = ["raw2D.txt", "raw3D.txt", "IK3D.txt"]
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """
+    :return: test client of the api. XNECT is replaced by a function writing one row into every output, it fails for
+    the video "crash" and waits until the event "release" of the client is set
+    """
+    release = threading.Event()
+    release.set()
+
+    def run(command, check=False):
+        folder = command[len(xnect.XNECT_COMMAND)]
+        release.wait(5)
+        if os.path.basename(folder) == "crash":
+            raise subprocess.CalledProcessError(3, command)
+        for name in OUTPUTS:
+            with open(os.path.join(folder, name), "w") as file:
+                file.write("0 0 1 2\n")
+
+    monkeypatch.setattr(xnect.subprocess, "run", run)
+    monkeypatch.setattr(xnect, "daemon", None)
+    monkeypatch.setitem(xnect.app.config, "UPLOAD_FOLDER", str(tmp_path))
+    monkeypatch.setattr(xnect, "my_status", {})
+    client = xnect.app.test_client()
+    client.release = release
+    return client
+
+
+def post(api, id):
+    return api.post("/%s" % id, data={"video": (io.BytesIO(b"video"), "video.mp4", "video/mp4")},
+                    content_type="multipart/form-data")
+
+
+def test_analysed_video_is_a_conflict(api):
+    assert post(api, 1).status_code == 200
+    response = post(api, 1)
+    assert response.status_code == 409
+    assert response.get_json() == {"message": "conflict", "status": True}
+    assert api.get("/1").get_json() == {"status": True}
+    assert api.get("/1/ik3d").data == b"0 0 1 2\n"
+
+
+def test_failed_analysis_can_be_retried(api, tmp_path):
+    assert post(api, "crash").status_code == 400
+    assert not os.path.exists(str(tmp_path / "crash"))
+    assert api.get("/crash").status_code == 404
+    assert post(api, "crash").status_code == 400
+
+
+def test_outputs_of_an_interrupted_attempt_are_replaced(api, tmp_path):
+    # the api was restarted while XNECT was writing the outputs, there is no completion marker
+    os.makedirs(str(tmp_path / "1"))
+    (tmp_path / "1" / "raw2D.txt").write_text("partial")
+    assert api.get("/1").status_code == 404
+    assert post(api, 1).status_code == 200
+    assert (tmp_path / "1" / "raw2D.txt").read_text() == "0 0 1 2\n"
+
+
+def test_finished_video_is_known_after_a_restart(api, monkeypatch):
+    assert post(api, 1).status_code == 200
+    monkeypatch.setattr(xnect, "my_status", {})
+    assert api.get("/1").get_json() == {"status": True}
+    assert post(api, 1).status_code == 409
+
+
+def test_concurrent_post_waits_for_the_running_analysis(api):
+    api.release.clear()
+    first = []
+    thread = threading.Thread(target=lambda: first.append(post(api, 2).status_code))
+    thread.start()
+    while xnect.my_status.get("2") is None:
+        time.sleep(0.01)
+    response = post(api, 2)
+    assert response.status_code == 409 and response.get_json()["status"] is False
+    assert api.get("/2").get_json() == {"status": False}
+    api.release.set()
+    thread.join()
+    assert first == [200]
+    assert api.get("/2").get_json() == {"status": True}
+    # the status of one video does not tell anything about another one
+    assert api.get("/3").status_code == 404